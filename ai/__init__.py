@@ -1,2 +1,3 @@
 from .manager import AIManager
 from .sub_agent import SubAgent
+from .agent_registry import AgentRegistry
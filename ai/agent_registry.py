@@ -0,0 +1,170 @@
+import os
+import threading
+from typing import Dict, Any, Optional
+
+from .sub_agent import SubAgent
+from .response_cache import get_response_cache
+import metrics
+
+
+class AgentRegistry:
+    """โหลด AIAgent และข้อมูลเทรนจากฐานข้อมูลแล้วสร้าง SubAgent ไว้ล่วงหน้าให้ AIManager
+
+    load_all() อ่าน agent ทั้งหมดพร้อมข้อมูลเทรนที่ active ด้วย query เดียวตอนเริ่มระบบ
+    agent ทุกตัวเลือกได้ผ่าน pre-router/LLM แต่เก็บ SubAgent ในหน่วยความจำไม่เกิน max_loaded ตัว
+    ตัวที่ไม่ได้ใช้นานที่สุดจะถูกเอาออกและโหลดใหม่จากฐานข้อมูลเมื่อถูกเลือกอีกครั้ง
+    การเปลี่ยนแปลงผ่าน agent_created / prompt_updated / training_data_added มีผลเฉพาะใน process นี้
+    """
+
+    def __init__(self, manager, app, max_loaded: int = 500):
+        self.manager = manager
+        self.app = app
+        self.max_loaded = max(1, max_loaded)
+        self.loads = 0
+        self.evictions = 0
+        self._managed = set()
+        self._lock = threading.RLock()
+        manager.agent_loader = self.get
+        
+        # จำนวน agent และการโหลด/เอาออกใน /metrics
+        agents = metrics.REGISTRY.gauge('agent_registry_agents', 'จำนวน AI Agent แยกตามสถานะ', ('state',))
+        agents.set_function(lambda: len(self._managed), state='known')
+        agents.set_function(lambda: self.stats()['loaded'], state='loaded')
+        events = metrics.REGISTRY.counter(
+            'agent_registry_events_total', 'จำนวนการโหลด agent ตามต้องการและการเอาออกจากหน่วยความจำ', ('event',)
+        )
+        events.set_function(lambda: self.loads, event='load')
+        events.set_function(lambda: self.evictions, event='eviction')
+
+    @classmethod
+    def from_env(cls, manager, app) -> 'AgentRegistry':
+        """สร้างจากค่า AGENT_REGISTRY_* ใน environment"""
+        return cls(manager, app, max_loaded=int(os.getenv('AGENT_REGISTRY_MAX_LOADED', 500)))
+
+    @staticmethod
+    def _query():
+        """AIAgent พร้อมข้อมูลเทรนที่ active (JOIN ใน query เดียว ไม่ต้อง query ทีละ agent)"""
+        from sqlalchemy import and_
+        from sqlalchemy.orm import contains_eager
+        from models import AIAgent, TrainingData
+        return AIAgent.query\
+            .outerjoin(TrainingData, and_(TrainingData.agent_id == AIAgent.id, TrainingData.is_active == True))\
+            .options(contains_eager(AIAgent.training_data))\
+            .filter(AIAgent.type == 'sub_agent')\
+            .order_by(AIAgent.id, TrainingData.id)
+
+    @staticmethod
+    def _build(record) -> SubAgent:
+        """สร้าง SubAgent จากแถว AIAgent"""
+        agent = SubAgent(
+            str(record.id),
+            record.name,
+            prompt_template=record.prompt_template or None,
+            description=record.description or ''
+        )
+        agent.rate_limit_per_minute = record.rate_limit_per_minute
+        agent.rate_limit_burst = record.rate_limit_burst
+        agent.load_training_data([
+            {'input': data.input_text, 'output': data.expected_output}
+            for data in record.training_data
+            if data.is_active is not False
+        ])
+        return agent
+
+    def load_all(self) -> int:
+        """โหลด agent ทั้งหมดจากฐานข้อมูล คืนค่าจำนวน agent ที่พบ"""
+        try:
+            with self.app.app_context(), metrics.stage('agent_registry_load'):
+                records = self._query().all()
+                with self._lock:
+                    for count, record in enumerate(records):
+                        agent_id = str(record.id)
+                        self._managed.add(agent_id)
+                        if count < self.max_loaded:
+                            self._attach(agent_id, self._build(record))
+                        else:
+                            # agent ที่เกินจำนวนให้เลือกได้ แต่สร้าง SubAgent เมื่อถูกใช้ครั้งแรก
+                            texts = [record.description or '']
+                            texts.extend(data.input_text for data in record.training_data)
+                            self.manager.declare_agent(agent_id, texts)
+            return len(records)
+        except Exception as e:
+            print(f"เกิดข้อผิดพลาดในการโหลด AI Agent: {str(e)}")
+            return 0
+
+    def get(self, agent_id) -> Optional[SubAgent]:
+        """SubAgent ตาม id โหลดจากฐานข้อมูลถ้ายังไม่อยู่ในหน่วยความจำ (ใช้เป็น agent_loader ของ AIManager)"""
+        agent_id = str(agent_id)
+        if agent_id not in self._managed:
+            return None
+        with self._lock:
+            agent = self.manager.sub_agents.get(agent_id)
+            if agent is not None:
+                return agent
+            from models import AIAgent
+            with self.app.app_context(), metrics.stage('agent_registry_load'):
+                # ใช้ .all() เพราะ LIMIT จะตัดแถวของข้อมูลเทรนที่ JOIN มา
+                records = self._query().filter(AIAgent.id == int(agent_id)).all()
+                if not records:
+                    return None
+                agent = self._build(records[0])
+            self.loads += 1
+            self._attach(agent_id, agent)
+            return agent
+
+    def _attach(self, agent_id: str, agent: SubAgent):
+        """ลงทะเบียน SubAgent กับ AIManager และเอาตัวที่ไม่ได้ใช้นานที่สุดออกถ้าเกิน max_loaded"""
+        self.manager.register_sub_agent(agent_id, agent)
+        loaded = [loaded_id for loaded_id in list(self.manager.sub_agents) if loaded_id in self._managed]
+        for loaded_id in loaded[:max(0, len(loaded) - self.max_loaded)]:
+            self.manager.release_sub_agent(loaded_id)
+            self.evictions += 1
+
+    def _invalidate(self, agent_id: str):
+        """ล้างคำตอบใน cache ของ agent ที่ไม่ได้อยู่ในหน่วยความจำ"""
+        if os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true':
+            get_response_cache().invalidate(agent_id)
+
+    def agent_created(self, record):
+        """agent ใหม่ถูกสร้างในฐานข้อมูล"""
+        if record.type not in (None, 'sub_agent'):
+            return
+        agent_id = str(record.id)
+        with self._lock:
+            self._managed.add(agent_id)
+            self._attach(agent_id, self._build(record))
+
+    def prompt_updated(self, record):
+        """prompt template ของ agent ในฐานข้อมูลเปลี่ยน"""
+        agent_id = str(record.id)
+        agent = self.manager.sub_agents.get(agent_id)
+        if agent is None:
+            self._invalidate(agent_id)
+            return
+        agent.update_prompt_template(record.prompt_template or agent._default_prompt_template())
+
+    def limits_updated(self, record):
+        """ขีดจำกัดของ agent ในฐานข้อมูลเปลี่ยน (agent ที่ไม่อยู่ในหน่วยความจำจะได้ค่าใหม่ตอนโหลด)"""
+        agent = self.manager.sub_agents.get(str(record.id))
+        if agent is not None:
+            agent.rate_limit_per_minute = record.rate_limit_per_minute
+            agent.rate_limit_burst = record.rate_limit_burst
+
+    def training_data_added(self, training):
+        """มีข้อมูลเทรนใหม่ของ agent ในฐานข้อมูล"""
+        agent_id = str(training.agent_id)
+        agent = self.manager.sub_agents.get(agent_id)
+        if agent is None:
+            # โหลดครั้งหน้าจะได้ข้อมูลนี้จากฐานข้อมูล ตอนนี้แค่ให้ pre-router รู้จัก
+            self.manager.index_agent_text(agent_id, training.input_text)
+            self._invalidate(agent_id)
+            return
+        agent.add_training_data(training.input_text, training.expected_output)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'agents': len(self._managed),
+            'loaded': sum(1 for agent_id in list(self.manager.sub_agents) if agent_id in self._managed),
+            'loads': self.loads,
+            'evictions': self.evictions
+        }
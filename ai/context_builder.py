@@ -0,0 +1,160 @@
+import os
+import json
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+from .tokens import estimate_tokens, truncate_to_tokens
+
+# สัดส่วนงบ token ของแต่ละส่วน (หลังหักส่วนคำสั่งใน template) งบที่ส่วนใดใช้ไม่หมดจะยกให้ส่วนถัดไป
+INPUT_SHARE = 0.3
+FIELDS_SHARE = 0.35
+# งบสูงสุดของประวัติการสนทนา (สัดส่วนของงบที่เหลือหลังหัก input) ส่วนที่เกินตัดจากต้น (เก่าสุด) ออก
+HISTORY_SHARE = 0.3
+
+# key ที่ไม่มีประโยชน์ต่อการตอบและไม่ควรส่งให้ LLM
+DEFAULT_DROP_KEYS = ('signature', 'secret', 'secret_key', 'token', 'access_token', 'replyToken', 'headers', 'raw')
+
+TRUNCATED_MARKER = ' …(ตัดออก ~{tokens} tokens)'
+
+
+class ContextBuilder:
+    """ประกอบ input และ context ของ prompt ภายใต้งบ token
+
+    แบ่งงบให้ input, ข้อมูลเพิ่มเติม (field ของ data) และตัวอย่าง few-shot
+    ตัด field ที่ยาวเกิน max_field_tokens, ทิ้ง key ที่ไม่มีประโยชน์/ว่าง
+    และรายงานจำนวน token ที่ประหยัดได้เทียบกับการใส่ข้อมูลทั้งหมด
+    """
+
+    def __init__(self, max_tokens: int = 3000, max_field_tokens: int = 400, drop_keys=DEFAULT_DROP_KEYS):
+        self.max_tokens = max_tokens
+        self.max_field_tokens = max_field_tokens
+        self.drop_keys = set(drop_keys)
+
+    @classmethod
+    def from_env(cls) -> 'ContextBuilder':
+        """สร้างจากค่า PROMPT_TOKEN_BUDGET, PROMPT_FIELD_MAX_TOKENS และ PROMPT_DROP_KEYS"""
+        drop_keys = os.getenv('PROMPT_DROP_KEYS')
+        return cls(
+            max_tokens=int(os.getenv('PROMPT_TOKEN_BUDGET', 3000)),
+            max_field_tokens=int(os.getenv('PROMPT_FIELD_MAX_TOKENS', 400)),
+            drop_keys=[k.strip() for k in drop_keys.split(',') if k.strip()] if drop_keys else DEFAULT_DROP_KEYS
+        )
+
+    @staticmethod
+    def _format_value(value: Any) -> str:
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+        return str(value)
+
+    def fit_text(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """ตัดข้อความให้อยู่ในงบ token คืนค่า (ข้อความ, จำนวน token ที่ตัดออก)"""
+        tokens = estimate_tokens(text)
+        if tokens <= max_tokens:
+            return text, 0
+        marker = TRUNCATED_MARKER.format(tokens=tokens - max_tokens)
+        fitted = truncate_to_tokens(text, max(0, max_tokens - estimate_tokens(marker))) + marker
+        return fitted, tokens - estimate_tokens(fitted)
+
+    def _compress_value(self, value: Any, max_tokens: int) -> str:
+        """ย่อค่าของ field ให้อยู่ในงบ (list เก็บรายการแรกๆ ไว้ทั้งรายการ ที่เหลือบอกเป็นจำนวน)"""
+        text = self._format_value(value)
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        if isinstance(value, list):
+            kept, used = [], 0
+            for item in value:
+                cost = estimate_tokens(self._format_value(item)) + 1
+                if used + cost > max_tokens * 0.8:
+                    break
+                kept.append(item)
+                used += cost
+            if kept:
+                return f"{self._format_value(kept)} …(+{len(value) - len(kept)} รายการ)"
+        return self.fit_text(text, max_tokens)[0]
+
+    def _is_low_value(self, key: str, value: Any) -> bool:
+        return key in self.drop_keys or value is None or value == '' or value == [] or value == {}
+
+    def fit_recent(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """เหมือน fit_text แต่เก็บส่วนท้าย (ล่าสุด) ของข้อความไว้ คืนค่า (ข้อความ, จำนวน token ที่ตัดออก)"""
+        tokens = estimate_tokens(text)
+        if tokens <= max_tokens:
+            return text, 0
+        marker = TRUNCATED_MARKER.format(tokens=tokens - max_tokens).strip() + '\n'
+        kept = truncate_to_tokens(text[::-1], max(0, max_tokens - estimate_tokens(marker)))[::-1]
+        fitted = marker + kept
+        return fitted, tokens - estimate_tokens(fitted)
+
+    def build(self, template: str, data: Dict[str, Any],
+              examples: Optional[Callable[[int], List[Dict[str, Any]]]] = None,
+              history: str = '') -> Dict[str, Any]:
+        """สร้าง input และ context สำหรับ template
+
+        examples(budget) คืนค่าตัวอย่าง few-shot ที่รวมกันไม่เกิน budget tokens
+        history คือประวัติการสนทนาของ session (ใส่ไว้ต้น context)
+        คืนค่า {'input', 'context', 'stats'} โดย stats มี prompt_tokens, tokens_saved,
+        history_tokens, dropped_keys และ truncated_keys
+        """
+        template_tokens = estimate_tokens(template)
+        budget = max(0, self.max_tokens - template_tokens)
+
+        # input ของผู้ใช้
+        raw_input = self._format_value(data.get('input', ''))
+        input_text, _ = self.fit_text(raw_input, int(budget * INPUT_SHARE))
+        input_tokens = estimate_tokens(input_text)
+        raw_tokens = template_tokens + estimate_tokens(raw_input)
+        remaining = budget - input_tokens
+
+        # ประวัติการสนทนา
+        context_parts, dropped, truncated = [], [], []
+        history_tokens = 0
+        if history:
+            raw_tokens += estimate_tokens(history) + 1
+            history_text, _ = self.fit_recent(history, int(remaining * HISTORY_SHARE / (1 - INPUT_SHARE)))
+            context_parts.append(f"ประวัติการสนทนา:\n{history_text}\n")
+            history_tokens = estimate_tokens(context_parts[-1]) + 1
+            remaining -= history_tokens
+
+        # field อื่นๆ ของ data
+        fields_budget = int(remaining * FIELDS_SHARE / (1 - INPUT_SHARE))
+        fields_tokens = 0
+        for key, value in data.items():
+            if key == 'input':
+                continue
+            raw_line = f"{key}: {self._format_value(value)}"
+            raw_tokens += estimate_tokens(raw_line) + 1
+            if self._is_low_value(key, value):
+                dropped.append(key)
+                continue
+            line = f"{key}: {self._compress_value(value, self.max_field_tokens)}"
+            cost = estimate_tokens(line) + 1
+            if fields_tokens + cost > fields_budget:
+                dropped.append(key)
+                continue
+            if line != raw_line:
+                truncated.append(key)
+            context_parts.append(line)
+            fields_tokens += cost
+
+        # ตัวอย่าง few-shot ได้งบที่เหลือทั้งหมด
+        examples_tokens = 0
+        selected = examples(max(0, remaining - fields_tokens)) if examples else []
+        if selected:
+            context_parts.append("\nตัวอย่างการใช้งาน:")
+            for example in selected:
+                context_parts.append(f"Input: {example['input']}")
+                context_parts.append(f"Output: {example['output']}\n")
+                examples_tokens += estimate_tokens(f"Input: {example['input']}\nOutput: {example['output']}\n")
+        raw_tokens += examples_tokens
+
+        prompt_tokens = template_tokens + input_tokens + history_tokens + fields_tokens + examples_tokens
+        return {
+            'input': input_text,
+            'context': "\n".join(context_parts),
+            'stats': {
+                'prompt_tokens': prompt_tokens,
+                'tokens_saved': max(0, raw_tokens - prompt_tokens),
+                'history_tokens': history_tokens,
+                'dropped_keys': dropped,
+                'truncated_keys': truncated
+            }
+        }
@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable
+
+from .tokens import estimate_tokens, truncate_to_tokens
+import metrics
+
+SUMMARY_PROMPT_TEMPLATE = """สรุปบทสนทนาต่อไปนี้ให้สั้นที่สุด เก็บเฉพาะข้อเท็จจริงที่ผู้ใช้ให้ไว้และเรื่องที่ยังค้างอยู่
+
+สรุปเดิม:
+{summary}
+
+บทสนทนาเพิ่มเติม:
+{turns}
+
+สรุปใหม่:"""
+
+# ความยาวของแต่ละคำถามในสรุปแบบ extractive
+SUMMARY_LINE_TOKENS = 60
+
+# จำนวน lock สำหรับแยก append ของแต่ละ session (session ที่ hash ตรงกันใช้ lock เดียวกัน)
+SESSION_LOCK_STRIPES = 64
+
+# จำนวนครั้งที่ append ลองใหม่เมื่อ process อื่นบันทึก session เดียวกันตัดหน้า (ครั้งสุดท้ายบันทึกทับ)
+APPEND_RETRIES = 5
+
+
+def extractive_summary(summary: str, turns: List[Dict[str, str]], max_tokens: int) -> str:
+    """สรุปแบบไม่เรียก LLM: เก็บคำถามของผู้ใช้ (ตัดให้สั้น) ต่อท้ายสรุปเดิม แล้วทิ้งบรรทัดที่เก่าที่สุดจนอยู่ในงบ"""
+    lines = summary.split('\n') if summary else []
+    lines.extend(f"- ผู้ใช้: {truncate_to_tokens(turn['user'], SUMMARY_LINE_TOKENS)}" for turn in turns)
+    while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_to_tokens('\n'.join(lines), max_tokens)
+
+
+def _format_turns(turns: List[Dict[str, str]]) -> str:
+    return '\n'.join(f"ผู้ใช้: {turn['user']}\nผู้ช่วย: {turn['assistant']}" for turn in turns)
+
+
+def llm_summary(summary: str, turns: List[Dict[str, str]], max_tokens: int) -> str:
+    """สรุปด้วย LLM (ใช้ extractive_summary แทนถ้าเรียก LLM ไม่สำเร็จ)"""
+    from . import llm_pool
+    try:
+        chain = llm_pool.get_chain(SUMMARY_PROMPT_TEMPLATE, ['summary', 'turns'])
+        text = llm_pool.run_chain(chain, summary=summary or '-', turns=_format_turns(turns))
+        return truncate_to_tokens(text.strip(), max_tokens)
+    except Exception as e:
+        print(f"เกิดข้อผิดพลาดในการสรุปบทสนทนา: {str(e)}")
+        return extractive_summary(summary, turns, max_tokens)
+
+
+SUMMARIZERS = {
+    'extractive': extractive_summary,
+    'llm': llm_summary
+}
+
+
+class ConversationStore:
+    """ประวัติการสนทนาต่อ session (เช่น LINE userId) สำหรับใส่ใน prompt ของ Sub-agent
+
+    session ที่ใช้ล่าสุด max_sessions รายการอยู่ในหน่วยความจำ (LRU) ทุก session เก็บลง SQLite ด้วย
+    จึงใช้ร่วมกันข้าม process และหลัง restart ได้ session ที่ไม่มีการสนทนานานกว่า ttl วินาทีจะเริ่มใหม่
+    ประวัติของแต่ละ session ไม่เกิน max_tokens: turn ที่เก่ากว่า keep_turns ล่าสุดถูกย่อรวมเป็นสรุป
+    (ไม่เกิน summary_max_tokens) ขนาด prompt จึงไม่โตตามจำนวน turn
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 86400.0, max_tokens: int = 800,
+                 keep_turns: int = 4, summary_max_tokens: int = 200, store_path: Optional[str] = None,
+                 summarizer: Callable[[str, List[Dict[str, str]], int], str] = extractive_summary):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_tokens = max_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.summary_max_tokens = summary_max_tokens
+        self.store_path = store_path
+        self.summarizer = summarizer
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._session_locks = [threading.Lock() for _ in range(SESSION_LOCK_STRIPES)]
+        self._local = threading.local()
+        self._writes = 0
+        if store_path:
+            directory = os.path.dirname(store_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = self._store()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS conversations '
+                '(session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_conversations_updated_at ON conversations (updated_at)')
+
+    @classmethod
+    def from_env(cls) -> 'ConversationStore':
+        return cls(
+            max_sessions=int(os.getenv('CONVERSATION_CACHE_SIZE', 10000)),
+            ttl=float(os.getenv('CONVERSATION_TTL', 86400)),
+            max_tokens=int(os.getenv('CONVERSATION_MAX_TOKENS', 800)),
+            keep_turns=int(os.getenv('CONVERSATION_KEEP_TURNS', 4)),
+            summary_max_tokens=int(os.getenv('CONVERSATION_SUMMARY_MAX_TOKENS', 200)),
+            store_path=os.getenv('CONVERSATION_STORE_PATH', os.path.join('data', 'conversations.db')) or None,
+            summarizer=SUMMARIZERS.get(os.getenv('CONVERSATION_SUMMARIZER', 'extractive'), extractive_summary)
+        )
+
+    def _store(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.store_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {'summary': '', 'turns': [], 'updated_at': 0.0}
+
+    def _put(self, session_id: str, session: Dict[str, Any]):
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """ข้อมูลของ session {'summary', 'turns', 'updated_at'} (session ใหม่หรือหมดอายุได้ค่าว่าง)
+
+        ถ้ามี store จะใช้ข้อมูลในหน่วยความจำก็ต่อเมื่อใหม่อย่างน้อยเท่าแถวใน SQLite (process อื่นอาจบันทึกหลังจากนั้น)
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._sessions.get(session_id)
+            if cached is not None and cached['updated_at'] <= now - self.ttl:
+                del self._sessions[session_id]
+                cached = None
+            if cached is not None and not self.store_path:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return cached
+
+        session = None
+        if self.store_path:
+            # อ่านเฉพาะแถวที่ใหม่กว่าข้อมูลในหน่วยความจำ (ปกติไม่มี จึงเป็นแค่การค้นหา primary key)
+            newer_than = max(cached['updated_at'], now - self.ttl) if cached is not None else now - self.ttl
+            try:
+                row = self._store().execute(
+                    'SELECT data, updated_at FROM conversations WHERE session_id = ? AND updated_at > ?',
+                    (session_id, newer_than)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"เกิดข้อผิดพลาดในการอ่านประวัติการสนทนา: {str(e)}")
+                row = None
+            if row is not None:
+                session = {**json.loads(row[0]), 'updated_at': row[1]}
+        with self._lock:
+            if session is None and cached is not None:
+                if self._sessions.get(session_id) is cached:
+                    self._sessions.move_to_end(session_id)
+                self.hits += 1
+                return cached
+            if session is None:
+                self.misses += 1
+                return self._empty()
+            self.hits += 1
+            current = self._sessions.get(session_id)
+            if current is None or current['updated_at'] <= session['updated_at']:
+                self._put(session_id, session)
+        return session
+
+    def history_text(self, session_id: str) -> str:
+        """ประวัติการสนทนาของ session สำหรับใส่ใน prompt (ค่าว่างถ้ายังไม่มี)"""
+        session = self.get(session_id)
+        parts = []
+        if session['summary']:
+            parts.append(f"สรุปก่อนหน้า:\n{session['summary']}")
+        if session['turns']:
+            parts.append(_format_turns(session['turns']))
+        return '\n'.join(parts)
+
+    def _tokens(self, session: Dict[str, Any]) -> int:
+        return estimate_tokens(session['summary']) + sum(turn['tokens'] for turn in session['turns'])
+
+    def append(self, session_id: str, user: str, assistant: str):
+        """เพิ่ม turn ล่าสุดของ session แล้วย่อ turn เก่าให้ประวัติไม่เกิน max_tokens"""
+        # turn เดียวใช้ได้ไม่เกินครึ่งของงบ (ข้อความยาวมากถูกตัดท้าย)
+        turn_budget = max(1, self.max_tokens // 2)
+        user = truncate_to_tokens(str(user), turn_budget // 2)
+        assistant = truncate_to_tokens(str(assistant), turn_budget - estimate_tokens(user))
+        turn = {'user': user, 'assistant': assistant, 'tokens': estimate_tokens(user) + estimate_tokens(assistant)}
+
+        # อ่าน -> ย่อ -> บันทึก ของ session เดียวกันต้องทำทีละ turn (ไม่เช่นนั้น turn ที่มาพร้อมกันจะหายไปหนึ่ง turn)
+        # lock กันได้เฉพาะใน process นี้ ส่วน process อื่นตรวจด้วย updated_at ตอนบันทึก (ถ้าถูกตัดหน้าจะอ่านใหม่แล้วทำซ้ำ)
+        with self._session_locks[hash(session_id) % SESSION_LOCK_STRIPES]:
+            for attempt in range(APPEND_RETRIES):
+                current = self.get(session_id)
+                session = {
+                    'summary': current['summary'],
+                    'turns': current['turns'] + [turn],
+                    'updated_at': max(time.time(), current['updated_at'] + 1e-6)
+                }
+                if self._tokens(session) > self.max_tokens or len(session['turns']) > self.keep_turns:
+                    self._compact(session)
+                if self._save(session_id, session, current['updated_at'], force=attempt == APPEND_RETRIES - 1):
+                    break
+            with self._lock:
+                self._put(session_id, session)
+
+    def _save(self, session_id: str, session: Dict[str, Any], base_updated_at: float, force: bool = False) -> bool:
+        """บันทึก session ลง SQLite ถ้าแถวในนั้นยังไม่ใหม่กว่า base_updated_at (หรือ force) คืนค่า False ถ้าถูกตัดหน้า"""
+        if not self.store_path:
+            return True
+        data = json.dumps({'summary': session['summary'], 'turns': session['turns']}, ensure_ascii=False)
+        try:
+            conn = self._store()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT updated_at FROM conversations WHERE session_id = ?', (session_id,)
+                ).fetchone()
+                if not force and row is not None and row[0] > base_updated_at and row[0] > time.time() - self.ttl:
+                    conn.execute('ROLLBACK')
+                    return False
+                conn.execute(
+                    'INSERT OR REPLACE INTO conversations (session_id, data, updated_at) VALUES (?, ?, ?)',
+                    (session_id, data, session['updated_at'])
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self.cleanup()
+        except sqlite3.Error as e:
+            print(f"เกิดข้อผิดพลาดในการบันทึกประวัติการสนทนา: {str(e)}")
+        return True
+
+    def _compact(self, session: Dict[str, Any]):
+        """ย่อ turn ที่เก่ากว่า keep_turns (หรือจนกว่าจะอยู่ในงบ) รวมเข้ากับสรุป"""
+        turns = session['turns']
+        folded = []
+        while len(turns) > 1 and (len(turns) > self.keep_turns or self._tokens(session) > self.max_tokens):
+            folded.append(turns.pop(0))
+        if folded:
+            with metrics.stage('conversation_summary'):
+                session['summary'] = self.summarizer(session['summary'], folded, self.summary_max_tokens)
+            with self._lock:
+                self.compactions += 1
+
+    def clear(self, session_id: str):
+        """ลบประวัติของ session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.store_path:
+            self._store().execute('DELETE FROM conversations WHERE session_id = ?', (session_id,))
+
+    def cleanup(self):
+        """ลบ session ที่หมดอายุออกจาก store"""
+        if self.store_path:
+            self._store().execute('DELETE FROM conversations WHERE updated_at <= ?', (time.time() - self.ttl,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'hits': self.hits,
+                'misses': self.misses,
+                'compactions': self.compactions
+            }
+
+
+_shared_store: Optional[ConversationStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """ConversationStore ที่ Sub-agent ทุกตัวใช้ร่วมกัน (สร้างเมื่อมี session แรก)"""
+    global _shared_store
+    if _shared_store is None:
+        with _shared_lock:
+            if _shared_store is None:
+                _shared_store = ConversationStore.from_env()
+                _register_metrics(_shared_store)
+    return _shared_store
+
+
+def _register_metrics(store: ConversationStore):
+    """ส่งออกสถิติของประวัติการสนทนาใน /metrics"""
+    metrics.REGISTRY.gauge('conversation_sessions', 'จำนวน session ในหน่วยความจำ').set_function(
+        lambda: store.stats()['sessions']
+    )
+    metrics.REGISTRY.counter(
+        'conversation_compactions_total', 'จำนวนครั้งที่ย่อ turn เก่าเป็นสรุป'
+    ).set_function(lambda: store.compactions)
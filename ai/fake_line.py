@@ -0,0 +1,103 @@
+import json
+import time
+import uuid
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional, Tuple
+
+from .line_client import sign
+
+
+class FakeLineServer:
+    """LINE Messaging API จำลองบน localhost สำหรับทดสอบและ benchmark (ไม่เรียก LINE จริง)
+
+    รับ POST /v2/bot/message/reply แล้วเก็บไว้ใน replies ตอบช้า latency วินาที
+    reply token ใช้ได้ครั้งเดียว (ใช้ซ้ำได้ 400 เหมือน LINE) ตั้ง LINE_API_BASE เป็น url เพื่อใช้งาน
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.replies: List[Dict[str, Any]] = []
+        self._used_tokens = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, payload = server._handle(self.path, self.headers, body)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _handle(self, path: str, headers, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        if path != '/v2/bot/message/reply':
+            return 404, {'message': 'Not found'}
+        if not (headers.get('Authorization') or '').startswith('Bearer '):
+            return 401, {'message': 'Authentication failed'}
+        if self.latency:
+            time.sleep(self.latency)
+        request = json.loads(body or b'{}')
+        token = request.get('replyToken')
+        messages = request.get('messages') or []
+        if not token or not 1 <= len(messages) <= 5:
+            return 400, {'message': 'The request body has 1 error(s)'}
+        with self._lock:
+            if token in self._used_tokens:
+                return 400, {'message': 'Invalid reply token'}
+            self._used_tokens.add(token)
+            self.replies.append(request)
+        return 200, {}
+
+    def start(self) -> 'FakeLineServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-line', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def make_delivery(texts: List[str], channel_secret: str, user_id: str = 'Ufake',
+                  redelivery: bool = False) -> Tuple[bytes, str]:
+    """body ของ webhook แบบที่ LINE ส่ง (หนึ่ง event ต่อข้อความ) และ X-Line-Signature ของ body"""
+    now = int(time.time() * 1000)
+    events = [{
+        'type': 'message',
+        'mode': 'active',
+        'timestamp': now,
+        'webhookEventId': uuid.uuid4().hex.upper()[:26],
+        'deliveryContext': {'isRedelivery': redelivery},
+        'replyToken': uuid.uuid4().hex,
+        'source': {'type': 'user', 'userId': user_id},
+        'message': {'id': str(now + i), 'type': 'text', 'text': text}
+    } for i, text in enumerate(texts)]
+    body = json.dumps({'destination': 'Ufakebot', 'events': events}, ensure_ascii=False).encode('utf-8')
+    return body, sign(body, channel_secret)
@@ -0,0 +1,103 @@
+import json
+import time
+import zlib
+import random
+import string
+from typing import Any, Iterator, List, Optional
+
+from langchain.llms.base import LLM
+from langchain.schema.output import GenerationChunk
+
+# ความผิดพลาดที่จำลองสุ่มแยกจาก prompt (prompt เดิมที่ลองใหม่ต้องมีโอกาสสำเร็จ)
+_faults = random.Random(0)
+
+
+class FakeLLMError(ConnectionError):
+    """ความผิดพลาดจำลองของ upstream (เช่น 503 หรือเชื่อมต่อไม่ได้)"""
+
+
+class FakeLLM(LLM):
+    """LLM จำลองสำหรับ benchmark และทดสอบ (ไม่เรียก API จริง)
+
+    ผลลัพธ์กำหนดได้ตาม prompt และ seed (prompt เดิมได้คำตอบและเวลาเดิมทุกครั้ง)
+    เวลาตอบสุ่มจากการแจกแจงแบบปกติรอบ latency และจำนวน token รอบ tokens
+    prompt สำหรับเลือก Sub-agent (มี "target_agent") จะได้ JSON ที่เลือกจาก agent_ids
+    จำลองความผิดพลาดได้: error_rate = สัดส่วนที่ raise FakeLLMError, slow_rate = สัดส่วนที่ตอบช้า slow_latency วินาที
+    (ใช้จำลอง timeout / hedge) และ down = ล้มเหลวทุกครั้ง (ใช้ทดสอบ circuit breaker)
+    """
+
+    latency: float = 0.05
+    latency_jitter: float = 0.0
+    tokens: int = 50
+    tokens_jitter: float = 0.0
+    stream_chunk_tokens: int = 5
+    agent_ids: List[str] = []
+    seed: int = 0
+    model_name: str = 'fake'
+    error_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 5.0
+    down: bool = False
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake'
+
+    def _rng(self, prompt: str) -> random.Random:
+        return random.Random(zlib.crc32(prompt.encode('utf-8')) ^ self.seed)
+
+    def _inject_faults(self) -> float:
+        """raise FakeLLMError ตาม error_rate หรือคืนค่าเวลาที่ต้องช้าเพิ่มตาม slow_rate"""
+        self.calls += 1
+        if self.down or (self.error_rate and _faults.random() < self.error_rate):
+            raise FakeLLMError('fake LLM: service unavailable')
+        if self.slow_rate and _faults.random() < self.slow_rate:
+            return self.slow_latency
+        return 0.0
+
+    def _latency(self, rng: random.Random) -> float:
+        if self.latency_jitter:
+            return max(0.0, rng.gauss(self.latency, self.latency_jitter))
+        return self.latency
+
+    def _text(self, prompt: str, rng: random.Random) -> str:
+        if '"target_agent"' in prompt and self.agent_ids:
+            return json.dumps({
+                'type': 'question',
+                'target_agent': self.agent_ids[rng.randrange(len(self.agent_ids))],
+                'data': {}
+            })
+        count = self.tokens
+        if self.tokens_jitter:
+            count = int(rng.gauss(self.tokens, self.tokens_jitter))
+        # คำละ 3 ตัวอักษร + ช่องว่าง ประมาณ 1 token ต่อคำ
+        return ' '.join(
+            ''.join(rng.choice(string.ascii_lowercase) for _ in range(3))
+            for _ in range(max(1, count))
+        )
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        rng = self._rng(prompt)
+        latency = self._latency(rng) + self._inject_faults()
+        text = self._text(prompt, rng)
+        if latency:
+            time.sleep(latency)
+        return text
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        rng = self._rng(prompt)
+        latency = self._latency(rng) + self._inject_faults()
+        words = self._text(prompt, rng).split(' ')
+        chunks = [
+            ' '.join(words[i:i + self.stream_chunk_tokens]) + ' '
+            for i in range(0, len(words), self.stream_chunk_tokens)
+        ]
+        # ครึ่งหนึ่งของเวลาเป็นเวลารอ token แรก ที่เหลือกระจายตามจำนวน chunk
+        if latency:
+            time.sleep(latency / 2)
+        for chunk in chunks:
+            if latency:
+                time.sleep(latency / 2 / len(chunks))
+            yield GenerationChunk(text=chunk)
@@ -0,0 +1,145 @@
+import os
+import hmac
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+import metrics
+
+DEFAULT_API_BASE = 'https://api.line.me'
+
+# ข้อจำกัดของ LINE Reply API: ไม่เกิน 5 ข้อความต่อ reply token และ 5000 ตัวอักษรต่อข้อความ
+MAX_REPLY_MESSAGES = 5
+MAX_TEXT_LENGTH = 5000
+
+REPLY_REQUESTS = metrics.REGISTRY.counter(
+    'line_reply_requests_total', 'จำนวนการเรียก LINE Reply API แยกตามผล', ('result',)
+)
+
+
+def verify_signature(body: bytes, signature: Optional[str], channel_secret: Optional[str]) -> bool:
+    """ตรวจ X-Line-Signature (HMAC-SHA256 ของ body แบบ base64) โดยเทียบแบบ constant-time"""
+    if not signature or not channel_secret:
+        return False
+    digest = hmac.new(channel_secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest), signature.encode('utf-8'))
+
+
+def sign(body: bytes, channel_secret: str) -> str:
+    """X-Line-Signature ของ body (ใช้กับ FakeLineServer และการทดสอบ)"""
+    digest = hmac.new(channel_secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def text_messages(texts: List[str]) -> List[Dict[str, str]]:
+    """แปลงข้อความเป็น message object ของ LINE (ตัดข้อความยาวเป็นหลายข้อความ รวมไม่เกิน 5 ข้อความ)"""
+    chunks = []
+    for text in texts:
+        text = text or ''
+        for start in range(0, max(1, len(text)), MAX_TEXT_LENGTH):
+            chunks.append(text[start:start + MAX_TEXT_LENGTH])
+    if len(chunks) > MAX_REPLY_MESSAGES:
+        # ข้อความส่วนที่เกินรวมไว้ในข้อความสุดท้าย (ตัดท้ายถ้ายังยาวเกิน)
+        tail = '\n'.join(chunks[MAX_REPLY_MESSAGES - 1:])
+        chunks = chunks[:MAX_REPLY_MESSAGES - 1] + [tail[:MAX_TEXT_LENGTH]]
+    return [{'type': 'text', 'text': chunk} for chunk in chunks]
+
+
+class LineClient:
+    """client ของ LINE Messaging API ที่ใช้ HTTP session (keep-alive) ร่วมกันทั้ง process
+
+    reply_many รวมข้อความของ reply token เดียวกันเป็น request เดียว (สูงสุด 5 ข้อความ)
+    และส่ง reply ของหลาย token พร้อมกัน
+    """
+
+    def __init__(self, access_token: Optional[str], api_base: str = DEFAULT_API_BASE,
+                 pool_size: int = 16, timeout: float = 10.0):
+        self.access_token = access_token
+        self.api_base = api_base.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'LineClient':
+        return cls(
+            access_token=os.getenv('LINE_CHANNEL_ACCESS_TOKEN'),
+            api_base=os.getenv('LINE_API_BASE', DEFAULT_API_BASE),
+            pool_size=int(os.getenv('LINE_HTTP_POOL_SIZE', 16)),
+            timeout=float(os.getenv('LINE_REPLY_TIMEOUT', 10))
+        )
+
+    @property
+    def session(self) -> 'requests.Session':
+        """HTTP session ที่ใช้ซ้ำทุก reply (สร้างเมื่อเรียกใช้ครั้งแรก)"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update({
+                        'Authorization': f'Bearer {self.access_token}',
+                        'Content-Type': 'application/json'
+                    })
+                    self._session = session
+        return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='line-reply')
+        return self._executor
+
+    def reply(self, reply_token: str, messages: List[Dict[str, Any]]) -> bool:
+        """ส่งข้อความตอบกลับด้วย reply token (ไม่เกิน 5 ข้อความ) คืนค่า False ถ้าส่งไม่สำเร็จ"""
+        try:
+            with metrics.stage('line_reply'):
+                response = self.session.post(
+                    f'{self.api_base}/v2/bot/message/reply',
+                    json={'replyToken': reply_token, 'messages': messages[:MAX_REPLY_MESSAGES]},
+                    timeout=self.timeout
+                )
+            if response.status_code >= 400:
+                print(f"LINE reply ไม่สำเร็จ ({response.status_code}): {response.text[:200]}")
+                REPLY_REQUESTS.inc(result='error')
+                return False
+            REPLY_REQUESTS.inc(result='success')
+            return True
+        except Exception as e:
+            print(f"เกิดข้อผิดพลาดในการส่ง LINE reply: {str(e)}")
+            REPLY_REQUESTS.inc(result='error')
+            return False
+
+    def reply_many(self, replies: List[Tuple[str, str]]) -> int:
+        """ส่งข้อความตอบกลับหลายรายการ [(reply_token, text), ...] คืนค่าจำนวน reply ที่สำเร็จ"""
+        grouped: Dict[str, List[str]] = {}
+        for reply_token, text in replies:
+            if reply_token and text is not None:
+                grouped.setdefault(reply_token, []).append(text)
+        if not grouped:
+            return 0
+        if len(grouped) == 1:
+            reply_token, texts = next(iter(grouped.items()))
+            return int(self.reply(reply_token, text_messages(texts)))
+        futures = [
+            self._get_executor().submit(self.reply, reply_token, text_messages(texts))
+            for reply_token, texts in grouped.items()
+        ]
+        return sum(1 for future in futures if future.result())
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
@@ -0,0 +1,205 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+
+import metrics
+from . import resilience
+
+# LLM client, HTTP session และ chain ที่ใช้ร่วมกันทั้ง process
+# AIManager และ SubAgent ทุกตัวดึงจากที่นี่แทนการสร้างของตัวเอง
+# openai, requests และ langchain ถูก import เมื่อต้องใช้ครั้งแรก (import ช้าหลายวินาที) ไม่ใช่ตอน import module
+
+DEFAULT_TEMPERATURE = 0.7
+
+_lock = threading.Lock()
+_session = None
+_llms: Dict[Any, Any] = {}
+_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_chains: OrderedDict = OrderedDict()
+_llm_factory = None
+
+
+def get_session() -> 'requests.Session':
+    """HTTP session แบบ keep-alive ที่ใช้ร่วมกันสำหรับทุกการเรียก OpenAI"""
+    global _session
+    if _session is None:
+        import openai
+        import requests
+        from requests.adapters import HTTPAdapter
+        with _lock:
+            if _session is None:
+                pool_size = int(os.getenv('LLM_HTTP_POOL_SIZE', 32))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                openai.requestssession = session
+                _session = session
+    return _session
+
+
+def _model_key(model_name: Optional[str]) -> str:
+    return model_name or os.getenv('OPENAI_MODEL') or 'default'
+
+
+def set_llm_factory(factory):
+    """แทนที่การสร้าง LLM client ด้วย factory(model_name, temperature) เช่น FakeLLM สำหรับ benchmark
+
+    ส่ง None เพื่อกลับไปใช้ OpenAI มีผลกับการเรียก LLM ครั้งถัดไปของ AIManager/SubAgent ทุกตัว
+    """
+    global _llm_factory
+    with _lock:
+        _llm_factory = factory
+        _llms.clear()
+        _chains.clear()
+
+
+def get_llm(model_name: Optional[str] = None, temperature: float = DEFAULT_TEMPERATURE):
+    """LLM client ที่ใช้ร่วมกันต่อ (model, temperature)"""
+    model_name = model_name or os.getenv('OPENAI_MODEL')
+    key = (model_name, temperature)
+    llm = _llms.get(key)
+    if llm is None:
+        if _llm_factory is None:
+            get_session()
+        with _lock:
+            llm = _llms.get(key)
+            if llm is None:
+                if _llm_factory is not None:
+                    llm = _llm_factory(model_name, temperature)
+                else:
+                    from langchain.llms import OpenAI
+                    kwargs = {
+                        'temperature': temperature,
+                        'api_key': os.getenv('OPENAI_API_KEY'),
+                        # request ที่ resilience เลิกรอแล้วต้องจบเองด้วย (ไม่ค้าง thread ไว้ตลอดไป)
+                        'request_timeout': float(os.getenv('LLM_REQUEST_TIMEOUT', 60)),
+                        'max_retries': 0
+                    }
+                    if model_name:
+                        kwargs['model_name'] = model_name
+                    llm = OpenAI(**kwargs)
+                _llms[key] = llm
+    return llm
+
+
+def get_chain(template: str, input_variables: List[str], llm=None) -> 'LLMChain':
+    """LLMChain ที่ compile แล้ว cache ตาม template (จำกัดจำนวนด้วย LLM_CHAIN_CACHE_SIZE)"""
+    llm = llm or get_llm()
+    key = (template, tuple(input_variables), id(llm))
+    with _lock:
+        chain = _chains.get(key)
+        if chain is not None:
+            _chains.move_to_end(key)
+            return chain
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+    prompt = PromptTemplate(input_variables=input_variables, template=template)
+    chain = LLMChain(llm=llm, prompt=prompt)
+    with _lock:
+        _chains[key] = chain
+        max_size = int(os.getenv('LLM_CHAIN_CACHE_SIZE', 1024))
+        while len(_chains) > max_size:
+            _chains.popitem(last=False)
+    return chain
+
+
+def _semaphore(model_name: Optional[str]) -> threading.BoundedSemaphore:
+    key = _model_key(model_name)
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        with _lock:
+            semaphore = _semaphores.get(key)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(int(os.getenv('LLM_MAX_CONCURRENCY', 16)))
+                _semaphores[key] = semaphore
+    return semaphore
+
+
+@contextmanager
+def limit(model_name: Optional[str] = None):
+    """จำกัดจำนวนการเรียก LLM พร้อมกันต่อ model"""
+    semaphore = _semaphore(model_name)
+    semaphore.acquire()
+    try:
+        yield
+    finally:
+        semaphore.release()
+
+
+def run_chain(chain: 'LLMChain', **inputs) -> str:
+    """เรียก chain ภายใต้ขีดจำกัดการทำงานพร้อมกันของ model นั้น พร้อม timeout / retry / circuit breaker
+
+    raise resilience.LLMUnavailable ถ้าเรียกไม่สำเร็จ (ผู้เรียกควรใช้คำตอบสำรอง)
+    """
+    model_name = getattr(chain.llm, 'model_name', None)
+
+    def invoke():
+        with limit(model_name), metrics.stage('llm'):
+            return chain.run(**inputs)
+
+    return resilience.get_policy().call(invoke, key=_model_key(model_name))
+
+
+def stream_chain(chain: 'LLMChain', **inputs) -> Iterator[str]:
+    """เรียก LLM แบบ streaming ด้วย prompt ของ chain คืนค่าข้อความทีละส่วนตามที่ได้รับ"""
+    prompt = chain.prompt.format(**inputs)
+    model_name = getattr(chain.llm, 'model_name', None)
+    # streaming ไม่ลองใหม่ (ส่งข้อความบางส่วนไปแล้ว) แต่ยังใช้ circuit breaker ร่วมกับ run_chain
+    left = resilience.remaining()
+    if left is not None and left <= 0:
+        raise resilience.DeadlineExceeded('เวลาของ request หมดก่อนเรียก LLM')
+    breaker = resilience.get_policy().breaker(_model_key(model_name))
+    if not breaker.allow():
+        raise resilience.CircuitOpen(f'LLM ({_model_key(model_name)}) ใช้งานไม่ได้ชั่วคราว')
+    semaphore = _semaphore(model_name)
+    left = resilience.remaining()
+    if not semaphore.acquire(timeout=max(left, 0) if left is not None else None):
+        breaker.release()
+        raise resilience.DeadlineExceeded(f'เวลาของ request หมดระหว่างรอคิวเรียก LLM ({_model_key(model_name)})')
+    started = False
+    stream = None
+    # ทุกทางออก (รวมถึงผู้รับปิด stream กลางทาง) ต้องคืน semaphore ปิด stream ของ LLM และบันทึกผลหรือคืนสิทธิ์ half-open ของ breaker
+    outcome = None
+    try:
+        with metrics.stage('llm_stream'):
+            if hasattr(chain.llm, 'stream'):
+                stream = iter(chain.llm.stream(prompt))
+                for chunk in stream:
+                    started = True
+                    yield chunk
+                    # ตรวจเวลาระหว่างข้อความแต่ละส่วน (ผู้รับอาจอ่านช้าหรือ LLM ส่งช้า) หมดแล้วหยุดรับจาก LLM
+                    left = resilience.remaining()
+                    if left is not None and left <= 0:
+                        raise resilience.DeadlineExceeded('เวลาของ request หมดระหว่าง streaming')
+            else:
+                yield chain.llm(prompt)
+        outcome = 'success'
+    except resilience.DeadlineExceeded:
+        # หมดเวลาของผู้เรียก ไม่ใช่ความผิดของ upstream (คืนสิทธิ์ breaker อย่างเดียว)
+        raise
+    except Exception as e:
+        if not resilience.is_retryable(e):
+            # error ฝั่งผู้เรียก upstream ยังตอบได้ปกติ
+            outcome = 'success'
+            raise
+        outcome = 'failure'
+        breaker.record_failure()
+        # ล้มเหลวก่อนได้ข้อความแรก ผู้เรียกยังเปลี่ยนไปใช้คำตอบสำรองได้
+        if not started:
+            raise resilience.LLMUnavailable(f'เรียก LLM ({_model_key(model_name)}) ไม่สำเร็จ: {str(e)}') from e
+        raise
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                print(f"เกิดข้อผิดพลาดในการปิด stream ของ LLM: {str(e)}")
+        semaphore.release()
+        if outcome == 'success':
+            breaker.record_success()
+        elif outcome is None:
+            breaker.release()
@@ -1,26 +1,21 @@
-from langchain.llms import OpenAI
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Callable, Optional
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import os
+import asyncio
+import json
+import hashlib
+import functools
+import contextvars
+from . import llm_pool
+from . import resilience
+from .routing_cache import RoutingCache
+from .pre_router import PreRouter
+from .context_builder import ContextBuilder
+from .tokens import estimate_tokens
+import metrics
 
-class AIManager:
-    def __init__(self):
-        self.llm = OpenAI(
-            temperature=0.7,
-            api_key=os.getenv('OPENAI_API_KEY')
-        )
-        self.sub_agents = {}
-        
-    def register_sub_agent(self, agent_id: str, agent):
-        """ลงทะเบียน Sub-agent"""
-        self.sub_agents[agent_id] = agent
-        
-    def analyze_message(self, message: str) -> Dict[str, Any]:
-        """วิเคราะห์ข้อความและเลือก Sub-agent ที่เหมาะสม"""
-        prompt = PromptTemplate(
-            input_variables=["message"],
-            template="""วิเคราะห์ข้อความต่อไปนี้และระบุ:
+ROUTING_PROMPT_TEMPLATE = """วิเคราะห์ข้อความต่อไปนี้และระบุ:
             1. ประเภทของคำถาม/คำสั่ง
             2. Sub-agent ที่ควรจะจัดการ
             3. ข้อมูลสำคัญที่ต้องใช้ในการประมวลผล
@@ -35,40 +30,431 @@ class AIManager:
                     "key": "value"
                 }}
             }}"""
+
+class AIManager:
+    def __init__(self):
+        self._llm = None
+        # Sub-agent ที่อยู่ในหน่วยความจำ (เรียงตามการใช้งานล่าสุด) และ id ของ agent ทั้งหมดที่เลือกได้
+        self.sub_agents = OrderedDict()
+        self._known_agents = set()
+        # agent_loader(agent_id) โหลด Sub-agent ที่รู้จักแต่ยังไม่อยู่ในหน่วยความจำ (ดู AgentRegistry)
+        self.agent_loader: Optional[Callable[[str], Any]] = None
+        # admission(agent) ถูกเรียกก่อนส่งงานให้ Sub-agent (raise exception เพื่อปฏิเสธ เช่น เกิน rate limit)
+        self.admission: Optional[Callable[[Any], None]] = None
+        # exception ที่ admission ใช้ปฏิเสธ (LINE ตอบด้วย busy_reply แทนข้อความ error ทั่วไป)
+        self.admission_errors: tuple = ()
+        self.busy_reply = os.getenv('LINE_BUSY_REPLY') or 'ขออภัย ขณะนี้มีผู้ใช้งานจำนวนมาก กรุณาลองใหม่อีกครั้งในอีกสักครู่'
+        self.routing_cache = RoutingCache(
+            max_size=int(os.getenv('ROUTING_CACHE_SIZE', 10000)),
+            ttl=float(os.getenv('ROUTING_CACHE_TTL', 3600)),
+            store_path=os.getenv('ROUTING_CACHE_PATH') or None
+        )
+        self._agents_fingerprint = self._fingerprint_agents()
+        self.pre_router = PreRouter(
+            threshold=float(os.getenv('PRE_ROUTER_THRESHOLD', 0.6)),
+            margin=float(os.getenv('PRE_ROUTER_MARGIN', 0.1))
         )
+        self.pre_router_enabled = os.getenv('PRE_ROUTER_ENABLED', 'true').lower() == 'true'
+        self.concurrency = int(os.getenv('AI_MANAGER_CONCURRENCY', 16))
+        self.context_builder = ContextBuilder.from_env()
+        self.routing_message_max_tokens = int(os.getenv('ROUTING_MESSAGE_MAX_TOKENS', 1000))
+        self.conversation_memory = os.getenv('CONVERSATION_MEMORY_ENABLED', 'true').lower() == 'true'
+        
+        # สถิติของ routing cache ใน /metrics
+        for result, field in (('hit', 'hits'), ('miss', 'misses')):
+            metrics.REGISTRY.counter(
+                'routing_cache_requests_total', 'จำนวนการค้นหาใน routing cache แยกตาม hit/miss', ('result',)
+            ).set_function(lambda field=field: getattr(self.routing_cache, field), result=result)
+        self._executor = None
+        
+    @property
+    def llm(self):
+        """LLM สำหรับเลือก Sub-agent (สร้าง client เมื่อเรียกใช้ครั้งแรก ไม่ใช่ตอนสร้าง AIManager)"""
+        return self._llm or llm_pool.get_llm()
+        
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+        
+    def register_sub_agent(self, agent_id: str, agent):
+        """ลงทะเบียน Sub-agent"""
+        previous = self.sub_agents.get(agent_id)
+        self.sub_agents[agent_id] = agent
+        if previous is not agent and hasattr(agent, 'add_listener'):
+            agent.add_listener(self._on_agent_changed)
+        if agent_id not in self._known_agents:
+            texts = [getattr(agent, 'description', '')]
+            texts.extend(example['input'] for example in getattr(agent, 'training_data', []))
+            self.declare_agent(agent_id, texts)
+            
+    def declare_agent(self, agent_id: str, texts: List[str] = ()):
+        """ให้เลือก agent ที่ยังไม่อยู่ในหน่วยความจำได้ (โหลดผ่าน agent_loader เมื่อถูกเลือก)"""
+        if agent_id in self._known_agents:
+            return
+        self._known_agents.add(agent_id)
+        
+        # ชุดของ Sub-agent เปลี่ยน ผลการเลือก agent ที่ cache ไว้จึงใช้ไม่ได้
+        self._agents_fingerprint = self._fingerprint_agents()
+        self.routing_cache.clear()
+        
+        # ทำ index คำอธิบายและข้อมูลเทรนสำหรับ pre-router
+        for text in texts:
+            self.index_agent_text(agent_id, text)
+            
+    def release_sub_agent(self, agent_id: str):
+        """เอา Sub-agent ออกจากหน่วยความจำ (ยังเลือกได้และโหลดใหม่ผ่าน agent_loader)"""
+        self.sub_agents.pop(agent_id, None)
+        
+    def get_sub_agent(self, agent_id: str):
+        """Sub-agent ตาม id (โหลดผ่าน agent_loader ถ้ายังไม่อยู่ในหน่วยความจำ) คืนค่า None ถ้าไม่พบ"""
+        agent = self.sub_agents.get(agent_id)
+        if agent is not None:
+            try:
+                self.sub_agents.move_to_end(agent_id)
+            except KeyError:
+                pass  # ถูกเอาออกจาก thread อื่นระหว่างนี้
+            return agent
+        if self.agent_loader is not None and agent_id in self._known_agents:
+            return self.agent_loader(agent_id)
+        return None
+                
+    def _admit(self, agent):
+        if self.admission is not None:
+            self.admission(agent)
+            
+    def index_agent_text(self, agent_id: str, text: str):
+        """เพิ่มข้อความตัวอย่างของ agent (เช่น prompt ใน training_data) ให้ pre-router"""
+        if text:
+            self.pre_router.add_document(agent_id, text)
+            
+    def _on_agent_changed(self, event: str, agent, **details):
+        """อัพเดท index เมื่อ Sub-agent ได้ข้อมูลเทรนเพิ่ม"""
+        if event == 'training_data_added':
+            self.index_agent_text(agent.agent_id, details['input_text'])
+            
+    def _fingerprint_agents(self) -> str:
+        """hash ของชุด Sub-agent ใช้เป็น namespace ของ routing cache"""
+        ids = '|'.join(sorted(str(agent_id) for agent_id in self._known_agents))
+        return hashlib.sha1(ids.encode('utf-8')).hexdigest()[:12]
+        
+    def _parse_analysis(self, response: str, message: str) -> Dict[str, Any]:
+        """แปลงคำตอบ JSON จาก LLM เป็น dict"""
+        try:
+            analysis = json.loads(response[response.index('{'):response.rindex('}') + 1])
+        except ValueError:
+            analysis = {'type': 'unknown', 'target_agent': None, 'data': {}}
+        if not isinstance(analysis, dict):
+            analysis = {'type': 'unknown', 'target_agent': None, 'data': {}}
+        # LLM อาจตอบ target_agent เป็นตัวเลข list หรือ object ใช้ได้เฉพาะค่าเดี่ยว (แปลงเป็นข้อความ)
+        target = analysis.get('target_agent')
+        if isinstance(target, bool) or not isinstance(target, (str, int, float)):
+            target = None
+        elif isinstance(target, float) and target.is_integer():
+            target = int(target)
+        analysis['target_agent'] = str(target) if target is not None else None
+        if not isinstance(analysis.get('data'), dict):
+            analysis['data'] = {}
+        analysis['data'].setdefault('input', message)
+        return analysis
+        
+    def analyze_message(self, message: str) -> Dict[str, Any]:
+        """วิเคราะห์ข้อความและเลือก Sub-agent ที่เหมาะสม"""
+        with metrics.stage('analyze'):
+            # ข้อความที่เคยวิเคราะห์แล้วไม่ต้องเรียก LLM ซ้ำ
+            cache_key = self.routing_cache.make_key(self._agents_fingerprint, message)
+            cached = self.routing_cache.get(cache_key)
+            if cached is not None:
+                metrics.ROUTING_DECISIONS.inc(source='cache')
+                return {**cached, 'data': {**cached['data'], 'input': message}}
+            
+            # ข้อความที่ตรงกับตัวอย่างของ agent ใดชัดเจน ส่งต่อได้เลยโดยไม่ต้องเรียก LLM
+            if self.pre_router_enabled:
+                routed = self.pre_router.route(message)
+                if routed and routed[0] in self._known_agents:
+                    metrics.ROUTING_DECISIONS.inc(source='pre_router')
+                    return {
+                        'type': 'pre_routed',
+                        'target_agent': routed[0],
+                        'confidence': routed[1],
+                        'data': {'input': message}
+                    }
+                
+            # ข้อความยาวมากใช้แค่ส่วนต้นในการเลือก agent (Sub-agent ยังได้ข้อความเต็ม)
+            routing_message, tokens_saved = self.context_builder.fit_text(message, self.routing_message_max_tokens)
+            chain = llm_pool.get_chain(ROUTING_PROMPT_TEMPLATE, ["message"], self.llm)
+            try:
+                response = llm_pool.run_chain(chain, message=routing_message)
+            except resilience.LLMUnavailable as e:
+                print(f"เรียก LLM เพื่อเลือก Sub-agent ไม่สำเร็จ ใช้ pre-router แทน: {str(e)}")
+                return self._fallback_analysis(message)
+            analysis = self._parse_analysis(response, message)
+            prompt_tokens = estimate_tokens(ROUTING_PROMPT_TEMPLATE) + estimate_tokens(routing_message)
+            metrics.ROUTING_DECISIONS.inc(source='llm')
+            metrics.record_llm_usage('router', prompt_tokens, estimate_tokens(response), tokens_saved)
+        
+            # cache เฉพาะผลที่เลือก Sub-agent ที่มีอยู่จริง
+            if analysis.get('target_agent') in self._known_agents:
+                self.routing_cache.set(cache_key, analysis)
+            return {
+                **analysis,
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'tokens_saved': tokens_saved
+                }
+            }
+        
+    def _fallback_analysis(self, message: str) -> Dict[str, Any]:
+        """เลือก Sub-agent โดยไม่ใช้ LLM (agent ที่คล้ายที่สุดจาก pre-router หรือ agent เดียวที่มี) ไม่เก็บลง cache"""
+        metrics.ROUTING_DECISIONS.inc(source='fallback')
+        ranked = self.pre_router.rank(message, k=1)
+        target = ranked[0][0] if ranked and ranked[0][0] in self._known_agents else None
+        if target is None and len(self._known_agents) == 1:
+            target = next(iter(self._known_agents))
+        return {'type': 'fallback', 'target_agent': target, 'data': {'input': message}}
         
-        chain = LLMChain(llm=self.llm, prompt=prompt)
-        response = chain.run(message=message)
-        return response
+    @staticmethod
+    def _fallback_result() -> Dict[str, Any]:
+        """ผลลัพธ์เมื่อเรียก LLM ไม่ได้และเลือก Sub-agent ไม่ได้"""
+        return {
+            'status': 'success',
+            'data': {'agent_id': None, 'response': resilience.fallback_reply(), 'status': 'fallback'}
+        }
+        
+    @staticmethod
+    def _with_session(data: Dict[str, Any], session_id: Optional[str]) -> Dict[str, Any]:
+        """เพิ่ม session_id (ใช้จำประวัติการสนทนาใน Sub-agent) ลงใน data ที่จะส่งให้ Sub-agent
+
+        session_id ต้องเป็น key ที่ฝั่ง server สร้างเอง (ตัด session_id ที่มากับ data ออกเสมอ)
+        """
+        data = {key: value for key, value in data.items() if key != 'session_id'}
+        return {**data, 'session_id': session_id} if session_id else data
         
     def process_webhook(self, webhook_data: Dict[str, Any]) -> Dict[str, Any]:
-        """ประมวลผลข้อมูลจาก Webhook"""
+        """ประมวลผลข้อมูลจาก Webhook (ถ้ามี session_id Sub-agent จะจำประวัติการสนทนาของ session นั้น)"""
         # วิเคราะห์ข้อความ
         analysis = self.analyze_message(webhook_data.get('message', ''))
         
         # เลือก Sub-agent ที่เหมาะสม
-        target_agent = self.sub_agents.get(analysis['target_agent'])
+        target_agent = self.get_sub_agent(analysis.get('target_agent'))
         if not target_agent:
+            if analysis.get('type') == 'fallback':
+                return self._fallback_result()
             return {
                 'status': 'error',
-                'message': f'ไม่พบ Sub-agent ที่เหมาะสม ({analysis["target_agent"]})'
+                'message': f'ไม่พบ Sub-agent ที่เหมาะสม ({analysis.get("target_agent")})'
             }
             
         # ส่งข้อมูลไปยัง Sub-agent
-        result = target_agent.process(analysis['data'])
+        self._admit(target_agent)
+        result = target_agent.process(self._with_session(analysis['data'], webhook_data.get('session_id')))
         return {
             'status': 'success',
             'data': result
         }
         
+    def stream_webhook(self, webhook_data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """ประมวลผลข้อมูลจาก Webhook แบบ streaming
+
+        คืนค่า event ตามลำดับ: {'type': 'agent', ...} เมื่อเลือก Sub-agent ได้,
+        {'type': 'token', 'text': ...} ทุกครั้งที่ได้ข้อความ และ {'type': 'done', 'result': ...} เมื่อจบ
+        """
+        analysis = self.analyze_message(webhook_data.get('message', ''))
+        target_agent = self.get_sub_agent(analysis.get('target_agent'))
+        if not target_agent and analysis.get('type') == 'fallback':
+            result = self._fallback_result()
+            yield {'type': 'agent', 'agent_id': None}
+            yield {'type': 'token', 'text': result['data']['response']}
+            yield {'type': 'done', 'result': result}
+            return
+        if not target_agent:
+            raise LookupError(f'ไม่พบ Sub-agent ที่เหมาะสม ({analysis.get("target_agent")})')
+        self._admit(target_agent)
+            
+        yield {'type': 'agent', 'agent_id': target_agent.agent_id}
+        parts = []
+        for chunk in target_agent.stream(self._with_session(analysis['data'], webhook_data.get('session_id'))):
+            parts.append(chunk)
+            yield {'type': 'token', 'text': chunk}
+        yield {
+            'type': 'done',
+            'result': {
+                'status': 'success',
+                'data': {
+                    'agent_id': target_agent.agent_id,
+                    'response': ''.join(parts),
+                    'status': 'success'
+                }
+            }
+        }
+        
+    def _candidate_agents(self, analysis: Dict[str, Any], message: str, fan_out: int) -> List[str]:
+        """รายชื่อ Sub-agent ที่จะส่งงานให้ (agent ที่วิเคราะห์ได้ก่อน ตามด้วยอันดับจาก pre-router)"""
+        candidates = []
+        if analysis.get('target_agent') in self._known_agents:
+            candidates.append(analysis.get('target_agent'))
+        if fan_out > 1:
+            for agent_id, _ in self.pre_router.rank(message, k=fan_out):
+                if agent_id in self._known_agents and agent_id not in candidates:
+                    candidates.append(agent_id)
+        return candidates[:fan_out]
+        
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='ai-manager')
+        return self._executor
+        
+    async def _run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        # ส่ง contextvars (trace id, deadline ของ request) ไปยัง thread ของ executor ด้วย
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(ctx.run, func, *args))
+        
+    async def aprocess_webhook(self, webhook_data: Dict[str, Any], fan_out: int = 1,
+                               strategy: str = 'first') -> Dict[str, Any]:
+        """ประมวลผลข้อมูลจาก Webhook แบบ async
+
+        fan_out > 1 จะส่งงานให้ Sub-agent ที่เป็นไปได้หลายตัวพร้อมกัน
+        strategy 'first' ใช้ผลแรกที่สำเร็จ ส่วน 'merge' รวมผลจากทุกตัว
+        """
+        message = webhook_data.get('message', '')
+        analysis = await self._run_blocking(self.analyze_message, message)
+        
+        candidates = self._candidate_agents(analysis, message, fan_out)
+        if not candidates and analysis.get('type') == 'fallback':
+            return self._fallback_result()
+        if not candidates:
+            return {
+                'status': 'error',
+                'message': f'ไม่พบ Sub-agent ที่เหมาะสม ({analysis.get("target_agent")})'
+            }
+            
+        data = self._with_session(analysis['data'], webhook_data.get('session_id'))
+        tasks = [
+            asyncio.ensure_future(self._run_blocking(self._process_with, agent_id, data))
+            for agent_id in candidates
+        ]
+        if strategy == 'merge':
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            return {
+                'status': 'success',
+                'data': [r for r in results if not isinstance(r, Exception)]
+            }
+            
+        # first-result-wins: คืนผลแรกที่สำเร็จ ถ้าล้มเหลวหมดให้ raise error ตัวสุดท้าย
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return {
+                        'status': 'success',
+                        'data': task.result()
+                    }
+                error = task.exception()
+        raise error
+        
+    def _process_with(self, agent_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """ส่งข้อมูลให้ Sub-agent ตาม id (ใช้ใน thread ของ executor)"""
+        agent = self.get_sub_agent(agent_id)
+        if agent is None:
+            raise LookupError(f'ไม่พบ Sub-agent ({agent_id})')
+        self._admit(agent)
+        return agent.process(data)
+        
+    async def aprocess_many(self, events: List[Dict[str, Any]], concurrency: int = None,
+                            fan_out: int = 1, strategy: str = 'first') -> List[Dict[str, Any]]:
+        """ประมวลผล webhook หลายรายการพร้อมกัน (จำกัดจำนวนที่ทำพร้อมกันด้วย concurrency)"""
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+        
+        async def run(event):
+            async with semaphore:
+                try:
+                    return await self.aprocess_webhook(event, fan_out=fan_out, strategy=strategy)
+                except Exception as e:
+                    return {
+                        'status': 'error',
+                        'message': str(e)
+                    }
+                    
+        return await asyncio.gather(*(run(event) for event in events))
+        
+    def process_many(self, events: List[Dict[str, Any]], **kwargs) -> List[Dict[str, Any]]:
+        """ประมวลผล webhook หลายรายการพร้อมกัน (เรียกจากโค้ดแบบ sync) ผลลัพธ์เรียงตามลำดับ events"""
+        return asyncio.run(self.aprocess_many(events, **kwargs))
+        
+    @staticmethod
+    def line_message_text(line_event) -> Optional[str]:
+        """ข้อความของ LINE event (dict จาก webhook หรือ event ของ line-bot-sdk) คืนค่า None ถ้าไม่ใช่ข้อความตัวอักษร"""
+        if isinstance(line_event, dict):
+            message = line_event.get('message') or {}
+            if line_event.get('type') != 'message' or message.get('type') != 'text':
+                return None
+            return message.get('text')
+        message = getattr(line_event, 'message', None)
+        return getattr(message, 'text', None)
+        
+    @staticmethod
+    def line_session_id(line_event) -> Optional[str]:
+        """session ของ LINE event (groupId/roomId ของแชทกลุ่ม ไม่เช่นนั้น userId)"""
+        if isinstance(line_event, dict):
+            source = line_event.get('source') or {}
+            chat_id = source.get('groupId') or source.get('roomId') or source.get('userId')
+        else:
+            source = getattr(line_event, 'source', None)
+            chat_id = (getattr(source, 'group_id', None) or getattr(source, 'room_id', None)
+                       or getattr(source, 'user_id', None))
+        return f'line:{chat_id}' if chat_id else None
+        
+    def handle_line_events(self, events: List[Any]) -> List[Optional[str]]:
+        """จัดการ LINE event หลายรายการพร้อมกัน คืนข้อความตอบกลับตามลำดับ events (None = ไม่ต้องตอบ)"""
+        # ถ้าจำประวัติการสนทนา event ของ session เดียวกันทำตามลำดับ (turn ต่อกันถูกต้อง) ต่าง session ทำพร้อมกัน
+        groups: Dict[Any, List[int]] = OrderedDict()
+        for i, event in enumerate(events):
+            if self.line_message_text(event):
+                session_id = self.line_session_id(event) if self.conversation_memory else None
+                groups.setdefault(session_id or i, []).append(i)
+        replies: List[Optional[str]] = [None] * len(events)
+        
+        def run(indexes):
+            for i in indexes:
+                replies[i] = self._handle_line_event(events[i])
+                
+        if len(groups) == 1:
+            run(next(iter(groups.values())))
+        elif groups:
+            # ทุก session ใช้เวลารวมประมาณการเรียก LLM ครั้งเดียว แทนที่จะต่อกันทีละ event
+            futures = [
+                self._get_executor().submit(contextvars.copy_context().run, run, indexes)
+                for indexes in groups.values()
+            ]
+            for future in futures:
+                future.result()
+        return replies
+        
+    def _handle_line_event(self, line_event) -> str:
+        try:
+            return self.handle_line_message(line_event)
+        except self.admission_errors as e:
+            print(f"ข้อความ LINE เกินขีดจำกัด: {str(e)}")
+            return self.busy_reply
+        except Exception as e:
+            print(f"เกิดข้อผิดพลาดในการประมวลผลข้อความ LINE: {str(e)}")
+            return 'ขออภัย เกิดข้อผิดพลาดในการประมวลผล'
+        
     def handle_line_message(self, line_event) -> str:
         """จัดการข้อความจาก LINE"""
-        message = line_event.message.text
+        message = self.line_message_text(line_event)
         analysis = self.analyze_message(message)
         
-        target_agent = self.sub_agents.get(analysis['target_agent'])
+        target_agent = self.get_sub_agent(analysis.get('target_agent'))
+        if not target_agent and analysis.get('type') == 'fallback':
+            return resilience.fallback_reply()
         if not target_agent:
             return "ขออภัย ไม่สามารถประมวลผลคำขอของคุณได้ในขณะนี้"
+        self._admit(target_agent)
             
-        result = target_agent.process(analysis['data'])
+        result = target_agent.process(self._with_session(analysis['data'], self.line_session_id(line_event)))
         return result.get('response', 'ขออภัย เกิดข้อผิดพลาดในการประมวลผล')
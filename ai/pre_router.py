@@ -0,0 +1,107 @@
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vectorizer import vectorize, InvertedIndex
+
+# แบ่งเอกสารยาว (เช่น system prompt ที่มี few-shot) เป็นบรรทัด/ประโยคก่อนทำ index
+_CHUNK_SPLIT = re.compile(r'[\r\n]+|(?<=[.!?])\s+')
+_CHUNK_STRIP = '"\'“”🔹-•* \t'
+
+
+class PreRouter:
+    """ตัวเลือก Sub-agent แบบ local ก่อนเรียก LLM
+
+    ทำ inverted index ของเวกเตอร์ n-gram จากคำอธิบายและข้อมูลเทรนของแต่ละ agent
+    คะแนนของ agent คือ cosine similarity สูงสุดกับข้อความส่วนใดส่วนหนึ่งของ agent นั้น
+    จะเลือก agent ให้ก็ต่อเมื่อคะแนนถึง threshold และทิ้งห่างอันดับสองอย่างน้อย margin
+    """
+
+    def __init__(self, threshold: float = 0.6, margin: float = 0.1, min_chunk_chars: int = 8):
+        self.threshold = threshold
+        self.margin = margin
+        self.min_chunk_chars = min_chunk_chars
+        self._index = InvertedIndex()
+        # เจ้าของของแต่ละ chunk เป็นลำดับของ agent ใน _agents (-1 คือถูกลบแล้ว)
+        self._agents: List[str] = []
+        self._agent_slots: Dict[str, int] = {}
+        self._agent_chunks: Dict[str, List[int]] = {}
+        self._owners = np.zeros(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def _chunks(self, text: str) -> List[str]:
+        chunks = []
+        for part in _CHUNK_SPLIT.split(text or ''):
+            part = part.strip(_CHUNK_STRIP)
+            if len(part) >= self.min_chunk_chars:
+                chunks.append(part)
+        return chunks
+
+    def add_document(self, agent_id, text: str) -> int:
+        """เพิ่มข้อความของ agent เข้า index (เพิ่มทีละส่วน ไม่ต้องสร้างใหม่ทั้งหมด) คืนค่าจำนวน chunk"""
+        vectors = [vectorize(chunk) for chunk in self._chunks(text)]
+        with self._lock:
+            slot = self._agent_slots.get(agent_id)
+            if slot is None:
+                slot = self._agent_slots[agent_id] = len(self._agents)
+                self._agents.append(agent_id)
+            chunks = self._agent_chunks.setdefault(agent_id, [])
+            for vector in vectors:
+                chunk_id = self._index.add(vector)
+                chunks.append(chunk_id)
+                self._set_owner(chunk_id, slot)
+        return len(vectors)
+
+    def _set_owner(self, chunk_id: int, slot: int):
+        """บันทึกเจ้าของ chunk ใหม่ (เรียกภายใต้ lock) ขยาย array ทีละเท่าตัว
+
+        chunk id ไม่ถูกใช้ซ้ำ ช่องของ chunk ใหม่จึงยังเป็น -1 ในทุก snapshot ที่ rank ถืออยู่ เขียนทับได้เลย
+        """
+        owners = self._owners
+        if chunk_id >= len(owners):
+            owners = np.full(max(chunk_id + 1, len(owners) * 2, 64), -1, dtype=np.int64)
+            owners[:len(self._owners)] = self._owners
+            self._owners = owners
+        owners[chunk_id] = slot
+
+    def remove_agent(self, agent_id):
+        """ลบข้อความทั้งหมดของ agent ออกจาก index"""
+        with self._lock:
+            removed = self._agent_chunks.pop(agent_id, [])
+            if not removed:
+                return
+            owners = self._owners.copy()
+            owners[removed] = -1
+            self._owners = owners
+            self._index.remove(removed)
+
+    def rank(self, message: str, k: int = 3) -> List[Tuple[str, float]]:
+        """จัดอันดับ agent ตามความคล้ายกับข้อความ คืนค่า [(agent_id, score), ...]"""
+        chunk_ids, scores = self._index.score_array(vectorize(message))
+        with self._lock:
+            owners = self._owners
+            agents = list(self._agents)
+        if not len(chunk_ids) or not agents:
+            return []
+        # chunk ที่เพิ่มหลังหยิบ owners ยังไม่มีเจ้าของใน snapshot นี้ ข้ามไป
+        in_range = chunk_ids < len(owners)
+        slots = owners[chunk_ids[in_range]]
+        scores = scores[in_range]
+        live = slots >= 0
+        best = np.zeros(len(agents))
+        np.maximum.at(best, slots[live], scores[live])
+        top = np.argsort(-best, kind='stable')[:k]
+        return [(agents[slot], float(best[slot])) for slot in top if best[slot] > 0.0]
+
+    def route(self, message: str) -> Optional[Tuple[str, float]]:
+        """เลือก agent ถ้ามั่นใจพอ ไม่เช่นนั้นคืนค่า None ให้ไปใช้ LLM"""
+        ranked = self.rank(message, k=2)
+        if not ranked:
+            return None
+        agent_id, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if score >= self.threshold and score - runner_up >= self.margin:
+            return agent_id, score
+        return None
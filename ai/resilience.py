@@ -0,0 +1,324 @@
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from typing import Dict, Any, Callable, Optional
+
+import metrics
+
+# error ของ openai 0.28 (และ error ของเครือข่าย) ที่ลองใหม่ได้ ตรวจจากชื่อ class เพื่อไม่ต้อง import openai
+RETRYABLE_ERRORS = ('Timeout', 'APIConnectionError', 'RateLimitError', 'ServiceUnavailableError', 'APIError',
+                    'TryAgain', 'ConnectionError', 'ReadTimeout', 'ConnectTimeout')
+
+DEFAULT_FALLBACK_REPLY = 'ขออภัย ระบบตอบกลับอัตโนมัติไม่พร้อมใช้งานชั่วคราว กรุณาลองใหม่อีกครั้งในภายหลัง'
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+EVENTS = metrics.REGISTRY.counter(
+    'llm_resilience_events_total', 'เหตุการณ์ของ resilience wrapper รอบการเรียก LLM', ('event',)
+)
+CIRCUIT_STATE = metrics.REGISTRY.gauge(
+    'llm_circuit_open', 'circuit breaker ของ LLM เปิดอยู่หรือไม่ (1 = เปิด)', ('key',)
+)
+
+
+class LLMUnavailable(Exception):
+    """เรียก LLM ไม่สำเร็จ (หมดเวลา ลองใหม่ครบแล้ว หรือ circuit เปิดอยู่) ผู้เรียกควรใช้คำตอบสำรอง"""
+
+
+class CircuitOpen(LLMUnavailable):
+    """circuit breaker เปิดอยู่ ไม่เรียก LLM จนกว่าจะครบ reset_timeout"""
+
+
+class DeadlineExceeded(LLMUnavailable, TimeoutError):
+    """เวลาของ request หมดก่อนได้คำตอบ"""
+
+
+# เวลาสิ้นสุดของ request ปัจจุบัน (time.monotonic) ตั้งด้วย deadline()
+_deadline: contextvars.ContextVar = contextvars.ContextVar('llm_deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """กำหนดเวลาที่เหลือของ request (การเรียก LLM ทุกครั้งภายใน block ต้องเสร็จก่อนหมดเวลานี้)"""
+    with until(deadline_end(seconds)):
+        yield
+
+
+def deadline_end(seconds: Optional[float]) -> Optional[float]:
+    """เวลาสิ้นสุด (time.monotonic) ของงบ seconds วินาทีนับจากตอนนี้ สำหรับใช้กับ until() ภายหลัง (None = ไม่จำกัด)"""
+    return time.monotonic() + seconds if seconds and seconds > 0 else None
+
+
+@contextmanager
+def until(end: Optional[float]):
+    """เหมือน deadline() แต่ระบุเวลาสิ้นสุดตรง ๆ (ใช้ต่อเวลาของ request เดิมข้าม yield ของ streaming)"""
+    if end is None:
+        yield
+        return
+    current = _deadline.get()
+    token = _deadline.set(end if current is None else min(current, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """วินาทีที่เหลือของ request ปัจจุบัน (None = ไม่ได้กำหนด)"""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def fallback_reply() -> str:
+    """คำตอบสำรองเมื่อเรียก LLM ไม่ได้"""
+    return os.getenv('LLM_FALLBACK_REPLY') or DEFAULT_FALLBACK_REPLY
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+class CircuitBreaker:
+    """ตัด LLM ออกเมื่อล้มเหลวติดกัน failure_threshold ครั้ง แล้วลองใหม่ 1 ครั้ง (half-open) หลัง reset_timeout วินาที"""
+
+    def __init__(self, key: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.key = key
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """เรียก LLM ได้หรือไม่ (ตอน half-open ให้ผ่านทีละ 1 request)"""
+        if not self.failure_threshold:
+            return True
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+                self._probing = False
+            if self.state == STATE_HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                CIRCUIT_STATE.set(0, key=self.key)
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def release(self):
+        """คืนสิทธิ์ทดลองของ half-open โดยไม่นับผล (request ยกเลิกก่อนเรียก LLM)"""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    EVENTS.inc(event='breaker_open')
+                    CIRCUIT_STATE.set(1, key=self.key)
+                self.state = STATE_OPEN
+                self.opened_at = time.monotonic()
+
+
+class ResiliencePolicy:
+    """ครอบการเรียก LLM ทุกครั้งด้วย timeout, retry แบบ jittered backoff, hedged request และ circuit breaker
+
+    timeout ของแต่ละครั้ง = min(call_timeout, เวลาที่เหลือของ request จาก deadline())
+    การเรียกทำใน thread pool แยก request จึงไม่ค้างเกิน timeout แม้ upstream ไม่ตอบ
+    ถ้าเปิด hedge จะส่ง request ซ้ำอีกตัวเมื่อครั้งแรกช้ากว่า p95 ของเวลาตอบล่าสุด (หรือ hedge_delay) แล้วใช้ผลที่มาก่อน
+    """
+
+    def __init__(self, call_timeout: float = 30.0, max_retries: int = 2, backoff_base: float = 0.2,
+                 backoff_max: float = 2.0, hedge: bool = False, hedge_delay: Optional[float] = None,
+                 hedge_min_delay: float = 0.05, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 max_threads: int = 64):
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_threads = max_threads
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ResiliencePolicy':
+        hedge_delay = os.getenv('LLM_HEDGE_DELAY')
+        return cls(
+            call_timeout=float(os.getenv('LLM_CALL_TIMEOUT', 30)),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', 2)),
+            backoff_base=float(os.getenv('LLM_RETRY_BACKOFF', 0.2)),
+            backoff_max=float(os.getenv('LLM_RETRY_BACKOFF_MAX', 2)),
+            hedge=os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true',
+            hedge_delay=float(hedge_delay) if hedge_delay else None,
+            hedge_min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY', 0.05)),
+            failure_threshold=int(os.getenv('LLM_BREAKER_THRESHOLD', 5)),
+            reset_timeout=float(os.getenv('LLM_BREAKER_RESET', 30)),
+            max_threads=int(os.getenv('LLM_CALL_THREADS', 64))
+        )
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    key, CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+                )
+        return breaker
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix='llm-call')
+        return self._executor
+
+    def _record_latency(self, key: str, seconds: float):
+        samples = self._latencies.get(key)
+        if samples is None:
+            with self._lock:
+                samples = self._latencies.setdefault(key, deque(maxlen=200))
+        samples.append(seconds)
+
+    def _hedge_after(self, key: str) -> Optional[float]:
+        """เวลาที่รอก่อนส่ง request ซ้ำ (p95 ของเวลาตอบล่าสุด ต้องมีอย่างน้อย 20 ตัวอย่าง)"""
+        if not self.hedge:
+            return None
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        samples = sorted(self._latencies.get(key) or ())
+        if len(samples) < 20:
+            return None
+        return max(self.hedge_min_delay, samples[int(len(samples) * 0.95) - 1])
+
+    def _timeout(self) -> float:
+        left = remaining()
+        if left is None:
+            return self.call_timeout
+        if left <= 0:
+            EVENTS.inc(event='deadline')
+            raise DeadlineExceeded('เวลาของ request หมดก่อนเรียก LLM')
+        return min(self.call_timeout, left) if self.call_timeout else left
+
+    def _attempt(self, fn: Callable[[], Any], key: str, timeout: float) -> Any:
+        """เรียก fn หนึ่งครั้ง (อาจส่ง hedged request เพิ่ม) ภายใน timeout วินาที"""
+        executor = self._get_executor()
+        start = time.monotonic()
+        futures = [executor.submit(contextvars.copy_context().run, fn)]
+        hedge_after = self._hedge_after(key)
+        end = start + timeout
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait_futures(futures, timeout=hedge_after)
+            if not done:
+                EVENTS.inc(event='hedge')
+                futures.append(executor.submit(contextvars.copy_context().run, fn))
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait_futures(pending, timeout=max(0.0, end - time.monotonic()),
+                                         return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        EVENTS.inc(event='hedge_win')
+                    self._record_latency(key, time.monotonic() - start)
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        # request ที่ยังค้างอยู่ทำต่อใน thread ของมันเอง (จบเองตาม timeout ของ HTTP client) แต่ผู้เรียกไม่ต้องรอแล้ว
+        EVENTS.inc(event='timeout')
+        raise TimeoutError(f'LLM ไม่ตอบภายใน {timeout:.1f} วินาที')
+
+    def call(self, fn: Callable[[], Any], key: str = 'default') -> Any:
+        """เรียก fn (การเรียก LLM หนึ่งครั้ง) พร้อม timeout / retry / hedge / circuit breaker
+
+        raise CircuitOpen ถ้า circuit เปิด, LLMUnavailable ถ้าลองครบแล้วยังไม่สำเร็จ
+        error ที่ลองใหม่ไม่ได้ (เช่น request ไม่ถูกต้อง) จะถูก raise ต่อตามเดิม
+        """
+        breaker = self.breaker(key)
+        if not breaker.allow():
+            EVENTS.inc(event='short_circuit')
+            raise CircuitOpen(f'LLM ({key}) ใช้งานไม่ได้ชั่วคราว')
+        # ทุกทางออกต้องบันทึกผลหรือคืนสิทธิ์ของ breaker (ไม่เช่นนั้น half-open จะค้างไม่ให้ใครผ่านอีก)
+        outcome = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = self._attempt(fn, key, self._timeout())
+                    outcome = 'success'
+                    return result
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    if not is_retryable(e):
+                        # error ฝั่งผู้เรียก (เช่น prompt ยาวเกิน) แปลว่า upstream ยังตอบได้ปกติ
+                        outcome = 'success'
+                        raise
+                    breaker.record_failure()
+                    outcome = 'failure'
+                    if attempt == self.max_retries or not breaker.allow():
+                        raise LLMUnavailable(f'เรียก LLM ({key}) ไม่สำเร็จ: {str(e) or type(e).__name__}') from e
+                    outcome = None
+                    # full jitter backoff แต่ไม่เกินเวลาที่เหลือของ request
+                    delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    left = remaining()
+                    if left is not None:
+                        delay = min(delay, max(0.0, left))
+                    EVENTS.inc(event='retry')
+                    time.sleep(delay)
+        finally:
+            if outcome == 'success':
+                breaker.record_success()
+            elif outcome is None:
+                breaker.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            key: {'state': breaker.state, 'failures': breaker.failures}
+            for key, breaker in list(self._breakers.items())
+        }
+
+
+_shared_policy: Optional[ResiliencePolicy] = None
+_shared_lock = threading.Lock()
+
+
+def get_policy() -> ResiliencePolicy:
+    """ResiliencePolicy ที่การเรียก LLM ทุกครั้งใช้ร่วมกัน"""
+    global _shared_policy
+    if _shared_policy is None:
+        with _shared_lock:
+            if _shared_policy is None:
+                _shared_policy = ResiliencePolicy.from_env()
+    return _shared_policy
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from .routing_cache import normalize_message
+from .vectorizer import vectorize, InvertedIndex
+import metrics
+
+# (agent_id, group, key, normalized input) จาก ResponseCache.make_key
+CacheKey = Tuple[str, str, str, str]
+
+# ขนาดโดยประมาณของ entry นอกเหนือจากข้อความ (dict, tuple, OrderedDict node)
+_ENTRY_OVERHEAD = 256
+
+
+class _Entry:
+    __slots__ = ('agent_id', 'group', 'doc_id', 'vector', 'value', 'expires_at', 'size')
+
+    def __init__(self, agent_id, group, doc_id, vector, value, expires_at, size):
+        self.agent_id = agent_id
+        self.group = group
+        self.doc_id = doc_id
+        self.vector = vector
+        self.value = value
+        self.expires_at = expires_at
+        self.size = size
+
+
+class _Group:
+    """entry ที่ต่างกันแค่ input (agent, template และข้อมูลอื่นเหมือนกัน) สำหรับค้นหาแบบคล้ายกัน"""
+
+    def __init__(self):
+        self.index = InvertedIndex()
+        self.keys: Dict[int, str] = {}
+        self.added = 0
+
+
+class ResponseCache:
+    """cache คำตอบของ Sub-agent แบบ LRU พร้อม TTL และจำกัดขนาดหน่วยความจำ
+
+    ชั้นแรกตรงกันทุกตัวอักษร: key จาก (agent_id, hash ของ prompt template, input ที่ normalize แล้ว, hash ของข้อมูลอื่น)
+    ชั้นที่สอง (เมื่อ similarity_threshold > 0): input ที่คล้ายกันตั้งแต่ threshold ขึ้นไป
+    โดยข้อมูลอื่นต้องเหมือนกันทุกอย่าง
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 600.0, max_bytes: int = 64 * 1024 * 1024,
+                 similarity_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._agents: Dict[str, set] = {}
+        self._groups: Dict[str, _Group] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'ResponseCache':
+        """สร้างจากค่า RESPONSE_CACHE_* ใน environment"""
+        return cls(
+            max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 5000)),
+            ttl=float(os.getenv('RESPONSE_CACHE_TTL', 600)),
+            max_bytes=int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+            similarity_threshold=float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0))
+        )
+
+    @staticmethod
+    def make_key(agent_id, template: str, data: Dict[str, Any]) -> CacheKey:
+        """สร้าง key ของคำขอ (ใช้ทั้งกับ get และ set)"""
+        normalized = normalize_message(str(data.get('input', '')))
+        others = json.dumps(
+            {k: v for k, v in data.items() if k != 'input'},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        group = hashlib.sha1(f'{agent_id}\x00{template}\x00{others}'.encode('utf-8')).hexdigest()
+        key = hashlib.sha1(f'{group}\x00{normalized}'.encode('utf-8')).hexdigest()
+        return str(agent_id), group, key, normalized
+
+    def get(self, cache_key: CacheKey) -> Optional[Dict[str, Any]]:
+        """ดึงคำตอบจาก cache คืนค่า None ถ้าไม่มีหรือหมดอายุ"""
+        _, group_key, key, normalized = cache_key
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.value
+                self._remove(key)
+            if self.similarity_threshold <= 0 or group_key not in self._groups:
+                self.misses += 1
+                return None
+
+        # ชั้นที่สอง: หา input ที่คล้ายกันในกลุ่มเดียวกัน
+        group = self._groups.get(group_key)
+        scores = group.index.scores(vectorize(normalized)) if group is not None else {}
+        with self._lock:
+            # ระหว่างคำนวณคะแนน กลุ่มอาจถูกสร้าง index ใหม่ (doc_id เปลี่ยน) คะแนนเดิมใช้ไม่ได้แล้ว ถือว่าไม่พบ
+            if group is None or self._groups.get(group_key) is not group:
+                self.misses += 1
+                return None
+            best_key, best_score = None, self.similarity_threshold
+            for doc_id, score in scores.items():
+                candidate = group.keys.get(doc_id)
+                if candidate is not None and score >= best_score:
+                    best_key, best_score = candidate, score
+            entry = self._entries.get(best_key) if best_key else None
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(best_key)
+                self.similar_hits += 1
+                return entry.value
+            self.misses += 1
+            return None
+
+    def set(self, cache_key: CacheKey, value: Dict[str, Any]):
+        """เก็บคำตอบลง cache"""
+        agent_id, group_key, key, normalized = cache_key
+        vector = vectorize(normalized) if self.similarity_threshold > 0 else None
+        size = (_ENTRY_OVERHEAD + len(normalized) * 4
+                + len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+                + (len(vector) * 48 if vector else 0))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            doc_id = None
+            if vector is not None:
+                group = self._groups.setdefault(group_key, _Group())
+                doc_id = group.index.add(vector)
+                group.keys[doc_id] = key
+                group.added += 1
+            self._entries[key] = _Entry(agent_id, group_key, doc_id, vector, value, time.time() + self.ttl, size)
+            self._agents.setdefault(agent_id, set()).add(key)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        """ลบ entry (ต้องถือ lock อยู่)"""
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        keys = self._agents.get(entry.agent_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._agents[entry.agent_id]
+        group = self._groups.get(entry.group)
+        if group is not None and entry.doc_id is not None:
+            group.keys.pop(entry.doc_id, None)
+            if not group.keys:
+                del self._groups[entry.group]
+            elif group.added > 2 * len(group.keys) + 16:
+                # สร้าง index ของกลุ่มใหม่เมื่อมีรายการที่ถูกลบค้างอยู่มาก
+                rebuilt = _Group()
+                for old_key in group.keys.values():
+                    live = self._entries[old_key]
+                    live.doc_id = rebuilt.index.add(live.vector)
+                    rebuilt.keys[live.doc_id] = old_key
+                    rebuilt.added += 1
+                self._groups[entry.group] = rebuilt
+
+    def invalidate(self, agent_id):
+        """ลบคำตอบทั้งหมดของ agent (เมื่อ prompt template หรือข้อมูลเทรนเปลี่ยน)"""
+        with self._lock:
+            for key in list(self._agents.get(str(agent_id), ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._agents.clear()
+            self._groups.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+_shared_cache: Optional[ResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """response cache ที่ Sub-agent ทุกตัวใช้ร่วมกัน (ขนาดรวมจำกัดด้วย RESPONSE_CACHE_MAX_BYTES)"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = ResponseCache.from_env()
+                _register_metrics(_shared_cache)
+    return _shared_cache
+
+
+def _register_metrics(cache: ResponseCache):
+    """ส่งออกสถิติของ cache ใน /metrics"""
+    requests_total = metrics.REGISTRY.counter(
+        'response_cache_requests_total', 'จำนวนการค้นหาใน response cache แยกตามผล', ('result',)
+    )
+    for result, field in (('hit', 'hits'), ('similar_hit', 'similar_hits'), ('miss', 'misses')):
+        requests_total.set_function(lambda field=field: getattr(cache, field), result=result)
+    metrics.REGISTRY.counter(
+        'response_cache_evictions_total', 'จำนวน entry ที่ถูกลบออกเพราะเกินขนาด'
+    ).set_function(lambda: cache.evictions)
+    metrics.REGISTRY.gauge('response_cache_entries', 'จำนวน entry ใน response cache').set_function(
+        lambda: len(cache._entries)
+    )
+    metrics.REGISTRY.gauge('response_cache_bytes', 'ขนาดโดยประมาณของ response cache').set_function(
+        lambda: cache.bytes
+    )
@@ -0,0 +1,53 @@
+import threading
+from typing import Dict, Any, List
+
+from .vectorizer import vectorize, InvertedIndex
+from .tokens import estimate_tokens
+
+
+class ExampleIndex:
+    """index ของ training data ของ Sub-agent สำหรับเลือกตัวอย่างที่คล้ายกับ input มากที่สุด
+
+    แต่ละตัวอย่างถูกแปลงเป็นเวกเตอร์ n-gram (จาก input และ output) ครั้งเดียวตอนเพิ่ม
+    การค้นหาใช้ inverted index จึงไม่ต้องเทียบกับทุกตัวอย่าง
+    """
+
+    def __init__(self):
+        self._index = InvertedIndex()
+        self._examples: List[Dict[str, Any]] = []
+        self._tokens: List[int] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def add(self, example: Dict[str, Any]):
+        """เพิ่มตัวอย่างเข้า index"""
+        text = f"{example.get('input', '')}\n{example.get('output', '')}"
+        vector = vectorize(text)
+        with self._lock:
+            self._index.add(vector)
+            self._examples.append(example)
+            self._tokens.append(estimate_tokens(text))
+
+    def select(self, query: str, k: int = 3, token_budget: int = None) -> List[Dict[str, Any]]:
+        """เลือกตัวอย่างที่คล้ายกับ query มากที่สุดไม่เกิน k ตัว และรวมกันไม่เกิน token_budget
+
+        ถ้าไม่มีตัวอย่างใดคล้ายเลย จะใช้ตัวอย่างตามลำดับที่เพิ่ม (แบบเดิม)
+        """
+        scores = self._index.scores(vectorize(query)) if query else {}
+        with self._lock:
+            if scores:
+                ranked = sorted(scores, key=lambda i: (-scores[i], i))
+            else:
+                ranked = range(len(self._examples))
+
+            selected, used = [], 0
+            for i in ranked:
+                if len(selected) >= k:
+                    break
+                if token_budget is not None and used + self._tokens[i] > token_budget:
+                    continue
+                selected.append(self._examples[i])
+                used += self._tokens[i]
+        return selected
@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+_ZERO_WIDTH = dict.fromkeys(map(ord, '\u200b\u200c\u200d\u2060\ufeff'), None)
+# ตัวอักษรไทย/เครื่องหมายที่พิมพ์ซ้ำเพื่อเน้น เช่น "มากกกก", "ค่ะะะ", "!!!"
+_REPEATED = re.compile(r'([ก-๏!?.~])\1{2,}')
+_TRAILING = re.compile(r'[\s!?.~]+$')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_message(text: str) -> str:
+    """ทำข้อความให้อยู่ในรูปมาตรฐานสำหรับใช้เป็น key ของ cache (รองรับภาษาไทย)"""
+    text = unicodedata.normalize('NFKC', text or '')
+    text = text.translate(_ZERO_WIDTH)
+    # นิคหิต + สระอา ที่พิมพ์แยกกัน ให้เป็นสระอำ
+    text = text.replace('\u0e4d\u0e32', '\u0e33')
+    text = text.casefold()
+    text = _REPEATED.sub(r'\1', text)
+    text = _WHITESPACE.sub(' ', text).strip()
+    return _TRAILING.sub('', text)
+
+
+class RoutingCache:
+    """LRU cache พร้อม TTL สำหรับผลการวิเคราะห์ข้อความ (เลือก Sub-agent)
+
+    ถ้ากำหนด store_path จะเก็บสำรองลง SQLite ด้วย เพื่อให้ใช้ร่วมกันข้าม process และหลัง restart
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600.0, store_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store_path = store_path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if store_path:
+            directory = os.path.dirname(store_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            conn = self._store()
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_routes_expires_at ON routes (expires_at)')
+
+    @staticmethod
+    def make_key(namespace: str, message: str) -> str:
+        """สร้าง key จาก namespace (ชุดของ Sub-agent) และข้อความที่ normalize แล้ว"""
+        digest = hashlib.sha1(normalize_message(message).encode('utf-8')).hexdigest()
+        return f'{namespace}:{digest}'
+
+    def _store(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.store_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """ดึงผลการวิเคราะห์จาก cache คืนค่า None ถ้าไม่มีหรือหมดอายุ"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.store_path:
+            try:
+                row = self._store().execute(
+                    'SELECT value, expires_at FROM routes WHERE key = ? AND expires_at > ?', (key, now)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"เกิดข้อผิดพลาดในการอ่าน routing cache: {str(e)}")
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._put(key, value, row[1])
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put(self, key: str, value: Dict[str, Any], expires_at: float):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """เก็บผลการวิเคราะห์ลง cache"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._put(key, value, expires_at)
+        if self.store_path:
+            try:
+                conn = self._store()
+                conn.execute(
+                    'INSERT OR REPLACE INTO routes (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+                conn.execute('DELETE FROM routes WHERE expires_at <= ?', (time.time(),))
+            except sqlite3.Error as e:
+                print(f"เกิดข้อผิดพลาดในการบันทึก routing cache: {str(e)}")
+
+    def clear(self):
+        """ล้าง cache ในหน่วยความจำ (ข้อมูลใน store จะหมดอายุเองตาม TTL)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """สถิติการใช้งาน cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0
+            }
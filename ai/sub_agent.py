@@ -1,19 +1,58 @@
-from langchain.llms import OpenAI
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, AsyncIterator, Optional, Tuple
 import os
+import asyncio
+import threading
+from . import llm_pool
+from . import resilience
+from .retrieval import ExampleIndex
+from .context_builder import ContextBuilder
+from .response_cache import get_response_cache
+from .conversation import get_conversation_store
+from .tokens import estimate_tokens
+import metrics
 
 class SubAgent:
-    def __init__(self, agent_id: str, name: str, prompt_template: str = None):
+    def __init__(self, agent_id: str, name: str, prompt_template: str = None, description: str = ''):
         self.agent_id = agent_id
         self.name = name
-        self.llm = OpenAI(
-            temperature=0.7,
-            api_key=os.getenv('OPENAI_API_KEY')
-        )
+        self.description = description
+        self._llm = None
         self.prompt_template = prompt_template or self._default_prompt_template()
         self.training_data = []
+        self.example_index = ExampleIndex()
+        self._index_lock = threading.Lock()
+        self.examples_k = int(os.getenv('SUB_AGENT_EXAMPLES_K', 3))
+        self.examples_token_budget = int(os.getenv('SUB_AGENT_EXAMPLES_TOKEN_BUDGET', 1000))
+        self.context_builder = ContextBuilder.from_env()
+        self._listeners = []
+        # จำประวัติการสนทนาของ data['session_id'] (เช่น LINE userId) และใส่ไว้ใน prompt ของ turn ถัดไป
+        self.conversation_memory = os.getenv('CONVERSATION_MEMORY_ENABLED', 'true').lower() == 'true'
+        # ขีดจำกัดจำนวนงานต่อนาทีของ agent นี้ (None = ใช้ค่าเริ่มต้นของระบบ ตรวจโดย AIManager.admission)
+        self.rate_limit_per_minute = None
+        self.rate_limit_burst = None
+        
+        # cache คำตอบ (ใช้ร่วมกันทุก agent) ล้างของ agent นี้ทุกครั้งที่ template หรือข้อมูลเทรนเปลี่ยน
+        self.response_cache = None
+        if os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true':
+            self.response_cache = get_response_cache()
+            self.add_listener(lambda event, agent, **details: agent.response_cache.invalidate(agent.agent_id))
+        
+    @property
+    def llm(self):
+        """LLM ของ agent (สร้าง client เมื่อเรียกใช้ครั้งแรก ไม่ใช่ตอนสร้าง SubAgent)"""
+        return self._llm or llm_pool.get_llm()
+        
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+        
+    def add_listener(self, callback):
+        """ลงทะเบียน callback(event, agent, **details) ที่จะถูกเรียกเมื่อข้อมูลของ agent เปลี่ยน"""
+        self._listeners.append(callback)
+        
+    def _notify(self, event: str, **details):
+        for callback in list(self._listeners):
+            callback(event, self, **details)
         
     def _default_prompt_template(self) -> str:
         """สร้าง default prompt template"""
@@ -30,46 +69,177 @@ class SubAgent:
             'input': input_text,
             'output': expected_output
         })
+        self._sync_example_index()
+        self._notify('training_data_added', input_text=input_text, expected_output=expected_output)
+        
+    def load_training_data(self, examples: List[Dict[str, str]]):
+        """แทนที่ข้อมูลเทรนทั้งชุด (เช่น ตอนโหลดจากฐานข้อมูล) และสร้าง index ใหม่ครั้งเดียว"""
+        self.training_data = list(examples)
+        self._sync_example_index()
+        self._notify('training_data_loaded', count=len(self.training_data))
+        
+    def _sync_example_index(self):
+        """เพิ่มตัวอย่างที่ยังไม่อยู่ใน index (รวมถึงที่ถูกใส่ใน training_data โดยตรง)"""
+        with self._index_lock:
+            if len(self.example_index) > len(self.training_data):
+                # training_data ถูกแทนที่ทั้งชุด ต้องสร้าง index ใหม่
+                self.example_index = ExampleIndex()
+            for example in self.training_data[len(self.example_index):]:
+                self.example_index.add(example)
         
     def update_prompt_template(self, new_template: str):
         """อัพเดท prompt template"""
         self.prompt_template = new_template
+        self._notify('prompt_template_updated')
         
     def process(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """ประมวลผลข้อมูลที่ได้รับ"""
-        # สร้าง prompt จาก template
-        prompt = PromptTemplate(
-            input_variables=["input", "context"],
-            template=self.prompt_template
-        )
+        with metrics.stage('sub_agent'):
+            return self._process(data)
+            
+    def _split_session(self, data: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any], str]:
+        """แยก session_id ออกจาก data คืนค่า (session_id, data ที่เหลือ, ประวัติการสนทนา)"""
+        if 'session_id' not in data:
+            return None, data, ''
+        session_id = data['session_id']
+        data = {key: value for key, value in data.items() if key != 'session_id'}
+        if not session_id or not self.conversation_memory:
+            return None, data, ''
+        return str(session_id), data, get_conversation_store().history_text(str(session_id))
+        
+    def _remember_turn(self, session_id: Optional[str], data: Dict[str, Any], response: str):
+        if session_id:
+            get_conversation_store().append(session_id, str(data.get('input', '')), response)
         
-        # สร้าง chain
-        chain = LLMChain(llm=self.llm, prompt=prompt)
+    def _process(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        session_id, data, history = self._split_session(data)
+        
+        # คำถามเดิม (หรือคล้ายกันมาก) ตอบจาก cache ได้เลย (ประวัติการสนทนาเป็นส่วนหนึ่งของ key)
+        cache_key = None
+        if self.response_cache is not None:
+            cache_data = {**data, 'history': history} if history else data
+            cache_key = self.response_cache.make_key(self.agent_id, self.prompt_template, cache_data)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self._remember_turn(session_id, data, cached['response'])
+                return {**cached, 'cached': True}
+                
+        # ใช้ chain ที่ compile ไว้แล้วของ template นี้
+        chain = llm_pool.get_chain(self.prompt_template, ["input", "context"], self.llm)
         
         # ประมวลผล
-        context = self._prepare_context(data)
-        response = chain.run(input=data.get('input', ''), context=context)
+        prompt = self._prepare_prompt(data, history)
+        try:
+            response = llm_pool.run_chain(chain, input=prompt['input'], context=prompt['context'])
+        except resilience.LLMUnavailable as e:
+            # คำตอบสำรองไม่เก็บลง cache และไม่นับเป็น turn ของการสนทนา
+            print(f"เรียก LLM ไม่สำเร็จ ใช้คำตอบสำรอง ({self.agent_id}): {str(e)}")
+            return self._fallback_result()
+        self._record_usage(prompt['stats'], response)
+        self._remember_turn(session_id, data, response)
         
-        return {
+        result = {
             'agent_id': self.agent_id,
             'response': response,
-            'status': 'success'
+            'status': 'success',
+            'usage': prompt['stats']
         }
+        if cache_key is not None:
+            self.response_cache.set(cache_key, result)
+        return result
         
-    def _prepare_context(self, data: Dict[str, Any]) -> str:
-        """เตรียมข้อมูล context สำหรับ prompt"""
-        context_parts = []
-        
-        # เพิ่มข้อมูลเพิ่มเติมจาก data
-        for key, value in data.items():
-            if key != 'input':
-                context_parts.append(f"{key}: {value}")
+    def stream(self, data: Dict[str, Any]) -> Iterator[str]:
+        """ประมวลผลข้อมูลแบบ streaming คืนค่าข้อความทีละส่วนตามที่ LLM สร้าง"""
+        session_id, data, history = self._split_session(data)
+        cache_key = None
+        if self.response_cache is not None:
+            cache_data = {**data, 'history': history} if history else data
+            cache_key = self.response_cache.make_key(self.agent_id, self.prompt_template, cache_data)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self._remember_turn(session_id, data, cached['response'])
+                yield cached['response']
+                return
                 
-        # เพิ่มตัวอย่างการใช้งานจาก training data
-        if self.training_data:
-            context_parts.append("\nตัวอย่างการใช้งาน:")
-            for example in self.training_data[:3]:  # แสดงแค่ 3 ตัวอย่าง
-                context_parts.append(f"Input: {example['input']}")
-                context_parts.append(f"Output: {example['output']}\n")
+        chain = llm_pool.get_chain(self.prompt_template, ["input", "context"], self.llm)
+        prompt = self._prepare_prompt(data, history)
+        parts = []
+        try:
+            for chunk in llm_pool.stream_chain(chain, input=prompt['input'], context=prompt['context']):
+                parts.append(chunk)
+                yield chunk
+        except resilience.LLMUnavailable as e:
+            print(f"เรียก LLM ไม่สำเร็จ ใช้คำตอบสำรอง ({self.agent_id}): {str(e)}")
+            yield resilience.fallback_reply()
+            return
+            
+        # เก็บเฉพาะคำตอบที่ stream จนจบ
+        self._record_usage(prompt['stats'], ''.join(parts))
+        self._remember_turn(session_id, data, ''.join(parts))
+        if cache_key is not None:
+            self.response_cache.set(cache_key, {
+                'agent_id': self.agent_id,
+                'response': ''.join(parts),
+                'status': 'success',
+                'usage': prompt['stats']
+            })
+        
+    def _fallback_result(self) -> Dict[str, Any]:
+        return {
+            'agent_id': self.agent_id,
+            'response': resilience.fallback_reply(),
+            'status': 'fallback'
+        }
+        
+    def _record_usage(self, stats: Dict[str, Any], response: str):
+        metrics.record_llm_usage(
+            str(self.agent_id), stats['prompt_tokens'], estimate_tokens(response), stats['tokens_saved']
+        )
+        
+    async def astream(self, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """stream() แบบ async iterator (เรียก LLM ใน thread แยกแล้วส่งต่อผ่าน queue)"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        done = object()
+        
+        def produce():
+            try:
+                for chunk in self.stream(data):
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
                 
-        return "\n".join(context_parts)
+        threading.Thread(target=produce, daemon=True).start()
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            
+    def _prepare_prompt(self, data: Dict[str, Any], history: Optional[str] = None) -> Dict[str, Any]:
+        """เตรียม input และ context ของ prompt ภายใต้งบ token คืนค่า {'input', 'context', 'stats'}
+
+        history = None จะอ่านประวัติการสนทนาจาก data['session_id'] (ถ้ามี)
+        """
+        if history is None:
+            _, data, history = self._split_session(data)
+        # ตัวอย่างการใช้งานจาก training data ที่คล้ายกับ input มากที่สุด
+        self._sync_example_index()
+        query = str(data.get('input', ''))
+        
+        def select_examples(budget: int) -> List[Dict[str, Any]]:
+            return self.example_index.select(
+                query,
+                k=self.examples_k,
+                token_budget=min(budget, self.examples_token_budget)
+            )
+            
+        return self.context_builder.build(self.prompt_template, data, examples=select_examples, history=history)
+        
+    def _prepare_context(self, data: Dict[str, Any]) -> str:
+        """เตรียมข้อมูล context สำหรับ prompt"""
+        return self._prepare_prompt(data)['context']
@@ -0,0 +1,25 @@
+# ประมาณจำนวน token แบบ local (ไม่ต้องเรียก tokenizer ของ OpenAI)
+# ข้อความ ASCII เฉลี่ยราว 4 ตัวอักษรต่อ token ส่วนภาษาไทยและอักษรอื่นๆ ราว 1 ตัวอักษรต่อ token
+
+ASCII_CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """ประมาณจำนวน token ของข้อความ (ปัดขึ้น)"""
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return -(-ascii_chars // ASCII_CHARS_PER_TOKEN) + other_chars
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """ตัดข้อความให้จำนวน token (โดยประมาณ) ไม่เกิน max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used = 0.0
+    for i, ch in enumerate(text):
+        used += 1.0 / ASCII_CHARS_PER_TOKEN if ord(ch) < 128 else 1.0
+        if used > max_tokens:
+            return text[:i]
+    return text
@@ -0,0 +1,144 @@
+import math
+import zlib
+import threading
+from typing import Dict, List, Tuple, Iterable
+
+import numpy as np
+
+from .routing_cache import normalize_message
+
+N_FEATURES = 1 << 20
+NGRAM_RANGE = (2, 4)
+
+
+def vectorize(text: str, ngram_range=NGRAM_RANGE, n_features: int = N_FEATURES) -> Dict[int, float]:
+    """แปลงข้อความเป็นเวกเตอร์ sparse จาก character n-gram แบบ hashing (normalize ความยาวเป็น 1)
+
+    ใช้ character n-gram เพราะภาษาไทยไม่มีการเว้นวรรคระหว่างคำ
+    """
+    text = normalize_message(text)
+    counts: Dict[int, int] = {}
+    low, high = ngram_range
+    for n in range(low, high + 1):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.isspace():
+                continue
+            feature = zlib.crc32(gram.encode('utf-8')) % n_features
+            counts[feature] = counts.get(feature, 0) + 1
+
+    # sublinear tf แล้ว normalize
+    vector = {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if norm:
+        for feature in vector:
+            vector[feature] /= norm
+    return vector
+
+
+def cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    """cosine similarity ของเวกเตอร์ที่ normalize แล้ว"""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
+
+
+class InvertedIndex:
+    """index ของเวกเตอร์ sparse สำหรับหา cosine similarity กับ query ได้เร็ว (เพิ่มทีละรายการได้)
+
+    posting ของแต่ละ feature เก็บเป็น numpy array (รายการที่เพิ่มใหม่รอรวมเข้า array ตอนค้นหาครั้งถัดไป)
+    การค้นหาหยิบ array ของ feature ใน query ภายใต้ lock แล้วรวมคะแนนด้วย bincount นอก lock
+    เอกสารที่ถูกลบถูกตัดออกตอนรวมคะแนน และ posting จะถูกกรองใหม่ทั้งหมดเมื่อมีเอกสารที่ลบแล้วค้างอยู่มากกว่าที่เหลือ
+    """
+
+    def __init__(self):
+        self._postings: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._pending: Dict[int, Tuple[List[int], List[float]]] = {}
+        self._size = 0
+        self._removed = set()
+        self._removed_ids = np.zeros(0, dtype=np.int64)
+        self._stale = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size - len(self._removed)
+
+    def add(self, vector: Dict[int, float]) -> int:
+        """เพิ่มเวกเตอร์ คืนค่า id ของเอกสาร (เรียงตามลำดับการเพิ่ม เริ่มจาก 0)"""
+        with self._lock:
+            doc_id = self._size
+            self._size += 1
+            for feature, weight in vector.items():
+                ids, weights = self._pending.setdefault(feature, ([], []))
+                ids.append(doc_id)
+                weights.append(weight)
+        return doc_id
+
+    def remove(self, doc_ids: Iterable[int]):
+        """ลบเอกสารออกจาก index"""
+        with self._lock:
+            removed = set(doc_ids) - self._removed
+            if not removed:
+                return
+            self._removed |= removed
+            self._removed_ids = np.fromiter(self._removed, dtype=np.int64, count=len(self._removed))
+            self._stale += len(removed)
+            if self._stale > len(self):
+                self._compact()
+                self._stale = 0
+
+    def _compact(self):
+        """กรอง posting ของเอกสารที่ถูกลบออกทั้งหมด (เรียกภายใต้ lock)"""
+        for feature in list(self._postings) + list(self._pending):
+            ids, weights = self._merged(feature)
+            keep = ~np.isin(ids, self._removed_ids)
+            self._pending.pop(feature, None)
+            if keep.any():
+                self._postings[feature] = (ids[keep], weights[keep])
+            else:
+                self._postings.pop(feature, None)
+
+    def _merged(self, feature: int) -> Tuple[np.ndarray, np.ndarray]:
+        """posting ของ feature ที่รวมรายการที่รออยู่แล้ว (เรียกภายใต้ lock)
+
+        สร้าง array ใหม่แทนการแก้ array เดิม ผู้ที่กำลังรวมคะแนนจาก array เดิมอยู่จึงไม่ได้รับผลกระทบ
+        """
+        pending = self._pending.pop(feature, None)
+        current = self._postings.get(feature)
+        if pending is None:
+            return current if current is not None else (_EMPTY_IDS, _EMPTY_WEIGHTS)
+        ids = np.asarray(pending[0], dtype=np.int64)
+        weights = np.asarray(pending[1], dtype=np.float64)
+        if current is not None:
+            ids = np.concatenate((current[0], ids))
+            weights = np.concatenate((current[1], weights))
+        self._postings[feature] = (ids, weights)
+        return ids, weights
+
+    def score_array(self, query: Dict[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """cosine similarity ของ query กับเอกสารที่มี feature ร่วมกัน คืนค่า (doc_ids, scores) เป็น numpy array"""
+        parts = []
+        with self._lock:
+            size = self._size
+            removed = self._removed_ids
+            for feature, weight in query.items():
+                if feature in self._postings or feature in self._pending:
+                    parts.append((self._merged(feature), weight))
+        if not parts:
+            return _EMPTY_IDS, _EMPTY_WEIGHTS
+        ids = np.concatenate([posting[0] for posting, _ in parts])
+        weights = np.concatenate([posting[1] * weight for posting, weight in parts])
+        totals = np.bincount(ids, weights=weights, minlength=size)
+        if len(removed):
+            totals[removed] = 0.0
+        doc_ids = np.flatnonzero(totals)
+        return doc_ids, totals[doc_ids]
+
+    def scores(self, query: Dict[int, float]) -> Dict[int, float]:
+        """cosine similarity ของ query กับทุกเอกสารที่มี feature ร่วมกัน"""
+        doc_ids, scores = self.score_array(query)
+        return dict(zip(doc_ids.tolist(), scores.tolist()))
+
+
+_EMPTY_IDS = np.zeros(0, dtype=np.int64)
+_EMPTY_WEIGHTS = np.zeros(0, dtype=np.float64)
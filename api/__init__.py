@@ -4,3 +4,4 @@ api = Blueprint('api', __name__)
 
 from . import webhook_routes
 from . import agent_routes
+from . import line_routes
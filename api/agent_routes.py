@@ -1,10 +1,22 @@
 from flask import request, jsonify
 from . import api
 from models import AIAgent, TrainingData
-from extensions import db
-from ai import SubAgent
+from extensions import db, read_session
+from ai import SubAgent, AgentRegistry
+from .webhook_routes import get_ai_manager
 from datetime import datetime
 
+# SubAgent ที่สร้างจากฐานข้อมูล (สร้างใน start_agent_registry)
+agent_registry = None
+
+def start_agent_registry(app):
+    """โหลด agent ทั้งหมดจากฐานข้อมูลให้ AI Manager ตอนเริ่มระบบ"""
+    global agent_registry
+    if agent_registry is None:
+        agent_registry = AgentRegistry.from_env(get_ai_manager(), app)
+        agent_registry.load_all()
+    return agent_registry
+
 @api.route('/agents', methods=['POST'])
 def create_agent():
     """สร้าง AI Sub-agent ใหม่"""
@@ -16,11 +28,15 @@ def create_agent():
         description=data.get('description', ''),
         type='sub_agent',
         project_id=data['project_id'],
-        prompt_template=data.get('prompt_template', '')
+        prompt_template=data.get('prompt_template', ''),
+        rate_limit_per_minute=data.get('rate_limit_per_minute'),
+        rate_limit_burst=data.get('rate_limit_burst')
     )
     
     db.session.add(agent)
     db.session.commit()
+    if agent_registry is not None:
+        agent_registry.agent_created(agent)
     
     return jsonify({
         'id': agent.id,
@@ -45,6 +61,8 @@ def add_training_data(agent_id):
     
     db.session.add(training)
     db.session.commit()
+    if agent_registry is not None:
+        agent_registry.training_data_added(training)
     
     return jsonify({
         'id': training.id,
@@ -59,15 +77,33 @@ def update_agent_prompt(agent_id):
     
     agent.prompt_template = data['prompt_template']
     db.session.commit()
+    if agent_registry is not None:
+        agent_registry.prompt_updated(agent)
     
     return jsonify({
         'message': 'อัพเดท prompt template สำเร็จ'
     })
 
+@api.route('/agents/<int:agent_id>/rate-limit', methods=['PUT'])
+def update_agent_rate_limit(agent_id):
+    """อัพเดทขีดจำกัดจำนวนงานต่อนาทีของ agent (null = ใช้ค่าเริ่มต้น, 0 = ไม่จำกัด)"""
+    agent = AIAgent.query.get_or_404(agent_id)
+    data = request.json
+    
+    agent.rate_limit_per_minute = data.get('rate_limit_per_minute')
+    agent.rate_limit_burst = data.get('rate_limit_burst')
+    db.session.commit()
+    if agent_registry is not None:
+        agent_registry.limits_updated(agent)
+    
+    return jsonify({
+        'message': 'อัพเดทขีดจำกัดสำเร็จ'
+    })
+
 @api.route('/agents/<int:agent_id>/training-data', methods=['GET'])
 def get_training_data(agent_id):
     """ดูข้อมูลการเทรนทั้งหมดของ agent"""
-    training_data = TrainingData.query.filter_by(agent_id=agent_id)\
+    training_data = read_session().query(TrainingData).filter_by(agent_id=agent_id)\
         .order_by(TrainingData.created_at.desc())\
         .all()
         
@@ -0,0 +1,103 @@
+from flask import request, jsonify, current_app
+from . import api
+from . import webhook_routes
+from ai.line_client import LineClient, verify_signature
+from ai import resilience
+from storage import event_key, RateLimited
+import metrics
+import json
+import threading
+
+LINE_EVENTS = metrics.REGISTRY.counter(
+    'line_events_total', 'จำนวน LINE event แยกตามผลการประมวลผล', ('result',)
+)
+
+# client ของ LINE Messaging API ที่ใช้ร่วมกันทั้ง process (สร้างเมื่อมี request แรก)
+line_client = None
+_line_client_lock = threading.Lock()
+
+def get_line_client():
+    """LineClient ที่ใช้ HTTP session ร่วมกันทุก request"""
+    global line_client
+    if line_client is None:
+        with _line_client_lock:
+            if line_client is None:
+                line_client = LineClient.from_env()
+    return line_client
+
+def _claim_events(events):
+    """คืนค่า (events ที่ต้องประมวลผล, dedup key ของแต่ละ event) ตัด event ที่เคยได้รับแล้วออก"""
+    dedup = webhook_routes.webhook_dedup
+    if dedup is None:
+        return events, [None] * len(events)
+    fresh, keys = [], []
+    for event in events:
+        key = f"line:{event_key(event)}" if event.get('webhookEventId') else None
+        if key and dedup.claim(key) is not None:
+            LINE_EVENTS.inc(result='duplicate')
+            continue
+        fresh.append(event)
+        keys.append(key)
+    return fresh, keys
+
+def _limited_events(events):
+    """event ข้อความที่เกิน LINE_RATE_LIMIT_PER_MINUTE (True = เกิน) event อื่นไม่นับ"""
+    limiter = webhook_routes.rate_limiter
+    rate = current_app.config.get('LINE_RATE_LIMIT_PER_MINUTE', 0)
+    if limiter is None or not rate:
+        return [False] * len(events)
+    manager = webhook_routes.get_ai_manager()
+    return [
+        manager.line_message_text(event) is not None and not limiter.acquire('line', rate)[0]
+        for event in events
+    ]
+
+def _dispatch(events, limited):
+    """ประมวลผล event ที่ไม่เกินขีดจำกัดพร้อมกัน event ที่เกินได้ busy_reply (LINE ไม่ต้องส่งซ้ำ)"""
+    manager = webhook_routes.get_ai_manager()
+    busy = [manager.busy_reply if manager.line_message_text(event) else None for event in events]
+    try:
+        # ทั้ง delivery นับเป็นงานที่ทำพร้อมกัน 1 งาน
+        with webhook_routes._in_flight():
+            handled = iter(manager.handle_line_events([e for e, over in zip(events, limited) if not over]))
+            return [reply if over else next(handled) for reply, over in zip(busy, limited)], limited
+    except RateLimited:
+        return busy, [reply is not None for reply in busy]
+
+@api.route('/line/webhook', methods=['POST'])
+def handle_line_webhook():
+    """รับ webhook จาก LINE Messaging API (หลาย event ต่อ request) และตอบกลับผ่าน Reply API"""
+    body = request.get_data()
+    signature = request.headers.get('X-Line-Signature')
+    if not verify_signature(body, signature, current_app.config.get('LINE_CHANNEL_SECRET')):
+        return jsonify({'error': 'Invalid signature'}), 401
+
+    try:
+        events = json.loads(body).get('events') or []
+    except (ValueError, AttributeError):
+        return jsonify({'error': 'Invalid request body'}), 400
+
+    events, keys = _claim_events(events)
+    dedup = webhook_routes.webhook_dedup
+    try:
+        limited = _limited_events(events)
+        # reply token ของ LINE หมดอายุเร็ว คำตอบทุก event ต้องเสร็จภายในเวลาของ request
+        with metrics.stage('line_dispatch'), resilience.deadline(current_app.config.get('WEBHOOK_TIME_BUDGET')):
+            replies, limited = _dispatch(events, limited)
+    except Exception:
+        for key in keys:
+            if key:
+                dedup.release(key)
+        raise
+
+    sent = get_line_client().reply_many([
+        (event.get('replyToken'), reply) for event, reply in zip(events, replies) if reply is not None
+    ])
+    for key, reply in zip(keys, replies):
+        if key:
+            dedup.complete(key, {'reply': reply}, 200)
+    for reply, over in zip(replies, limited):
+        LINE_EVENTS.inc(result='limited' if over else 'replied' if reply is not None else 'skipped')
+
+    # LINE ต้องการ 200 เสมอเมื่อรับ event แล้ว (ไม่เช่นนั้นจะส่งซ้ำ)
+    return jsonify({'status': 'success', 'events': len(events), 'replied': sent})
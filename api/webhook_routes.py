@@ -1,65 +1,578 @@
-from flask import request, jsonify
+from flask import request, jsonify, current_app, Response, stream_with_context
 from . import api
 from models import Webhook, WebhookLog
-from extensions import db
+from extensions import db, read_session
 from ai import AIManager
-from datetime import datetime
+from ai import resilience
+from config import Config
+from storage import WebhookRegistry, JobQueue, QueueFull, RetryLater, WorkerPool, BatchWriter, Deduplicator, event_key
+from storage import RateLimiter, RateLimited
+from storage.dedup import STATE_DONE
+import metrics
+from sqlalchemy import and_, or_, func, case
+from datetime import datetime, timezone
+import atexit
+import base64
+import json
+import math
+import threading
+from contextlib import nullcontext
 
-ai_manager = AIManager()
+# สร้างเมื่อเรียก get_ai_manager() ครั้งแรก (ใน create_app หรือ request แรก) ไม่ใช่ตอน import
+ai_manager = None
+_ai_manager_lock = threading.Lock()
+
+def get_ai_manager():
+    """AI Manager ที่ใช้ร่วมกันทั้ง process"""
+    global ai_manager
+    if ai_manager is None:
+        with _ai_manager_lock:
+            if ai_manager is None:
+                ai_manager = AIManager()
+    return ai_manager
+
+# จำนวน log ต่อหน้า และจำนวนแถวที่ดึงจากฐานข้อมูลต่อรอบเมื่อส่งออกแบบ NDJSON
+LOGS_PAGE_SIZE = 100
+LOGS_MAX_PAGE_SIZE = 1000
+LOGS_STREAM_BATCH = 500
+
+def _load_db_webhooks():
+    """โหลด webhook ทั้งหมดจากฐานข้อมูลเป็น dict"""
+    return [{
+        'id': webhook.id,
+        'url_path': webhook.url_path,
+        'agent_id': webhook.agent_id,
+        'is_active': webhook.is_active,
+        'secret_key': webhook.secret_key,
+        'rate_limit_per_minute': webhook.rate_limit_per_minute,
+        'rate_limit_burst': webhook.rate_limit_burst
+    } for webhook in Webhook.query.all()]
+
+def _db_webhooks_version():
+    """version ของตาราง webhooks (query aggregate เดียว ไม่ต้องโหลดทุกแถว)
+
+    จำนวนแถวและ id สูงสุดเปลี่ยนเมื่อเพิ่ม/ลบ updated_at เปลี่ยนเมื่อแก้ผ่าน ORM
+    และจำนวนที่เปิดใช้อยู่เปลี่ยนเมื่อเปิด/ปิด webhook แม้แก้ด้วย SQL ตรง ๆ
+    """
+    row = db.session.query(
+        func.count(Webhook.id),
+        func.max(Webhook.id),
+        func.max(Webhook.updated_at),
+        func.sum(case((Webhook.is_active == True, 1), else_=0))
+    ).one()
+    return tuple(row)
+
+# ดัชนี webhook ในหน่วยความจำ ตรวจ version ทุก WEBHOOK_REGISTRY_REFRESH วินาทีและโหลดใหม่ทั้งหมดเฉพาะเมื่อเปลี่ยน
+# โค้ดที่แก้ตาราง webhooks ใน process นี้ควรเรียก webhook_registry.invalidate() เพื่อให้เห็นผลทันที
+webhook_registry = WebhookRegistry(
+    loader=_load_db_webhooks,
+    version=_db_webhooks_version,
+    check_interval=Config.WEBHOOK_REGISTRY_REFRESH
+)
+
+# คิวและ worker สำหรับโหมด async (สร้างใน start_webhook_workers)
+webhook_queue = None
+webhook_workers = None
+
+# ตัวเขียน WebhookLog แบบเป็นชุด (สร้างใน start_log_writer)
+log_writer = None
+
+def _insert_logs(app, rows):
+    """เขียน WebhookLog หลายแถวด้วย INSERT เดียวและ commit ครั้งเดียว"""
+    with app.app_context(), metrics.stage('log_flush'):
+        db.session.execute(WebhookLog.__table__.insert(), rows)
+        db.session.commit()
+
+def start_log_writer(app):
+    """เริ่มตัวเขียน WebhookLog เบื้องหลัง (group commit) และ flush ตอนปิดโปรแกรม"""
+    global log_writer
+    if log_writer is not None:
+        return log_writer
+    log_writer = BatchWriter(
+        lambda rows: _insert_logs(app, rows),
+        max_batch=app.config['WEBHOOK_LOG_WRITER_BATCH_SIZE'],
+        flush_interval=app.config['WEBHOOK_LOG_WRITER_FLUSH_INTERVAL'],
+        max_buffer=app.config['WEBHOOK_LOG_WRITER_BUFFER_SIZE'],
+        overflow=app.config['WEBHOOK_LOG_WRITER_OVERFLOW'],
+        name='webhook-log-writer'
+    )
+    log_writer.start()
+    atexit.register(log_writer.stop)
+    
+    # สถานะของตัวเขียนใน /metrics
+    metrics.REGISTRY.gauge(
+        'webhook_log_writer_buffered', 'จำนวน WebhookLog ที่รอเขียน'
+    ).set_function(lambda: log_writer.stats()['buffered'])
+    rows_total = metrics.REGISTRY.counter(
+        'webhook_log_writer_rows_total', 'จำนวน WebhookLog แยกตามผลการเขียน', ('result',)
+    )
+    for result in ('written', 'dropped', 'failed'):
+        rows_total.set_function(lambda result=result: log_writer.stats()[result], result=result)
+    return log_writer
+
+def _save_log(**fields):
+    """บันทึก WebhookLog (ผ่านตัวเขียนเบื้องหลังถ้าเปิดใช้ ไม่เช่นนั้นเขียนทันที)"""
+    fields.setdefault('created_at', datetime.utcnow())
+    fields.setdefault('trace_id', metrics.current_trace_id())
+    if log_writer is not None and log_writer.running:
+        log_writer.submit(fields)
+        return
+    with metrics.stage('db_commit'):
+        db.session.add(WebhookLog(**fields))
+        db.session.commit()
+
+# ตัวตรวจ webhook ที่ถูกส่งซ้ำ (สร้างใน start_webhook_dedup)
+webhook_dedup = None
+
+def start_webhook_dedup(app):
+    """สร้างตัวตรวจ event ซ้ำที่ทุก worker process ใช้ไฟล์ SQLite ร่วมกัน"""
+    global webhook_dedup
+    if webhook_dedup is not None:
+        return webhook_dedup
+    webhook_dedup = Deduplicator(
+        app.config['WEBHOOK_DEDUP_PATH'],
+        window=app.config['WEBHOOK_DEDUP_WINDOW'],
+        pending_timeout=app.config['WEBHOOK_DEDUP_PENDING_TIMEOUT'],
+        cache_size=app.config['WEBHOOK_DEDUP_CACHE_SIZE'],
+        hash_window=app.config['WEBHOOK_DEDUP_HASH_WINDOW']
+    )
+    
+    # จำนวน event ใหม่/ซ้ำใน /metrics
+    events_total = metrics.REGISTRY.counter(
+        'webhook_dedup_total', 'จำนวน webhook event แยกตามผลการตรวจซ้ำ', ('result',)
+    )
+    events_total.set_function(lambda: webhook_dedup.stats()['new'], result='new')
+    events_total.set_function(lambda: webhook_dedup.stats()['duplicates'], result='duplicate')
+    return webhook_dedup
+
+# ขีดจำกัดต่อ webhook / agent และจำนวนงานพร้อมกัน (สร้างใน start_rate_limiter)
+rate_limiter = None
+
+def start_rate_limiter(app):
+    """สร้าง admission control ที่ทุก worker process ใช้ไฟล์ SQLite ร่วมกัน และตรวจ agent ก่อนส่งงานทุกครั้ง"""
+    global rate_limiter
+    if rate_limiter is not None:
+        return rate_limiter
+    rate_limiter = RateLimiter(
+        app.config['RATE_LIMIT_PATH'],
+        max_in_flight=app.config['WEBHOOK_MAX_IN_FLIGHT'],
+        lease_timeout=app.config['WEBHOOK_IN_FLIGHT_LEASE']
+    )
+    default_rate = app.config['AGENT_RATE_LIMIT_PER_MINUTE']
+    
+    def admit_agent(agent):
+        rate = getattr(agent, 'rate_limit_per_minute', None)
+        rate_limiter.check(
+            f'agent:{agent.agent_id}',
+            default_rate if rate is None else rate,
+            getattr(agent, 'rate_limit_burst', None)
+        )
+        
+    get_ai_manager().admission = admit_agent
+    get_ai_manager().admission_errors = (RateLimited,)
+    
+    # ผลของ admission control ใน /metrics
+    decisions = metrics.REGISTRY.counter(
+        'rate_limit_decisions_total', 'จำนวนการตรวจขีดจำกัดแยกตามผล', ('result',)
+    )
+    for result in ('allowed', 'limited', 'deferred'):
+        decisions.set_function(lambda result=result: rate_limiter.stats()[result], result=result)
+    if rate_limiter.max_in_flight:
+        metrics.REGISTRY.gauge(
+            'webhook_in_flight', 'จำนวน webhook ที่กำลังประมวลผลทุก worker'
+        ).set_function(rate_limiter.in_flight_count)
+    return rate_limiter
+
+def _webhook_rate(webhook):
+    """(rate_limit_per_minute, burst) ของ webhook (ใช้ค่าเริ่มต้นถ้าไม่ได้กำหนดใน record)"""
+    rate = webhook.get('rate_limit_per_minute')
+    if rate is None:
+        rate = current_app.config.get('WEBHOOK_RATE_LIMIT_PER_MINUTE', 0)
+    return rate, webhook.get('rate_limit_burst')
+
+def _in_flight():
+    return rate_limiter.in_flight() if rate_limiter is not None else nullcontext()
+
+def _rate_limited_response(error):
+    """429 พร้อม Retry-After"""
+    retry_after = max(1, math.ceil(error.retry_after))
+    response = jsonify({'error': str(error), 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def _duplicate_response(record):
+    """response ของ event ที่ถูกส่งซ้ำ (ผลครั้งแรก หรือ 409 ถ้าครั้งแรกยังประมวลผลไม่เสร็จ)"""
+    if record['state'] != STATE_DONE:
+        response = jsonify({'status': 'processing'})
+        response.status_code = 409
+        response.headers['Retry-After'] = '1'
+    else:
+        response = jsonify(record['response'])
+        response.status_code = record['status_code']
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _session_key(webhook, session_id):
+    """key ของประวัติการสนทนา แยกตาม webhook (ผู้เรียก webhook หนึ่งอ่านประวัติของ webhook อื่นหรือของ LINE ไม่ได้)"""
+    if session_id is None or session_id == '':
+        return None
+    return f"webhook:{webhook['id']}:{session_id}"
+
+def _visibility_timeout(config):
+    """เวลาที่งานในคิวถูกจองไว้ ต้องนานกว่างานที่ช้าที่สุด (timeout / retry / hedge ของ LLM อยู่ใน WEBHOOK_TIME_BUDGET)"""
+    if config.get('WEBHOOK_QUEUE_VISIBILITY_TIMEOUT'):
+        return config['WEBHOOK_QUEUE_VISIBILITY_TIMEOUT']
+    budget = config.get('WEBHOOK_TIME_BUDGET')
+    return budget * 2 + 30 if budget else 300.0
+
+def _process_queued_webhook(app, payload):
+    """ประมวลผล webhook ที่อยู่ในคิวและบันทึกผลลง WebhookLog"""
+    with app.app_context():
+        trace_id = metrics.set_trace_id(payload.get('trace_id'))
+        try:
+            with _in_flight(), resilience.deadline(app.config.get('WEBHOOK_TIME_BUDGET')):
+                result = get_ai_manager().process_webhook(payload['event'])
+        except RateLimited as e:
+            # เกินขีดจำกัดของ agent หรือจำนวนงานพร้อมกัน เลื่อนงานเดิมออกไปแทนการนับเป็นความล้มเหลว
+            raise RetryLater(str(e), delay=max(e.retry_after, 0.1))
+        _save_log(
+            webhook_id=payload['webhook_id'],
+            request_data=payload['event']['data'],
+            response_data=result,
+            status_code=200,
+            trace_id=trace_id
+        )
+
+def _record_dead_webhook(app, payload, error):
+    """บันทึก WebhookLog ของงานที่ลองใหม่ครบแล้วยังล้มเหลว"""
+    with app.app_context():
+        _save_log(
+            webhook_id=payload['webhook_id'],
+            request_data=payload['event']['data'],
+            response_data={'error': error},
+            status_code=500,
+            trace_id=payload.get('trace_id')
+        )
+
+def start_webhook_workers(app):
+    """สร้างคิวและเริ่ม worker pool สำหรับประมวลผล webhook แบบ async"""
+    global webhook_queue, webhook_workers
+    if webhook_workers is not None:
+        return webhook_workers
+    webhook_queue = JobQueue(
+        app.config['WEBHOOK_QUEUE_PATH'],
+        max_depth=app.config['WEBHOOK_QUEUE_MAX_DEPTH'],
+        max_attempts=app.config['WEBHOOK_QUEUE_MAX_ATTEMPTS'],
+        backoff_base=app.config['WEBHOOK_QUEUE_BACKOFF'],
+        visibility_timeout=_visibility_timeout(app.config)
+    )
+    webhook_workers = WorkerPool(
+        webhook_queue,
+        handler=lambda payload: _process_queued_webhook(app, payload),
+        on_dead=lambda payload, error: _record_dead_webhook(app, payload, error),
+        size=app.config['WEBHOOK_WORKERS'],
+        name='webhook-worker'
+    )
+    webhook_workers.start()
+    
+    # ความยาวคิวใน /metrics
+    queue_jobs = metrics.REGISTRY.gauge('webhook_queue_jobs', 'จำนวนงานในคิว webhook แยกตามสถานะ', ('state',))
+    for state in ('pending', 'running', 'dead'):
+        queue_jobs.set_function(lambda state=state: webhook_queue.stats()[state], state=state)
+    return webhook_workers
 
 @api.route('/webhook/<path:url_path>', methods=['POST'])
 def handle_webhook(url_path):
     """จัดการ request ที่เข้ามาทาง webhook"""
     # ค้นหา webhook จาก url_path
-    webhook = Webhook.query.filter_by(url_path=url_path, is_active=True).first()
-    if not webhook:
+    webhook = webhook_registry.get_by_path(url_path)
+    if not webhook or not webhook['is_active']:
         return jsonify({'error': 'Webhook not found'}), 404
         
     # ตรวจสอบ secret key
-    if webhook.secret_key != request.headers.get('X-Webhook-Secret'):
+    if webhook['secret_key'] != request.headers.get('X-Webhook-Secret'):
         return jsonify({'error': 'Invalid secret key'}), 401
         
-    # บันทึก webhook log
-    log = WebhookLog(
-        webhook_id=webhook.id,
-        request_data=request.json,
-        status_code=200
-    )
+    # event ที่เคยได้รับแล้ว (ผู้ส่ง retry) ตอบด้วยผลครั้งแรกโดยไม่ประมวลผลซ้ำ
+    key = None
+    if webhook_dedup is not None:
+        key = event_key(request.json, request.headers, current_app.config['WEBHOOK_DEDUP_HASH_PAYLOAD'])
+    dedup_key = f"{webhook['id']}:{key}" if key else None
+    if dedup_key:
+        with metrics.stage('dedup'):
+            previous = webhook_dedup.claim(dedup_key, wait=current_app.config['WEBHOOK_DEDUP_WAIT'])
+        if previous is not None:
+            return _duplicate_response(previous)
+            
+    # admission control: token bucket ของ webhook นี้ (โหมด async เลื่อนงานในคิวได้ถ้า RATE_LIMIT_ACTION=defer)
+    defer = 0.0
+    if rate_limiter is not None:
+        rate, burst = _webhook_rate(webhook)
+        max_delay = 0.0
+        if current_app.config.get('RATE_LIMIT_ACTION') == 'defer' and webhook_queue is not None:
+            max_delay = current_app.config['RATE_LIMIT_MAX_DEFER']
+        allowed, defer = rate_limiter.acquire(f"webhook:{webhook['id']}", rate, burst, max_delay=max_delay)
+        if not allowed:
+            if dedup_key:
+                webhook_dedup.release(dedup_key)
+            return _rate_limited_response(RateLimited(
+                f'เกินขีดจำกัด {rate} ครั้งต่อนาทีของ webhook นี้', retry_after=defer
+            ))
+        
+    event = {
+        'agent_id': webhook['agent_id'],
+        'message': request.json.get('message', ''),
+        'session_id': _session_key(webhook, request.json.get('session_id')),
+        'data': request.json
+    }
     
+    # โหมด async: เก็บลงคิวแล้วตอบกลับทันที worker จะประมวลผลและบันทึก log ภายหลัง
+    if current_app.config.get('WEBHOOK_INGEST_MODE') == 'async' and webhook_queue is not None:
+        try:
+            with metrics.stage('enqueue'):
+                job_id = webhook_queue.put({
+                    'webhook_id': webhook['id'],
+                    'event': event,
+                    'trace_id': metrics.current_trace_id()
+                }, delay=defer)
+        except QueueFull as e:
+            if dedup_key:
+                webhook_dedup.release(dedup_key)
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        webhook_workers.notify()
+        body = {'status': 'queued', 'job_id': job_id}
+        if defer:
+            body['deferred_seconds'] = round(defer, 3)
+        if dedup_key:
+            webhook_dedup.complete(dedup_key, body, 202)
+        return jsonify(body), 202
+        
     try:
-        # ประมวลผลข้อมูลผ่าน AI Manager
-        result = ai_manager.process_webhook({
-            'agent_id': webhook.agent_id,
-            'message': request.json.get('message', ''),
-            'data': request.json
-        })
-        
-        # บันทึกผลลัพธ์
-        log.response_data = result
-        db.session.add(log)
-        db.session.commit()
+        # ประมวลผลข้อมูลผ่าน AI Manager (นับเป็นงานที่ทำพร้อมกัน 1 งาน)
+        with _in_flight(), resilience.deadline(current_app.config.get('WEBHOOK_TIME_BUDGET')):
+            result = get_ai_manager().process_webhook(event)
+        
+        # บันทึก webhook log พร้อมผลลัพธ์
+        _save_log(
+            webhook_id=webhook['id'],
+            request_data=request.json,
+            response_data=result,
+            status_code=200
+        )
+        if dedup_key:
+            webhook_dedup.complete(dedup_key, result, 200)
         
         return jsonify(result)
         
+    except RateLimited as e:
+        if dedup_key:
+            webhook_dedup.release(dedup_key)
+        return _rate_limited_response(e)
+        
     except Exception as e:
-        log.status_code = 500
-        log.response_data = {'error': str(e)}
-        db.session.add(log)
-        db.session.commit()
+        # ไม่เก็บผลที่ล้มเหลว ให้การส่งซ้ำครั้งถัดไปประมวลผลใหม่
+        if dedup_key:
+            webhook_dedup.release(dedup_key)
+        _save_log(
+            webhook_id=webhook['id'],
+            request_data=request.json,
+            response_data={'error': str(e)},
+            status_code=500
+        )
         return jsonify({'error': str(e)}), 500
         
-@api.route('/webhook/logs/<int:webhook_id>', methods=['GET'])
-def get_webhook_logs(webhook_id):
-    """ดูประวัติการเรียกใช้ webhook"""
-    logs = WebhookLog.query.filter_by(webhook_id=webhook_id)\
-        .order_by(WebhookLog.created_at.desc())\
-        .limit(100)\
-        .all()
+@api.route('/stream/webhook/<path:url_path>', methods=['POST'])
+def stream_webhook(url_path):
+    """จัดการ webhook แบบ streaming ส่งคำตอบกลับเป็น Server-Sent Events ทีละส่วน"""
+    webhook = webhook_registry.get_by_path(url_path)
+    if not webhook or not webhook['is_active']:
+        return jsonify({'error': 'Webhook not found'}), 404
+        
+    if webhook['secret_key'] != request.headers.get('X-Webhook-Secret'):
+        return jsonify({'error': 'Invalid secret key'}), 401
+        
+    # stream นับเป็นงานที่ทำพร้อมกัน 1 งานจนกว่า response จะปิด (รวมกรณี client ตัดการเชื่อมต่อ)
+    lease = ''
+    if rate_limiter is not None:
+        try:
+            rate_limiter.check(f"webhook:{webhook['id']}", *_webhook_rate(webhook))
+        except RateLimited as e:
+            return _rate_limited_response(e)
+        lease = rate_limiter.enter()
+        if lease is None:
+            return _rate_limited_response(RateLimited('มีงานที่กำลังประมวลผลครบแล้ว', retry_after=1.0))
+            
+    request_data = request.json
+    event = {
+        'agent_id': webhook['agent_id'],
+        'message': request_data.get('message', ''),
+        'session_id': _session_key(webhook, request_data.get('session_id')),
+        'data': request_data
+    }
+    
+    log = {
+        'webhook_id': webhook['id'],
+        'request_data': request_data,
+        'response_data': None,
+        'status_code': 200,
+        'trace_id': metrics.current_trace_id()
+    }
+    
+    # เลือก Sub-agent และตรวจขีดจำกัดของ agent ก่อนเริ่ม stream เพื่อให้ตอบ 429 ได้
+    end = resilience.deadline_end(current_app.config.get('WEBHOOK_TIME_BUDGET'))
+    items = get_ai_manager().stream_webhook(event)
+    first, first_error = None, None
+    try:
+        with resilience.until(end):
+            first = next(items)
+    except RateLimited as e:
+        _leave(lease)
+        return _rate_limited_response(e)
+    except Exception as e:
+        first_error = e
         
-    return jsonify([{
+    def next_item():
+        # deadline ตั้งเฉพาะระหว่างรอ item ถัดไป (ไม่คร่อม yield ของ generator)
+        with resilience.until(end):
+            return next(items, None)
+            
+    def generate():
+        parts = []
+        item = first
+        try:
+            if first_error is not None:
+                raise first_error
+            while item is not None:
+                if item['type'] == 'token':
+                    parts.append(item['text'])
+                    yield f"data: {json.dumps(item['text'], ensure_ascii=False)}\n\n"
+                elif item['type'] == 'agent':
+                    yield f"event: agent\ndata: {json.dumps(item['agent_id'])}\n\n"
+                else:
+                    log['response_data'] = item['result']
+                    yield f"event: done\ndata: {json.dumps(item['result'], ensure_ascii=False)}\n\n"
+                item = next_item()
+        except Exception as e:
+            log['status_code'] = 500
+            log['response_data'] = {'error': str(e)}
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+        finally:
+            items.close()
+            _leave(lease)
+            # บันทึกข้อความทั้งหมดเมื่อ stream จบ (รวมกรณี client ตัดการเชื่อมต่อ)
+            if log['response_data'] is None:
+                log['response_data'] = {'status': 'incomplete', 'data': {'response': ''.join(parts)}}
+            _save_log(**log)
+            
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # กรณี stream ไม่เคยเริ่ม (client ตัดก่อน) generate ไม่ได้ทำงาน คืนช่องเมื่อ response ปิด
+    response.call_on_close(lambda: _leave(lease))
+    return response
+    
+def _leave(lease):
+    """คืนช่องงานพร้อมกันที่จองไว้ด้วย rate_limiter.enter()"""
+    if rate_limiter is not None:
+        rate_limiter.leave(lease)
+        
+def _parse_time_arg(name):
+    """อ่านเวลาแบบ ISO 8601 จาก query string (คืนค่า None ถ้าไม่ได้ระบุ)
+
+    WebhookLog.created_at เป็นเวลา UTC แบบไม่มี timezone เวลาที่ระบุ offset จึงถูกแปลงเป็น UTC ก่อนเทียบ
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    except ValueError:
+        raise ValueError(f'รูปแบบเวลาของ {name} ไม่ถูกต้อง: {value}')
+
+def _encode_cursor(log):
+    """cursor ของหน้าถัดไป (created_at และ id ของแถวสุดท้าย)"""
+    raw = f"{log.created_at.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    try:
+        created_at, log_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(log_id)
+    except (ValueError, UnicodeError):
+        raise ValueError('cursor ไม่ถูกต้อง')
+
+def _serialize_log(log):
+    return {
         'id': log.id,
         'request_data': log.request_data,
         'response_data': log.response_data,
         'status_code': log.status_code,
+        'trace_id': log.trace_id,
         'created_at': log.created_at.isoformat()
-    } for log in logs])
+    }
+
+@api.route('/webhook/logs/<int:webhook_id>', methods=['GET'])
+def get_webhook_logs(webhook_id):
+    """ดูประวัติการเรียกใช้ webhook (ใหม่ไปเก่า)
+
+    query string: cursor, limit, since, until, status_code และ format=ndjson สำหรับส่งออกแบบ stream
+    cursor ของหน้าถัดไปอยู่ใน header X-Next-Cursor
+    """
+    try:
+        since = _parse_time_arg('since')
+        until = _parse_time_arg('until')
+        cursor = request.args.get('cursor')
+        cursor = _decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    # keyset pagination บน index (webhook_id, created_at) ไม่ต้องใช้ OFFSET (อ่านจาก replica ถ้ามี)
+    query = read_session().query(WebhookLog).filter(WebhookLog.webhook_id == webhook_id)
+    if since:
+        query = query.filter(WebhookLog.created_at >= since)
+    if until:
+        query = query.filter(WebhookLog.created_at <= until)
+    status_code = request.args.get('status_code', type=int)
+    if status_code is not None:
+        query = query.filter(WebhookLog.status_code == status_code)
+    if cursor:
+        created_at, log_id = cursor
+        query = query.filter(or_(
+            WebhookLog.created_at < created_at,
+            and_(WebhookLog.created_at == created_at, WebhookLog.id < log_id)
+        ))
+    query = query.order_by(WebhookLog.created_at.desc(), WebhookLog.id.desc())
+    
+    # ส่งออกแบบ NDJSON: ดึงจากฐานข้อมูลทีละชุดและส่งออกทันที
+    if request.args.get('format') == 'ndjson':
+        limit = request.args.get('limit', type=int)
+        if limit:
+            query = query.limit(limit)
+            
+        def generate():
+            for log in query.yield_per(LOGS_STREAM_BATCH):
+                yield json.dumps(_serialize_log(log), ensure_ascii=False) + '\n'
+                
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    limit = max(1, min(request.args.get('limit', LOGS_PAGE_SIZE, type=int), LOGS_MAX_PAGE_SIZE))
+    logs = query.limit(limit + 1).all()
+    response = jsonify([_serialize_log(log) for log in logs[:limit]])
+    if len(logs) > limit:
+        response.headers['X-Next-Cursor'] = _encode_cursor(logs[limit - 1])
+    return response
+
+@api.route('/webhook/queue/stats', methods=['GET'])
+def get_webhook_queue_stats():
+    """ดูสถานะคิว webhook (จำนวนงานค้าง, worker, งานที่ล้มเหลว)"""
+    if webhook_workers is None:
+        return jsonify({'mode': current_app.config.get('WEBHOOK_INGEST_MODE', 'sync')})
+    return jsonify({'mode': 'async', **webhook_workers.stats()})
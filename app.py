@@ -1,19 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
 from datetime import datetime
 import uuid
 from urllib.parse import urljoin
 import os
 import json
-from pyngrok import ngrok
+from itertools import islice
 import secrets
+from config import Config
+from storage import LogStore, SharedState, Deduplicator, create_data_store, event_key
+from storage.dedup import STATE_DONE
+from metrics import init_metrics, current_trace_id
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
+# /metrics (Prometheus) และ trace id ของแต่ละ request
+init_metrics(app)
+
+# ngrok URL (เปิด tunnel เฉพาะตอนรัน app.py โดยตรง ไม่ใช่ตอน import)
+ngrok_url = None
+
 # ตั้งค่า ngrok
 def setup_ngrok():
     """ตั้งค่า ngrok สำหรับทดสอบ webhook"""
     try:
+        from pyngrok import ngrok
+        
         # เปิด tunnel ไปที่ port 5000
         public_url = ngrok.connect(5000).public_url
         print(f"\n🌐 HTTPS URL สำหรับ Line Webhook: {public_url}\n")
@@ -22,17 +34,6 @@ def setup_ngrok():
         print(f"⚠️ ไม่สามารถเชื่อมต่อ ngrok ได้: {str(e)}")
         return None
 
-# เริ่มต้น ngrok เมื่อรันในโหมด debug
-if app.debug:
-    ngrok_url = setup_ngrok()
-    if ngrok_url:
-        print("✨ คำแนะนำการตั้งค่า Line Webhook:")
-        print("1. ไปที่ Line Developer Console")
-        print("2. เลือก Channel ที่ต้องการ")
-        print("3. ไปที่ Messaging API > Webhook settings")
-        print(f"4. วาง URL นี้: {ngrok_url}/webhook/<your-path>")
-        print("5. กด Verify และ Update")
-
 # นำเข้าโมเดลหลังจากสร้าง app
 from models.webhook import Webhook, WebhookLog
 from models.agent import Agent
@@ -44,6 +45,23 @@ AGENTS_FILE = os.path.join(DATA_DIR, 'agents.json')
 WEBHOOKS_FILE = os.path.join(DATA_DIR, 'webhooks.json')
 TRAINING_DATA_FILE = os.path.join(DATA_DIR, 'training_data.json')
 
+# ที่เก็บ webhook logs แบบ append-only (แยก segment ตาม webhook)
+log_store = LogStore(
+    Config.WEBHOOK_LOG_DIR,
+    segment_max_bytes=Config.WEBHOOK_LOG_SEGMENT_BYTES,
+    fsync=Config.WEBHOOK_LOG_FSYNC,
+    fsync_interval=Config.WEBHOOK_LOG_FSYNC_INTERVAL
+)
+
+# จำนวน log ต่อหน้าของ /webhook/logs
+LOGS_PAGE_SIZE = 100
+LOGS_MAX_PAGE_SIZE = 1000
+
+def webhook_log_store(webhook_id):
+    """คืนค่า log store ของ webhook พร้อมย้าย log จากไฟล์ JSON แบบเดิม (ครั้งแรกเท่านั้น)"""
+    log_store.migrate_legacy(webhook_id, os.path.join(DATA_DIR, f"webhook_logs_{webhook_id}.json"))
+    return log_store
+
 # ฟังก์ชันสำหรับโหลดข้อมูล
 def load_data(file_path, default=None):
     """โหลดข้อมูลจากไฟล์ JSON"""
@@ -74,6 +92,26 @@ def save_data(file_path, data):
         print(f"เกิดข้อผิดพลาดในการบันทึกข้อมูลไปที่ {file_path}: {str(e)}")
         return False
 
+# ที่เก็บข้อมูล agents / webhooks (sqlite หรือ json ตาม DATA_BACKEND)
+data_store = create_data_store(Config.DATA_BACKEND, DATA_DIR, Config.DATA_DB_PATH)
+
+# snapshot ของ agents / webhooks / training data ในหน่วยความจำของ process นี้
+# อัพเดทเฉพาะแถวที่เปลี่ยนเมื่อ worker ใดก็ได้เขียนข้อมูล (ตรวจทุก SHARED_STATE_POLL_INTERVAL วินาที)
+shared_state = SharedState(
+    data_store,
+    poll_interval=Config.SHARED_STATE_POLL_INTERVAL,
+    keep_changes=Config.SHARED_STATE_KEEP_CHANGES
+)
+
+# ตัวตรวจ webhook event ที่ถูกส่งซ้ำ ใช้ไฟล์ SQLite ร่วมกันทุก worker process
+webhook_dedup = Deduplicator(
+    Config.WEBHOOK_DEDUP_PATH,
+    window=Config.WEBHOOK_DEDUP_WINDOW,
+    pending_timeout=Config.WEBHOOK_DEDUP_PENDING_TIMEOUT,
+    cache_size=Config.WEBHOOK_DEDUP_CACHE_SIZE,
+    hash_window=Config.WEBHOOK_DEDUP_HASH_WINDOW
+) if Config.WEBHOOK_DEDUP_ENABLED else None
+
 # โหลดข้อมูลเมื่อเริ่มต้นแอพ
 def init_data():
     """เตรียมข้อมูลเริ่มต้น"""
@@ -81,40 +119,44 @@ def init_data():
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
     
-    # โหลดข้อมูล agents
-    global agents
-    agents = load_data(AGENTS_FILE, [])
-    
-    # โหลดข้อมูล webhooks
-    global webhooks
-    webhooks = load_data(WEBHOOKS_FILE, [])
-    
-    # โหลดข้อมูล training data
-    global training_data
-    training_data = load_data(TRAINING_DATA_FILE, [])
+    # โหลด agents, webhooks และ training data เข้า snapshot
+    shared_state.reload()
 
 # เรียกใช้ฟังก์ชันเตรียมข้อมูลเมื่อเริ่มต้นแอพ
 init_data()
 
 def load_agents():
-    """โหลดข้อมูล agents จากไฟล์"""
-    return agents
+    """โหลดข้อมูล agents ทั้งหมด (จาก snapshot ห้ามแก้ไข dict ที่ได้)"""
+    return shared_state.list_agents()
 
 def save_agents(agents_data):
-    """บันทึกข้อมูล agents ลงไฟล์"""
-    global agents
-    agents = agents_data
-    return save_data(AGENTS_FILE, agents)
+    """บันทึกข้อมูล agents ทั้งหมด (แทนที่ของเดิม)"""
+    try:
+        data_store.replace_agents(agents_data)
+        shared_state.refresh(force=True)
+        return True
+    except Exception as e:
+        print(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล agents: {str(e)}")
+        return False
 
 def load_webhooks():
     """โหลดข้อมูล webhooks"""
-    return webhooks
+    return shared_state.list_webhooks()
+
+def save_webhook(webhook):
+    """บันทึก webhook หนึ่งตัว (แก้ไขเฉพาะแถวนั้น) และอัพเดท snapshot"""
+    data_store.upsert_webhook(webhook)
+    shared_state.refresh(force=True)
 
 def save_webhooks(webhooks_data):
-    """บันทึกข้อมูล webhooks"""
-    global webhooks
-    webhooks = webhooks_data
-    return save_data(WEBHOOKS_FILE, webhooks)
+    """บันทึกข้อมูล webhooks ทั้งหมด (แทนที่ของเดิม)"""
+    try:
+        data_store.replace_webhooks(webhooks_data)
+        shared_state.refresh(force=True)
+        return True
+    except Exception as e:
+        print(f"เกิดข้อผิดพลาดในการบันทึกข้อมูล webhooks: {str(e)}")
+        return False
 
 # Error handlers
 @app.errorhandler(404)
@@ -154,16 +196,12 @@ def new_agent():
     """สร้าง AI Agent ใหม่"""
     if request.method == 'POST':
         try:
-            agents_data = load_agents()
-            new_id = len(agents_data) + 1
-            agent = {
-                'id': new_id,
+            data_store.insert_agent({
                 'name': request.form['name'],
                 'description': request.form['description'],
                 'type': request.form['type']
-            }
-            agents_data.append(agent)
-            save_agents(agents_data)
+            })
+            shared_state.refresh(force=True)
             flash('สร้าง Agent สำเร็จ', 'success')
             return redirect(url_for('agents'))
         except Exception as e:
@@ -177,8 +215,7 @@ def new_agent():
 def edit_agent(id):
     """แก้ไขข้อมูล AI Agent"""
     try:
-        agents_data = load_agents()
-        agent = next((a for a in agents_data if a['id'] == id), None)
+        agent = data_store.get_agent(id)
         
         if agent is None:
             flash('ไม่พบ Agent ที่ต้องการแก้ไข', 'error')
@@ -190,7 +227,8 @@ def edit_agent(id):
                 'description': request.form['description'],
                 'type': request.form['type']
             })
-            save_agents(agents_data)
+            data_store.update_agent(agent)
+            shared_state.refresh(force=True)
             flash('แก้ไข Agent สำเร็จ', 'success')
             return redirect(url_for('agents'))
         
@@ -204,9 +242,8 @@ def edit_agent(id):
 def delete_agent(id):
     """ลบ AI Agent"""
     try:
-        agents_data = load_agents()
-        agents_data = [a for a in agents_data if a['id'] != id]
-        save_agents(agents_data)
+        data_store.delete_agent(id)
+        shared_state.refresh(force=True)
         flash('ลบ Agent สำเร็จ', 'success')
         return jsonify({'success': True})
     except Exception as e:
@@ -235,8 +272,7 @@ def new_webhook(id):
             }
             
             # เพิ่ม webhook ใหม่
-            webhooks.append(webhook)
-            save_webhooks(webhooks)
+            save_webhook(webhook)
             
             flash('สร้าง Webhook สำเร็จ', 'success')
             return redirect(url_for('agents'))
@@ -245,15 +281,6 @@ def new_webhook(id):
         sample_webhook_url = urljoin(request.host_url, generate_webhook_path())
         
         # ส่ง ngrok URL ไปแสดงผล (ถ้ามี)
-        ngrok_url = None
-        if app.debug:
-            try:
-                tunnels = ngrok.get_tunnels()
-                if tunnels:
-                    ngrok_url = tunnels[0].public_url
-            except:
-                pass
-                
         return render_template(
             'webhook_form.html',
             agent_id=id,
@@ -270,8 +297,7 @@ def new_webhook(id):
 def add_training_data(id):
     """เพิ่มข้อมูลเทรนสำหรับ Agent"""
     try:
-        agents_data = load_agents()
-        agent = next((a for a in agents_data if a['id'] == id), None)
+        agent = data_store.get_agent(id)
         
         if agent is None:
             flash('ไม่พบ Agent ที่ต้องการเพิ่มข้อมูลเทรน', 'error')
@@ -279,7 +305,7 @@ def add_training_data(id):
         
         if request.method == 'POST':
             training_data = {
-                'id': len(agent.get('training_data', [])) + 1,
+                'id': max((t['id'] for t in agent.get('training_data', [])), default=0) + 1,
                 'prompt': request.form['prompt'],
                 'description': request.form.get('description', ''),
                 'created_at': datetime.now().isoformat()
@@ -288,7 +314,8 @@ def add_training_data(id):
             if 'training_data' not in agent:
                 agent['training_data'] = []
             agent['training_data'].append(training_data)
-            save_agents(agents_data)
+            data_store.update_agent(agent)
+            shared_state.refresh(force=True)
             
             flash('เพิ่มข้อมูลเทรนสำเร็จ', 'success')
             return redirect(url_for('agents'))
@@ -303,37 +330,118 @@ def webhook_endpoint(path):
     """รับข้อมูลจาก webhook"""
     try:
         # หา webhook จาก path
-        webhook = next((w for w in webhooks if w['url_path'] == f"webhook/{path}"), None)
+        webhook = shared_state.get_webhook_by_path(f"webhook/{path}")
         if not webhook:
             return jsonify({'error': 'Webhook ไม่ถูกต้อง'}), 404
         
         if not webhook['is_active']:
             return jsonify({'error': 'Webhook ถูกปิดใช้งาน'}), 403
         
+        # event ที่เคยได้รับแล้ว (ผู้ส่ง retry) ตอบด้วยผลครั้งแรกโดยไม่บันทึก log ซ้ำ
+        key = None
+        if webhook_dedup is not None:
+            key = event_key(request.json, request.headers, Config.WEBHOOK_DEDUP_HASH_PAYLOAD)
+        dedup_key = f"webui:{webhook['id']}:{key}" if key else None
+        if dedup_key:
+            previous = webhook_dedup.claim(dedup_key, wait=Config.WEBHOOK_DEDUP_WAIT)
+            if previous is not None:
+                if previous['state'] != STATE_DONE:
+                    response = jsonify({'status': 'processing'})
+                    response.status_code = 409
+                    response.headers['Retry-After'] = '1'
+                else:
+                    response = jsonify(previous['response'])
+                    response.status_code = previous['status_code']
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+        
         # บันทึก webhook log
         log = {
             'id': str(uuid.uuid4()),
             'webhook_id': webhook['id'],
             'request_data': request.json,
+            'status_code': 200,
+            'trace_id': current_trace_id(),
             'created_at': datetime.now().isoformat()
         }
         
-        # โหลดและบันทึก logs
-        logs = load_data(os.path.join(DATA_DIR, f"webhook_logs_{webhook['id']}.json"), [])
-        logs.append(log)
-        save_data(os.path.join(DATA_DIR, f"webhook_logs_{webhook['id']}.json"), logs)
+        # เขียนต่อท้าย log โดยไม่ต้องโหลดประวัติทั้งหมด
+        try:
+            webhook_log_store(webhook['id']).append(webhook['id'], log)
+        except Exception:
+            if dedup_key:
+                webhook_dedup.release(dedup_key)
+            raise
+        if dedup_key:
+            webhook_dedup.complete(dedup_key, {'status': 'success'}, 200)
         
         return jsonify({'status': 'success'}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def parse_time_arg(name):
+    """อ่านเวลาแบบ ISO 8601 จาก query string (คืนค่า None ถ้าไม่ได้ระบุ)
+
+    log เก็บเวลาท้องถิ่นแบบไม่มี timezone เวลาที่ระบุ offset (เช่น +07:00, Z) จึงถูกแปลงเป็นเวลาท้องถิ่นก่อนเทียบ
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed.isoformat()
+    except ValueError:
+        raise ValueError(f'รูปแบบเวลาของ {name} ไม่ถูกต้อง: {value}')
+
 @app.route('/webhook/logs/<webhook_id>')
 def webhook_logs(webhook_id):
-    """ดูประวัติการทำงานของ webhook"""
+    """ดูประวัติการทำงานของ webhook
+
+    เรียงจากใหม่ไปเก่า (เหมือน /api/webhook/logs)
+    query string: cursor (seq ของรายการสุดท้ายในหน้าก่อน), limit, since, until, status_code
+    และ format=ndjson สำหรับส่งออกทั้งหมดแบบ stream (ทีละบรรทัด)
+    cursor ของหน้าถัดไปอยู่ใน header X-Next-Cursor (offset แบบเดิม = จำนวนรายการล่าสุดที่ข้าม)
+    """
+    try:
+        since = parse_time_arg('since')
+        until = parse_time_arg('until')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
     try:
-        logs = load_data(os.path.join(DATA_DIR, f"webhook_logs_{webhook_id}.json"), [])
-        return jsonify(logs), 200
+        cursor = request.args.get('cursor', type=int)
+        skip = max(0, request.args.get('offset', 0, type=int)) if cursor is None else 0
+        status_code = request.args.get('status_code', type=int)
+        predicate = None
+        if status_code is not None:
+            # log แบบเดิมที่ไม่มี status_code เป็นการรับข้อมูลสำเร็จทั้งหมด
+            predicate = lambda record: record.get('status_code', 200) == status_code
+            
+        records = webhook_log_store(webhook_id).scan_reverse(
+            webhook_id, before=cursor, since=since, until=until, predicate=predicate
+        )
+        if skip:
+            records = islice(records, skip, None)
+        
+        # ส่งออกแบบ NDJSON: อ่านไปส่งไปโดยไม่เก็บทั้งหมดไว้ในหน่วยความจำ
+        if request.args.get('format') == 'ndjson':
+            limit = request.args.get('limit', type=int)
+            if limit:
+                records = islice(records, limit)
+            return Response(
+                (json.dumps(record, ensure_ascii=False) + '\n' for record in records),
+                mimetype='application/x-ndjson'
+            )
+            
+        limit = max(1, min(request.args.get('limit', LOGS_PAGE_SIZE, type=int), LOGS_MAX_PAGE_SIZE))
+        page = list(islice(records, limit + 1))
+        response = jsonify(page[:limit])
+        if len(page) > limit:
+            response.headers['X-Next-Cursor'] = str(page[limit - 1]['seq'])
+        return response, 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -341,10 +449,10 @@ def webhook_logs(webhook_id):
 def toggle_webhook(webhook_id):
     """เปิด/ปิดการใช้งาน webhook"""
     try:
-        webhook = next((w for w in webhooks if w['id'] == webhook_id), None)
+        webhook = shared_state.get_webhook_by_id(webhook_id)
         if webhook:
-            webhook['is_active'] = not webhook['is_active']
-            save_webhooks(webhooks)
+            webhook = {**webhook, 'is_active': not webhook['is_active']}
+            save_webhook(webhook)
             return jsonify({'status': 'success', 'is_active': webhook['is_active']}), 200
         return jsonify({'error': 'ไม่พบ webhook'}), 404
     except Exception as e:
@@ -355,4 +463,14 @@ def inject_now():
     return {'now': datetime.now()}
 
 if __name__ == '__main__':
+    # เริ่มต้น ngrok ใน process ที่รับ request จริง (process ลูกของ reloader ในโหมด debug)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ngrok_url = setup_ngrok()
+        if ngrok_url:
+            print("✨ คำแนะนำการตั้งค่า Line Webhook:")
+            print("1. ไปที่ Line Developer Console")
+            print("2. เลือก Channel ที่ต้องการ")
+            print("3. ไปที่ Messaging API > Webhook settings")
+            print(f"4. วาง URL นี้: {ngrok_url}/webhook/<your-path>")
+            print("5. กด Verify และ Update")
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -1,16 +1,76 @@
+import time
 from flask import Flask
 from config import Config
 from extensions import init_extensions, db
 from api import api
+from api.webhook_routes import start_webhook_workers, start_log_writer, start_webhook_dedup, start_rate_limiter, get_ai_manager
+from api.agent_routes import start_agent_registry
+import metrics
+from metrics import init_metrics
+
+STARTUP_SECONDS = metrics.REGISTRY.gauge(
+    'app_startup_seconds', 'เวลาที่ใช้ในแต่ละขั้นของ create_app', ('phase',)
+)
 
 def create_app():
+    started = time.perf_counter()
+    timings = {}
+    
+    def phase(name, since):
+        now = time.perf_counter()
+        timings[name] = now - since
+        return now
+        
     app = Flask(__name__)
     app.config.from_object(Config)
     
     # ตั้งค่า extensions
     init_extensions(app)
+    mark = phase('extensions', started)
     
     # ลงทะเบียน blueprints
     app.register_blueprint(api, url_prefix='/api')
     
+    # /metrics (Prometheus) และ trace id ของแต่ละ request
+    init_metrics(app)
+    mark = phase('blueprints', mark)
+    
+    # เขียน WebhookLog เป็นชุด (group commit) แทนการ commit ทีละแถว
+    if app.config.get('WEBHOOK_LOG_WRITER_ENABLED'):
+        start_log_writer(app)
+        mark = phase('log_writer', mark)
+    
+    # ตรวจ webhook event ที่ถูกส่งซ้ำ
+    if app.config.get('WEBHOOK_DEDUP_ENABLED'):
+        start_webhook_dedup(app)
+        mark = phase('webhook_dedup', mark)
+    
+    # AI Manager (LLM client ถูกสร้างเมื่อเรียกใช้ครั้งแรก)
+    get_ai_manager()
+    mark = phase('ai_manager', mark)
+    
+    # rate limit ต่อ webhook / agent และจำนวนงานพร้อมกันทั้งระบบ
+    if app.config.get('RATE_LIMIT_ENABLED'):
+        start_rate_limiter(app)
+        mark = phase('rate_limiter', mark)
+    
+    # สร้าง SubAgent จากฐานข้อมูลครั้งเดียวตอนเริ่มระบบ
+    if app.config.get('AGENT_REGISTRY_ENABLED'):
+        start_agent_registry(app)
+        mark = phase('agent_registry', mark)
+    
+    # เริ่ม worker สำหรับประมวลผล webhook แบบ async
+    if app.config.get('WEBHOOK_INGEST_MODE') == 'async':
+        start_webhook_workers(app)
+        mark = phase('webhook_workers', mark)
+    
+    # รายงานเวลาเริ่มระบบ
+    timings['total'] = mark - started
+    for name, seconds in timings.items():
+        STARTUP_SECONDS.set(seconds, phase=name)
+    app.config['STARTUP_TIMINGS'] = timings
+    if app.config.get('STARTUP_TIMING_REPORT'):
+        details = ', '.join(f'{name} {seconds * 1000:.1f}ms' for name, seconds in timings.items() if name != 'total')
+        print(f"🚀 create_app พร้อมใน {timings['total'] * 1000:.1f}ms ({details})")
+    
     return app
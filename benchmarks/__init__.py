@@ -0,0 +1 @@
+"""Benchmark ของ webhook ingestion และ orchestration (ใช้ FakeLLM แทน OpenAI)"""
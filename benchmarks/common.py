@@ -0,0 +1,132 @@
+import os
+import sys
+import json
+import math
+import importlib.util
+from typing import Dict, Any, List, Optional
+
+# ให้ import โมดูลของโปรเจกต์ได้แม้ benchmark จะเปลี่ยน working directory
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """ค่า percentile แบบ nearest-rank (values ต้องเรียงแล้ว)"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100.0 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int = 0) -> Dict[str, Any]:
+    """สรุป throughput และ latency (มิลลิวินาที)"""
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': len(values) / elapsed if elapsed else 0.0,
+        'mean_ms': sum(values) / len(values) * 1000 if values else 0.0,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': values[-1] * 1000 if values else 0.0
+    }
+
+
+def rss_bytes() -> int:
+    """หน่วยความจำที่ process ใช้อยู่ (RSS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def path_size(path: str) -> int:
+    """ขนาดรวมของไฟล์หรือโฟลเดอร์ (byte)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+
+def install_fake_llm(**options):
+    """ใช้ FakeLLM แทน OpenAI ทุกที่ (ต้องเรียกก่อน import api / สร้าง AIManager)"""
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+    from ai import llm_pool
+    from ai.fake_llm import FakeLLM
+    llm_pool.set_llm_factory(lambda model_name, temperature: FakeLLM(**options))
+
+
+def load_webui():
+    """import app.py (Web UI) เป็นโมดูล (แพ็กเกจ app/ ใช้ชื่อ app อยู่แล้ว)
+
+    app.py เก็บข้อมูลในโฟลเดอร์ data/ ของ working directory ปัจจุบัน
+    """
+    spec = importlib.util.spec_from_file_location('webui_app', os.path.join(ROOT_DIR, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def save_results(path: str, results: Dict[str, Any]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def compare(results: Dict[str, Any], baseline_path: str, tolerance: float,
+            higher_is_better=('throughput_rps', 'ops_per_sec'),
+            lower_is_better=('p50_ms', 'p95_ms', 'p99_ms', 'us_per_op')) -> List[str]:
+    """เทียบผลกับ baseline คืนค่ารายการค่าที่แย่ลงเกิน tolerance (สัดส่วน เช่น 0.2 = 20%)"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not isinstance(base, dict) or not isinstance(metrics, dict):
+            continue
+        for key, value in metrics.items():
+            old = base.get(key)
+            if not isinstance(old, (int, float)) or not old:
+                continue
+            if key in higher_is_better and value < old * (1 - tolerance):
+                regressions.append(f'{name}.{key}: {old:.2f} -> {value:.2f}')
+            elif key in lower_is_better and value > old * (1 + tolerance):
+                regressions.append(f'{name}.{key}: {old:.2f} -> {value:.2f}')
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    for name, metrics in results.items():
+        print(f'\n[{name}]')
+        for key, value in metrics.items():
+            if isinstance(value, float):
+                value = f'{value:,.2f}'
+            elif isinstance(value, int):
+                value = f'{value:,}'
+            print(f'  {key:<20} {value}')
+
+
+def finish(results: Dict[str, Any], output: Optional[str], baseline: Optional[str], tolerance: float) -> int:
+    """แสดงผล บันทึก และเทียบกับ baseline คืนค่า exit code (1 ถ้าแย่ลงเกิน tolerance)"""
+    print_table(results)
+    if output:
+        save_results(output, results)
+        print(f'\nบันทึกผลไว้ที่ {output}')
+    if baseline:
+        regressions = compare(results, baseline, tolerance)
+        if regressions:
+            print('\nประสิทธิภาพแย่ลงเมื่อเทียบกับ baseline:')
+            for line in regressions:
+                print(f'  - {line}')
+            return 1
+        print('\nไม่พบการถดถอยเมื่อเทียบกับ baseline')
+    return 0
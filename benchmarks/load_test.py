@@ -0,0 +1,160 @@
+"""Load test ของ webhook endpoint ทั้งสองชุดด้วย FakeLLM
+
+    python -m benchmarks.load_test --requests 2000 --concurrency 32 --llm-latency 0.05
+
+target webui = /webhook/<path> ของ app.py, api = /api/webhook/<path> ของ create_app()
+ข้อมูลทั้งหมด (SQLite, log) สร้างในโฟลเดอร์ชั่วคราว
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import summarize, rss_bytes, path_size, install_fake_llm, load_webui, finish
+
+SAMPLE_MESSAGES = [
+    'ขอเช็คสถานะคำร้องเลขที่ {n}',
+    'ต้องการแจ้งปัญหาไฟฟ้าดับที่หมู่ {n}',
+    'สอบถามขั้นตอนการขอใบอนุญาตก่อสร้าง แปลงที่ {n}',
+    'ค่าธรรมเนียมการต่อทะเบียนบ้านเท่าไหร่ ครั้งที่ {n}',
+    'Please check the status of request #{n}',
+]
+
+
+def make_messages(count: int, distinct: int, seed: int):
+    """ข้อความทดสอบ count รายการจากข้อความที่ไม่ซ้ำกัน distinct แบบ (กำหนดผลได้ด้วย seed)"""
+    rng = random.Random(seed)
+    pool = [rng.choice(SAMPLE_MESSAGES).format(n=i) for i in range(max(1, distinct))]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def run_load(app, path: str, messages, concurrency: int, headers=None):
+    """ยิง request พร้อมกัน concurrency ตัว คืนค่า (latencies, errors, elapsed)"""
+    local = threading.local()
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def send(message):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post(path, json={'message': message}, headers=headers or {})
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if response.status_code >= 400:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, messages))
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def bench_webui(args, messages):
+    webui = load_webui()
+    webui.save_webhook({
+        'id': 'bench',
+        'name': 'Benchmark',
+        'url_path': 'webhook/bench',
+        'agent_id': 1,
+        'is_active': True,
+        'secret_key': 'bench'
+    })
+    log_dir = webui.Config.WEBHOOK_LOG_DIR
+    log_before, rss_before = path_size(log_dir), rss_bytes()
+    latencies, errors, elapsed = run_load(webui.app, '/webhook/bench', messages, args.concurrency)
+    return {
+        **summarize(latencies, elapsed, errors),
+        'rss_growth_bytes': rss_bytes() - rss_before,
+        'log_growth_bytes': path_size(log_dir) - log_before
+    }
+
+
+def bench_api(args, messages):
+    from app import create_app
+    from extensions import db
+    from models import Webhook
+    from ai import SubAgent
+    from api import webhook_routes
+    from api.webhook_routes import get_ai_manager
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Webhook(url_path='bench', secret_key='bench', is_active=True))
+        db.session.commit()
+    ai_manager = get_ai_manager()
+    for i in range(args.agents):
+        ai_manager.register_sub_agent(f'agent{i}', SubAgent(f'agent{i}', f'Agent {i}'))
+
+    db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
+    log_before, rss_before = path_size(db_path), rss_bytes()
+    latencies, errors, elapsed = run_load(
+        app, '/api/webhook/bench', messages, args.concurrency, headers={'X-Webhook-Secret': 'bench'}
+    )
+    if webhook_routes.log_writer is not None:
+        webhook_routes.log_writer.flush()
+    return {
+        **summarize(latencies, elapsed, errors),
+        'rss_growth_bytes': rss_bytes() - rss_before,
+        'log_growth_bytes': path_size(db_path) - log_before
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['webui', 'api', 'all'], default='all')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--distinct', type=int, default=200, help='จำนวนข้อความที่ไม่ซ้ำกัน')
+    parser.add_argument('--agents', type=int, default=3, help='จำนวน Sub-agent')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='เวลาตอบเฉลี่ยของ LLM (วินาที)')
+    parser.add_argument('--llm-jitter', type=float, default=0.01)
+    parser.add_argument('--tokens', type=int, default=50, help='จำนวน token เฉลี่ยของคำตอบ')
+    parser.add_argument('--tokens-jitter', type=float, default=10)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='สัดส่วนการเรียก LLM ที่ล้มเหลว (จำลอง)')
+    parser.add_argument('--llm-slow-rate', type=float, default=0.0, help='สัดส่วนการเรียก LLM ที่ตอบช้ามาก (จำลอง)')
+    parser.add_argument('--llm-slow-latency', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='บันทึกผลเป็น JSON')
+    parser.add_argument('--baseline', help='ไฟล์ JSON ผลครั้งก่อนสำหรับเทียบ')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='สัดส่วนที่ยอมให้แย่ลงได้')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='ai-orchestration-bench-')
+    os.chdir(workdir)
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'api.db')}")
+    # ฐานข้อมูลของ benchmark ยังไม่มีตาราง agent ใช้ Sub-agent ที่ลงทะเบียนเองแทน
+    os.environ.setdefault('AGENT_REGISTRY_ENABLED', 'false')
+    # ข้อความทดสอบซ้ำกันโดยตั้งใจ ไม่ให้ถูกตอบจากผลครั้งก่อน
+    os.environ.setdefault('WEBHOOK_DEDUP_HASH_PAYLOAD', 'false')
+    install_fake_llm(
+        latency=args.llm_latency,
+        latency_jitter=args.llm_jitter,
+        tokens=args.tokens,
+        tokens_jitter=args.tokens_jitter,
+        agent_ids=[f'agent{i}' for i in range(args.agents)],
+        seed=args.seed,
+        error_rate=args.llm_error_rate,
+        slow_rate=args.llm_slow_rate,
+        slow_latency=args.llm_slow_latency
+    )
+
+    messages = make_messages(args.requests, args.distinct, args.seed)
+    results = {}
+    if args.target in ('webui', 'all'):
+        results['webui_webhook'] = bench_webui(args, messages)
+    if args.target in ('api', 'all'):
+        results['api_webhook'] = bench_api(args, messages)
+    print(f'\nworkdir: {workdir}')
+    return finish(results, args.output, args.baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Microbenchmark ของฟังก์ชันบน hot path
+
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.micro --baseline micro.json   # exit code 1 ถ้าแย่ลงเกิน tolerance
+
+วัด load_data/save_data, data store, log store, การเลือก Sub-agent (cache / pre-router / LLM)
+และ SubAgent._prepare_context
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from .common import install_fake_llm, load_webui, finish
+
+
+def measure(func, min_time: float = 0.5, min_runs: int = 5):
+    """เรียก func ซ้ำจนได้เวลาอย่างน้อย min_time วินาที คืนค่า ops/sec และ µs/op"""
+    func()  # warm-up
+    runs, start = 0, time.perf_counter()
+    while True:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if runs >= min_runs and elapsed >= min_time:
+            break
+    return {
+        'runs': runs,
+        'ops_per_sec': runs / elapsed,
+        'us_per_op': elapsed / runs * 1e6
+    }
+
+
+def bench_webui_data(results, args):
+    webui = load_webui()
+    agents = [{
+        'id': i,
+        'name': f'Agent {i}',
+        'description': 'ตัวแทนตอบคำถามประชาชน ' * 5,
+        'prompt_template': 'คำถาม: {input}\n{context}',
+        'training_data': [{'id': j, 'input': f'คำถามที่ {j}', 'output': f'คำตอบที่ {j}'} for j in range(20)]
+    } for i in range(args.agents)]
+    path = os.path.join(webui.DATA_DIR, 'bench_agents.json')
+
+    results['save_data'] = measure(lambda: webui.save_data(path, agents), args.min_time)
+    results['load_data'] = measure(lambda: webui.load_data(path), args.min_time)
+
+    webui.save_agents(agents)
+    agent = webui.data_store.get_agent(args.agents // 2)
+    results['data_store_get_agent'] = measure(lambda: webui.data_store.get_agent(agent['id']), args.min_time)
+    results['data_store_update_agent'] = measure(lambda: webui.data_store.update_agent(agent), args.min_time)
+    results['data_store_list_agents'] = measure(webui.load_agents, args.min_time)
+
+    record = {'webhook_id': 'bench', 'request_data': {'message': 'ทดสอบ'}, 'status_code': 200}
+    results['log_store_append'] = measure(lambda: webui.log_store.append('bench', record), args.min_time)
+    results['log_store_read_page'] = measure(
+        lambda: webui.log_store.read('bench', offset=0, limit=100), args.min_time
+    )
+
+
+def bench_ai(results, args):
+    from ai import AIManager, SubAgent
+
+    manager = AIManager()
+    manager.pre_router_enabled = False
+    agents = []
+    for i in range(args.agents):
+        agent = SubAgent(f'agent{i}', f'Agent {i}', description=f'ตอบคำถามเรื่องที่ {i}')
+        for j in range(args.examples):
+            agent.add_training_data(f'คำถามเรื่องที่ {i} ข้อ {j} เกี่ยวกับบริการ', f'คำตอบข้อ {j}')
+        manager.register_sub_agent(agent.agent_id, agent)
+        agents.append(agent)
+
+    counter = [0]
+
+    def route_llm():
+        counter[0] += 1
+        manager.analyze_message(f'ข้อความใหม่ที่ไม่ซ้ำ {counter[0]}')
+
+    results['route_llm'] = measure(route_llm, args.min_time)
+    manager.analyze_message('ข้อความที่ถามบ่อย')
+    results['route_cache_hit'] = measure(lambda: manager.analyze_message('ข้อความที่ถามบ่อย'), args.min_time)
+    results['route_pre_router'] = measure(
+        lambda: manager.pre_router.route('คำถามเรื่องที่ 1 ข้อ 3 เกี่ยวกับบริการ'), args.min_time
+    )
+
+    agent = agents[0]
+    data = {
+        'input': 'คำถามเรื่องที่ 0 ข้อ 7 เกี่ยวกับบริการ',
+        'customer': 'สมชาย',
+        'history': [{'role': 'user', 'text': 'ข้อความก่อนหน้า ' * 10} for _ in range(50)]
+    }
+    results['prepare_context'] = measure(lambda: agent._prepare_context(data), args.min_time)
+    results['sub_agent_process_cached'] = measure(lambda: agent.process(data), args.min_time)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--agents', type=int, default=50)
+    parser.add_argument('--examples', type=int, default=500, help='จำนวนข้อมูลเทรนต่อ Sub-agent')
+    parser.add_argument('--min-time', type=float, default=0.5, help='เวลาขั้นต่ำของแต่ละ benchmark (วินาที)')
+    parser.add_argument('--output', help='บันทึกผลเป็น JSON')
+    parser.add_argument('--baseline', help='ไฟล์ JSON ผลครั้งก่อนสำหรับเทียบ')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='สัดส่วนที่ยอมให้แย่ลงได้')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='ai-orchestration-micro-')
+    os.chdir(workdir)
+    install_fake_llm(latency=0, agent_ids=[f'agent{i}' for i in range(args.agents)])
+
+    results = {}
+    bench_webui_data(results, args)
+    bench_ai(results, args)
+    return finish(results, args.output, args.baseline, args.tolerance)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
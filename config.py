@@ -4,10 +4,36 @@ from dotenv import load_dotenv
 # โหลดค่าจากไฟล์ .env
 load_dotenv()
 
+def _engine_options(url):
+    """ค่า connection pool ของ SQLAlchemy engine จาก DB_POOL_*"""
+    options = {
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800))
+    }
+    # SQLite in-memory ใช้ pool แบบหนึ่ง connection ต่อ thread ที่ไม่รองรับค่าขนาด pool
+    if url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') == 'sqlite:'):
+        return options
+    options.update({
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30))
+    })
+    if url.startswith('mssql+pyodbc'):
+        # executemany แบบ array binding ของ pyodbc (ใช้กับการเขียน WebhookLog เป็นชุด)
+        options['fast_executemany'] = True
+    return options
+
 class Config:
     # Database
-    SQLALCHEMY_DATABASE_URI = f"mssql+pyodbc://{os.getenv('DB_USERNAME')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}?driver=ODBC+Driver+17+for+SQL+Server"
+    # DATABASE_URL ใช้แทนค่า SQL Server ได้ (เช่น sqlite:///bench.db สำหรับ benchmark)
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or f"mssql+pyodbc://{os.getenv('DB_USERNAME')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}?driver=ODBC+Driver+17+for+SQL+Server"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(SQLALCHEMY_DATABASE_URI)
+    # replica สำหรับคำสั่งอ่านอย่างเดียว (extensions.read_session) เว้นว่างเพื่อใช้ฐานข้อมูลหลัก
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    SQLALCHEMY_BINDS = {
+        'replica': {'url': DATABASE_REPLICA_URL, **_engine_options(DATABASE_REPLICA_URL)}
+    } if DATABASE_REPLICA_URL else {}
     
     # OpenAI
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
@@ -18,3 +44,73 @@ class Config:
     # Line
     LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
     LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
+    # จำนวนข้อความจาก LINE ที่ประมวลผลได้ต่อนาที (เกินได้ LINE_BUSY_REPLY แทน) 0 = ไม่จำกัด
+    LINE_RATE_LIMIT_PER_MINUTE = int(os.getenv('LINE_RATE_LIMIT_PER_MINUTE', 0))
+    
+    # Webhook logs (append-only log store)
+    WEBHOOK_LOG_DIR = os.getenv('WEBHOOK_LOG_DIR', os.path.join('data', 'webhook_logs'))
+    WEBHOOK_LOG_SEGMENT_BYTES = int(os.getenv('WEBHOOK_LOG_SEGMENT_BYTES', 8 * 1024 * 1024))
+    WEBHOOK_LOG_FSYNC = os.getenv('WEBHOOK_LOG_FSYNC', 'interval')  # always / interval / never
+    WEBHOOK_LOG_FSYNC_INTERVAL = float(os.getenv('WEBHOOK_LOG_FSYNC_INTERVAL', 1.0))
+    
+    # Webhook registry (ดัชนี url_path/id ในหน่วยความจำ)
+    WEBHOOK_REGISTRY_REFRESH = float(os.getenv('WEBHOOK_REGISTRY_REFRESH', 1.0))
+    
+    # Webhook ingestion (sync = ประมวลผลใน request, async = เข้าคิวแล้วตอบกลับทันที)
+    WEBHOOK_INGEST_MODE = os.getenv('WEBHOOK_INGEST_MODE', 'sync')
+    WEBHOOK_QUEUE_PATH = os.getenv('WEBHOOK_QUEUE_PATH', os.path.join('data', 'webhook_queue.db'))
+    WEBHOOK_QUEUE_MAX_DEPTH = int(os.getenv('WEBHOOK_QUEUE_MAX_DEPTH', 10000))
+    WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_QUEUE_MAX_ATTEMPTS', 5))
+    WEBHOOK_QUEUE_BACKOFF = float(os.getenv('WEBHOOK_QUEUE_BACKOFF', 1.0))
+    # งานที่ทำนานกว่านี้ถือว่า worker ตายและถูกส่งให้ worker อื่นทำซ้ำ (0 = คำนวณจาก WEBHOOK_TIME_BUDGET)
+    WEBHOOK_QUEUE_VISIBILITY_TIMEOUT = float(os.getenv('WEBHOOK_QUEUE_VISIBILITY_TIMEOUT', 0))
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))
+    
+    # WebhookLog แบบเขียนเป็นชุด (overflow: block / drop_oldest / drop_newest / inline)
+    WEBHOOK_LOG_WRITER_ENABLED = os.getenv('WEBHOOK_LOG_WRITER_ENABLED', 'true').lower() == 'true'
+    WEBHOOK_LOG_WRITER_BATCH_SIZE = int(os.getenv('WEBHOOK_LOG_WRITER_BATCH_SIZE', 200))
+    WEBHOOK_LOG_WRITER_FLUSH_INTERVAL = float(os.getenv('WEBHOOK_LOG_WRITER_FLUSH_INTERVAL', 0.5))
+    WEBHOOK_LOG_WRITER_BUFFER_SIZE = int(os.getenv('WEBHOOK_LOG_WRITER_BUFFER_SIZE', 10000))
+    WEBHOOK_LOG_WRITER_OVERFLOW = os.getenv('WEBHOOK_LOG_WRITER_OVERFLOW', 'block')
+    
+    # ตรวจ webhook ที่ถูกส่งซ้ำ (LINE webhookEventId / Idempotency-Key / hash ของ payload) และตอบด้วยผลครั้งแรก
+    WEBHOOK_DEDUP_ENABLED = os.getenv('WEBHOOK_DEDUP_ENABLED', 'true').lower() == 'true'
+    WEBHOOK_DEDUP_PATH = os.getenv('WEBHOOK_DEDUP_PATH', os.path.join('data', 'webhook_dedup.db'))
+    WEBHOOK_DEDUP_WINDOW = float(os.getenv('WEBHOOK_DEDUP_WINDOW', 86400))
+    WEBHOOK_DEDUP_PENDING_TIMEOUT = float(os.getenv('WEBHOOK_DEDUP_PENDING_TIMEOUT', 300))
+    WEBHOOK_DEDUP_CACHE_SIZE = int(os.getenv('WEBHOOK_DEDUP_CACHE_SIZE', 10000))
+    # payload ที่ไม่มี event id ถือว่าซ้ำเมื่อเหมือนกันทุก byte (ปิดได้ถ้าผู้ส่งส่งข้อความเดิมซ้ำโดยตั้งใจ)
+    WEBHOOK_DEDUP_HASH_PAYLOAD = os.getenv('WEBHOOK_DEDUP_HASH_PAYLOAD', 'true').lower() == 'true'
+    # key จาก hash ของ payload จำไว้สั้นกว่า WEBHOOK_DEDUP_WINDOW (พอสำหรับการส่งซ้ำอัตโนมัติ ไม่ตัดข้อความเดิมที่ผู้ใช้ส่งใหม่)
+    WEBHOOK_DEDUP_HASH_WINDOW = float(os.getenv('WEBHOOK_DEDUP_HASH_WINDOW', 60))
+    # เวลาที่ request ซ้ำรอผลของ request แรกที่ยังประมวลผลอยู่ (วินาที)
+    WEBHOOK_DEDUP_WAIT = float(os.getenv('WEBHOOK_DEDUP_WAIT', 10))
+    
+    # admission control: token bucket ต่อ webhook / agent (ค่าในตาราง webhooks, ai_agents แทนค่าเริ่มต้นนี้ได้ 0 = ไม่จำกัด)
+    # และจำนวน webhook ที่ประมวลผลพร้อมกันทั้งระบบ สถานะเก็บใน RATE_LIMIT_PATH ที่ทุก worker ใช้ร่วมกัน
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_PATH = os.getenv('RATE_LIMIT_PATH', os.path.join('data', 'rate_limit.db'))
+    WEBHOOK_RATE_LIMIT_PER_MINUTE = int(os.getenv('WEBHOOK_RATE_LIMIT_PER_MINUTE', 0))
+    AGENT_RATE_LIMIT_PER_MINUTE = int(os.getenv('AGENT_RATE_LIMIT_PER_MINUTE', 0))
+    WEBHOOK_MAX_IN_FLIGHT = int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', 0))
+    WEBHOOK_IN_FLIGHT_LEASE = float(os.getenv('WEBHOOK_IN_FLIGHT_LEASE', 120))
+    # เมื่อเกินขีดจำกัด: reject = ตอบ 429 ทันที, defer = (โหมด async) เลื่อนงานในคิวไม่เกิน RATE_LIMIT_MAX_DEFER วินาที
+    RATE_LIMIT_ACTION = os.getenv('RATE_LIMIT_ACTION', 'reject')
+    RATE_LIMIT_MAX_DEFER = float(os.getenv('RATE_LIMIT_MAX_DEFER', 60))
+    
+    # เวลาทั้งหมดที่ใช้ประมวลผล webhook หนึ่งรายการได้ (วินาที) การเรียก LLM ทุกครั้งใน request ต้องเสร็จภายในเวลานี้
+    # timeout / retry / circuit breaker ของแต่ละครั้งตั้งด้วย LLM_* (ดู ai/resilience.py) 0 = ไม่จำกัด
+    WEBHOOK_TIME_BUDGET = float(os.getenv('WEBHOOK_TIME_BUDGET', 25))
+    
+    # โหลด AI Agent จากฐานข้อมูลตอนเริ่มระบบ (จำนวนที่เก็บในหน่วยความจำ: AGENT_REGISTRY_MAX_LOADED)
+    AGENT_REGISTRY_ENABLED = os.getenv('AGENT_REGISTRY_ENABLED', 'true').lower() == 'true'
+    
+    # แสดงเวลาที่ใช้ในแต่ละขั้นของ create_app ตอนเริ่มระบบ
+    STARTUP_TIMING_REPORT = os.getenv('STARTUP_TIMING_REPORT', 'true').lower() == 'true'
+    
+    # Web UI data store (sqlite = SQLite WAL, json = ไฟล์ JSON แบบเดิม)
+    DATA_BACKEND = os.getenv('DATA_BACKEND', 'sqlite')
+    DATA_DB_PATH = os.getenv('DATA_DB_PATH', os.path.join('data', 'store.db'))
+    # snapshot ในแต่ละ worker: ตรวจการเปลี่ยนแปลงทุกกี่วินาที และเก็บ change feed ไว้กี่รายการ
+    SHARED_STATE_POLL_INTERVAL = float(os.getenv('SHARED_STATE_POLL_INTERVAL', 0.1))
+    SHARED_STATE_KEEP_CHANGES = int(os.getenv('SHARED_STATE_KEEP_CHANGES', 10000))
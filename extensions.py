@@ -1,12 +1,62 @@
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import _app_ctx_id
 from flask_login import LoginManager
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+import metrics
 
 db = SQLAlchemy()
 login_manager = LoginManager()
 
+REPLICA_BIND = 'replica'
+
 def init_extensions(app):
     db.init_app(app)
     
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'กรุณาเข้าสู่ระบบก่อนเข้าใช้งาน'
+    
+    with app.app_context():
+        engines = dict(db.engines)
+    for bind, engine in engines.items():
+        _register_pool_metrics(bind or 'primary', engine)
+        
+    # session แยกสำหรับ replica (ผูกกับ app context เหมือน db.session)
+    if REPLICA_BIND in engines:
+        session = scoped_session(sessionmaker(bind=engines[REPLICA_BIND]), scopefunc=_app_ctx_id)
+        app.extensions['read_session'] = session
+        app.teardown_appcontext(lambda exc: session.remove())
+
+def read_session():
+    """session สำหรับคำสั่งอ่านอย่างเดียว (replica ถ้ากำหนด DATABASE_REPLICA_URL ไม่เช่นนั้นใช้ db.session)"""
+    return current_app.extensions.get('read_session') or db.session
+
+def _register_pool_metrics(bind, engine):
+    """ส่งออกสถานะ connection pool ของ engine ใน /metrics"""
+    pool = engine.pool
+    connections = metrics.REGISTRY.gauge(
+        'db_pool_connections', 'จำนวน connection ใน pool แยกตามสถานะ', ('bind', 'state')
+    )
+    for state, func in (('checked_out', 'checkedout'), ('idle', 'checkedin'), ('size', 'size')):
+        if hasattr(pool, func):
+            connections.set_function(getattr(pool, func), bind=bind, state=state)
+    if hasattr(pool, 'overflow'):
+        # overflow() ติดลบเมื่อยังเปิด connection ไม่ครบ pool_size
+        connections.set_function(lambda: max(0, pool.overflow()), bind=bind, state='overflow')
+            
+    opened = metrics.REGISTRY.counter(
+        'db_pool_connects_total', 'จำนวน connection ใหม่ที่เปิดไปยังฐานข้อมูล', ('bind',)
+    )
+    checkouts = metrics.REGISTRY.counter(
+        'db_pool_checkouts_total', 'จำนวนการยืม connection จาก pool', ('bind',)
+    )
+    
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        opened.inc(bind=bind)
+        
+    @event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts.inc(bind=bind)
@@ -0,0 +1,243 @@
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+# metrics ของ pipeline (เก็บในหน่วยความจำของ process) ส่งออกเป็น Prometheus text format ที่ /metrics
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+TRACE_HEADER = 'X-Trace-Id'
+
+_trace_id: contextvars.ContextVar = contextvars.ContextVar('trace_id', default=None)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, Any] = {}
+        self._functions: Dict[Tuple, Callable[[], float]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def set_function(self, func: Callable[[], float], **labels):
+        """ให้ค่าของ metric มาจากการเรียก func ตอนส่งออก (เช่น ความยาวคิว)"""
+        with self._lock:
+            self._functions[self._key(labels)] = func
+
+    def _samples(self) -> List[Tuple[str, Tuple, float]]:
+        with self._lock:
+            samples = [(self.name, key, value) for key, value in self._values.items()]
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                samples.append((self.name, key, float(func())))
+            except Exception as e:
+                print(f"เกิดข้อผิดพลาดในการอ่านค่า metric {self.name}: {str(e)}")
+        return samples
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_name}']
+        for name, key, value in self._samples():
+            lines.append(f'{name}{_format_labels(self.labelnames, key)} {value:g}')
+        return lines
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [จำนวนในแต่ละช่วง (ไม่สะสม) + ช่วง +Inf, ผลรวม, จำนวน]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {total:g}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """ชุดของ metrics ทั้งหมดใน process"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, tuple(labelnames), **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def gauge(self, name: str, help_text: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """ส่งออก metrics ทั้งหมดเป็น Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'pipeline_stage_seconds', 'เวลาที่ใช้ในแต่ละขั้นของ pipeline', ('stage',)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    'pipeline_stage_errors_total', 'จำนวนข้อผิดพลาดในแต่ละขั้นของ pipeline', ('stage',)
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds', 'เวลาตอบ HTTP request', ('endpoint', 'method', 'status')
+)
+LLM_CALLS = REGISTRY.counter('llm_calls_total', 'จำนวนการเรียก LLM', ('agent',))
+LLM_TOKENS = REGISTRY.counter('llm_tokens_total', 'จำนวน token (ประมาณ) ที่ส่ง/รับจาก LLM', ('agent', 'kind'))
+PROMPT_TOKENS_SAVED = REGISTRY.counter(
+    'prompt_tokens_saved_total', 'จำนวน token ที่ประหยัดได้จากการจัดงบ prompt', ('agent',)
+)
+ROUTING_DECISIONS = REGISTRY.counter(
+    'routing_decisions_total', 'จำนวนการเลือก Sub-agent แยกตามที่มา (cache, pre_router, llm, fallback)', ('source',)
+)
+
+
+@contextmanager
+def stage(name: str):
+    """จับเวลาขั้นหนึ่งของ pipeline และนับข้อผิดพลาด"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+def record_llm_usage(agent: str, prompt_tokens: int, completion_tokens: int, tokens_saved: int = 0):
+    """นับการเรียก LLM และจำนวน token ต่อ agent"""
+    LLM_CALLS.inc(agent=agent)
+    LLM_TOKENS.inc(prompt_tokens, agent=agent, kind='prompt')
+    LLM_TOKENS.inc(completion_tokens, agent=agent, kind='completion')
+    if tokens_saved:
+        PROMPT_TOKENS_SAVED.inc(tokens_saved, agent=agent)
+
+
+def current_trace_id() -> Optional[str]:
+    """trace id ของ request/งานที่กำลังทำอยู่"""
+    return _trace_id.get()
+
+
+def set_trace_id(trace_id: Optional[str] = None) -> str:
+    """กำหนด trace id (สร้างใหม่ถ้าไม่ระบุ) คืนค่า trace id ที่ใช้"""
+    trace_id = trace_id or uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def init_metrics(app):
+    """ลงทะเบียน route /metrics และจับเวลา/กำหนด trace id ให้ทุก request ของ app"""
+    from flask import request, g, Response
+
+    @app.before_request
+    def _start_request():
+        g.metrics_start = time.perf_counter()
+        # ใช้ trace id จาก client ถ้ามี (ความยาวไม่เกิน 64 ตัวอักษร)
+        g.trace_id = set_trace_id((request.headers.get(TRACE_HEADER) or '')[:64] or None)
+
+    @app.after_request
+    def _end_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None and request.endpoint != 'metrics':
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                endpoint=request.endpoint or 'unknown',
+                method=request.method,
+                status=response.status_code
+            )
+        trace_id = g.get('trace_id')
+        if trace_id:
+            response.headers[TRACE_HEADER] = trace_id
+        return response
+
+    def metrics_view():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
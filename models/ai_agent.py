@@ -1,11 +1,24 @@
 from extensions import db
 from datetime import datetime
 
-class AIAgent:
-    def __init__(self, id=None, name=None, description=None, created_at=None):
-        self.id = id
-        self.name = name
-        self.description = description
-        self.created_at = created_at
-        self.webhooks = []  # รายการ webhook ที่เชื่อมต่อกับ agent นี้
-        self.training_data = []  # รายการข้อมูลเทรนของ agent นี้
+class AIAgent(db.Model):
+    __tablename__ = 'ai_agents'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    type = db.Column(db.String(50), default='sub_agent')
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    prompt_template = db.Column(db.Text)
+    # ขีดจำกัดต่อ agent (NULL = ใช้ค่า AGENT_RATE_LIMIT_PER_MINUTE, 0 = ไม่จำกัด)
+    rate_limit_per_minute = db.Column(db.Integer)
+    rate_limit_burst = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # ความสัมพันธ์กับ webhook และข้อมูลเทรน
+    webhooks = db.relationship('Webhook', backref='agent', lazy=True)
+    training_data = db.relationship('TrainingData', backref='agent', lazy=True, cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<AIAgent {self.name}>'
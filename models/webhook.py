@@ -1,17 +1,43 @@
-class Webhook:
-    def __init__(self, id=None, name=None, description=None, url_path=None, agent_id=None, is_active=True, secret_key=None):
-        self.id = id
-        self.name = name
-        self.description = description
-        self.url_path = url_path
-        self.agent_id = agent_id
-        self.is_active = is_active
-        self.secret_key = secret_key
+from extensions import db
+from datetime import datetime
 
-class WebhookLog:
-    def __init__(self, id=None, webhook_id=None, request_data=None, response_data=None, created_at=None):
-        self.id = id
-        self.webhook_id = webhook_id
-        self.request_data = request_data
-        self.response_data = response_data
-        self.created_at = created_at
+class Webhook(db.Model):
+    __tablename__ = 'webhooks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100))
+    description = db.Column(db.Text)
+    url_path = db.Column(db.String(255), unique=True, nullable=False)
+    agent_id = db.Column(db.Integer, db.ForeignKey('ai_agents.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    is_active = db.Column(db.Boolean, default=True)
+    secret_key = db.Column(db.String(64))
+    # ขีดจำกัดต่อ webhook (NULL = ใช้ค่า WEBHOOK_RATE_LIMIT_PER_MINUTE, 0 = ไม่จำกัด)
+    rate_limit_per_minute = db.Column(db.Integer)
+    rate_limit_burst = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # ประวัติการเรียกใช้ (query ทีละหน้า ไม่โหลดทั้งหมด)
+    logs = db.relationship('WebhookLog', backref='webhook', lazy='dynamic', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<Webhook {self.url_path}>'
+
+class WebhookLog(db.Model):
+    __tablename__ = 'webhook_logs'
+    # index สำหรับอ่าน log ของ webhook เรียงตามเวลาแบบ keyset pagination
+    __table_args__ = (
+        db.Index('ix_webhook_logs_webhook_id_created_at', 'webhook_id', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    webhook_id = db.Column(db.Integer, db.ForeignKey('webhooks.id'), nullable=False)
+    request_data = db.Column(db.JSON)
+    response_data = db.Column(db.JSON)
+    status_code = db.Column(db.Integer)
+    trace_id = db.Column(db.String(64), index=True)  # X-Trace-Id ของ request ที่สร้าง log นี้
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<WebhookLog {self.id} for Webhook {self.webhook_id}>'
@@ -0,0 +1,10 @@
+from .file_lock import FileLock
+from .log_store import LogStore
+from .webhook_registry import WebhookRegistry
+from .job_queue import JobQueue, QueueFull, RetryLater, LostClaim
+from .worker_pool import WorkerPool
+from .batch_writer import BatchWriter
+from .data_store import DataStore, JSONDataStore, SQLiteDataStore, create_data_store
+from .shared_state import SharedState
+from .dedup import Deduplicator, event_key
+from .rate_limit import RateLimiter, RateLimited
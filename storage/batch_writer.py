@@ -0,0 +1,188 @@
+import time
+import threading
+import traceback
+from collections import deque
+from typing import Dict, Any, Callable, List
+
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_INLINE = 'inline'
+
+
+class BatchWriter:
+    """บัฟเฟอร์รายการที่จะเขียนแล้วเขียนทีละชุด (group commit) ด้วย thread เบื้องหลัง
+
+    flush(items) ถูกเรียกเมื่อมีรายการครบ max_batch หรือรายการแรกรอนานครบ flush_interval วินาที
+    บัฟเฟอร์มีขนาดไม่เกิน max_buffer เมื่อเต็มจะทำตาม overflow:
+    block (รอไม่เกิน block_timeout แล้วทิ้ง), drop_oldest, drop_newest หรือ inline (เขียนเองทันที)
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Any], max_batch: int = 200, flush_interval: float = 0.5,
+                 max_buffer: int = 10000, overflow: str = OVERFLOW_BLOCK, block_timeout: float = 5.0,
+                 max_retries: int = 3, name: str = 'batch-writer'):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_INLINE):
+            raise ValueError(f'overflow policy ไม่ถูกต้อง: {overflow}')
+        self.flush_fn = flush
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.max_buffer = max(self.max_batch, max_buffer)
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.max_retries = max_retries
+        self.name = name
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+        self._buffer: deque = deque()
+        self._in_flight = 0
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """เริ่ม thread ที่เขียนข้อมูล"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, item: Any) -> bool:
+        """เพิ่มรายการเข้าบัฟเฟอร์ คืนค่า False ถ้ารายการนี้ถูกทิ้ง"""
+        with self._cond:
+            full = len(self._buffer) >= self.max_buffer
+            if full and self.overflow == OVERFLOW_DROP_OLDEST:
+                self._buffer.popleft()
+                self.dropped += 1
+                full = False
+            elif full and self.overflow == OVERFLOW_BLOCK:
+                full = not self._wait_for_room()
+            if not full:
+                if not self._buffer:
+                    self._oldest = time.monotonic()
+                self._buffer.append(item)
+                if len(self._buffer) >= self.max_batch:
+                    self._cond.notify_all()
+                return True
+            if self.overflow != OVERFLOW_INLINE:
+                self.dropped += 1
+                return False
+        # บัฟเฟอร์เต็ม เขียนรายการนี้เองทันที
+        return self._write([item])
+
+    def _wait_for_room(self) -> bool:
+        """รอจนบัฟเฟอร์มีที่ว่างไม่เกิน block_timeout (ต้องถือ lock อยู่)"""
+        deadline = time.monotonic() + self.block_timeout
+        while len(self._buffer) >= self.max_buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._cond.wait(remaining)
+        return True
+
+    def flush(self, timeout: float = None) -> bool:
+        """รอจนรายการที่ค้างอยู่ถูกเขียนหมด คืนค่า False ถ้าหมดเวลาก่อน"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._oldest = 0  # ให้ thread เขียนทันทีโดยไม่ต้องรอ flush_interval
+            self._cond.notify_all()
+            while self._buffer or self._in_flight:
+                if self._thread is None:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        if self._buffer:
+            # ไม่มี thread ทำงานอยู่ เขียนเองใน thread นี้
+            self._drain()
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """หยุด thread หลังเขียนรายการที่ค้างอยู่ทั้งหมด"""
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            self._thread = None
+        self._drain()
+
+    def _take_batch(self) -> List[Any]:
+        batch = []
+        while self._buffer and len(batch) < self.max_batch:
+            batch.append(self._buffer.popleft())
+        self._oldest = time.monotonic() if self._buffer else None
+        self._in_flight = len(batch)
+        self._cond.notify_all()
+        return batch
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def _write(self, batch: List[Any]) -> bool:
+        """เขียนหนึ่งชุด ลองใหม่ไม่เกิน max_retries ครั้ง ถ้ายังไม่สำเร็จจะทิ้งชุดนั้น"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.flush_fn(batch)
+                with self._cond:
+                    self.written += len(batch)
+                    self.batches += 1
+                return True
+            except Exception:
+                if attempt == self.max_retries:
+                    print(f"เกิดข้อผิดพลาดในการเขียนข้อมูล {len(batch)} รายการ ({self.name}):")
+                    traceback.print_exc()
+                    with self._cond:
+                        self.failed += len(batch)
+                    return False
+                time.sleep(min(2.0, 0.1 * 2 ** attempt))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    if len(self._buffer) >= self.max_batch:
+                        break
+                    if self._buffer:
+                        wait = self._oldest + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                batch = self._take_batch()
+            self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'buffered': len(self._buffer),
+                'written': self.written,
+                'batches': self.batches,
+                'dropped': self.dropped,
+                'failed': self.failed
+            }
@@ -0,0 +1,482 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+from .file_lock import FileLock
+import metrics
+
+AGENTS_FILE = 'agents.json'
+WEBHOOKS_FILE = 'webhooks.json'
+TRAINING_DATA_FILE = 'training_data.json'
+
+# ตารางที่ถูกบันทึกลง change feed (ชื่อตารางใช้เป็นชื่อชุดข้อมูลใน SharedState ด้วย)
+TABLES = ('agents', 'webhooks', 'training_data')
+
+
+class DataStore(ABC):
+    """interface ของที่เก็บข้อมูล agents / webhooks / training data ของ Web UI
+
+    backend ต้อง implement ทุก abstractmethod ส่วน change feed (latest_change, changes_since, get_rows) มีค่าเริ่มต้นให้
+    """
+
+    @abstractmethod
+    def list_agents(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_agent(self, agent_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_agent(self, agent: Dict[str, Any]) -> Dict[str, Any]:
+        """เพิ่ม agent ใหม่ (กำหนด id ให้อัตโนมัติ) คืนค่า agent ที่มี id แล้ว"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_agent(self, agent: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_agent(self, agent_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_agents(self, agents: List[Dict[str, Any]]):
+        """แทนที่ agents ทั้งหมด"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_webhooks(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert_webhook(self, webhook: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def replace_webhooks(self, webhooks: List[Dict[str, Any]]):
+        """แทนที่ webhooks ทั้งหมด"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def webhooks_version(self) -> Any:
+        """ค่าที่เปลี่ยนทุกครั้งที่ webhooks ถูกแก้ไข (ใช้ตรวจว่าต้องโหลดใหม่หรือไม่)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_training_data(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def data_version(self) -> Any:
+        """ค่าที่เปลี่ยนเมื่อข้อมูลชุดใดก็ได้ถูกแก้ไขจาก process ใดก็ได้ (ตรวจได้เร็ว ใช้ก่อนอ่าน change feed)"""
+        raise NotImplementedError
+
+    def latest_change(self) -> int:
+        """ลำดับล่าสุดของ change feed (0 ถ้าไม่รองรับ)"""
+        return 0
+
+    def changes_since(self, seq: int) -> Optional[Tuple[int, Dict[str, set]]]:
+        """id ของแถวที่เปลี่ยนหลังลำดับ seq แยกตามตาราง คืนค่า (ลำดับล่าสุด, {table: ids})
+
+        คืนค่า None ถ้าไม่รองรับหรือ change feed ถูกลบไปแล้ว (ต้องโหลดใหม่ทั้งหมด)
+        """
+        return None
+
+    def get_rows(self, table: str, ids: Iterable) -> Dict[Any, Dict[str, Any]]:
+        """แถวของตารางตาม id (id ที่ไม่มีในผลลัพธ์คือถูกลบไปแล้ว)
+
+        ค่าเริ่มต้นอ่านทั้งตารางแล้วกรอง backend ที่ค้นด้วย id ได้ควร override
+        """
+        if table not in TABLES:
+            raise ValueError(f'ไม่รู้จักตาราง: {table}')
+        listing = {
+            'agents': self.list_agents,
+            'webhooks': self.list_webhooks,
+            'training_data': self.list_training_data
+        }[table]
+        wanted = set(ids)
+        return {row['id']: row for row in listing() if row.get('id') in wanted}
+
+
+class JSONDataStore(DataStore):
+    """ที่เก็บข้อมูลแบบไฟล์ JSON (แบบเดิม) เขียนทั้งไฟล์ทุกครั้งที่แก้ไข"""
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self._lock = FileLock(os.path.join(data_dir, '.data.lock'))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def _load(self, name: str) -> List[Dict[str, Any]]:
+        try:
+            with open(self._path(name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _save(self, name: str, data: List[Dict[str, Any]]):
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+        tmp_path = self._path(name) + '.tmp'
+        with metrics.stage('data_store_write'):
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self._path(name))
+
+    def list_agents(self):
+        return self._load(AGENTS_FILE)
+
+    def get_agent(self, agent_id):
+        return next((a for a in self.list_agents() if a['id'] == agent_id), None)
+
+    def insert_agent(self, agent):
+        with self._lock:
+            agents = self.list_agents()
+            agent = {**agent, 'id': max((a['id'] for a in agents), default=0) + 1}
+            agents.append(agent)
+            self._save(AGENTS_FILE, agents)
+        return agent
+
+    def update_agent(self, agent):
+        with self._lock:
+            agents = [agent if a['id'] == agent['id'] else a for a in self.list_agents()]
+            self._save(AGENTS_FILE, agents)
+
+    def delete_agent(self, agent_id):
+        with self._lock:
+            self._save(AGENTS_FILE, [a for a in self.list_agents() if a['id'] != agent_id])
+
+    def replace_agents(self, agents):
+        with self._lock:
+            self._save(AGENTS_FILE, agents)
+
+    def list_webhooks(self):
+        return self._load(WEBHOOKS_FILE)
+
+    def upsert_webhook(self, webhook):
+        with self._lock:
+            webhooks = [w for w in self.list_webhooks() if w['id'] != webhook['id']]
+            webhooks.append(webhook)
+            self._save(WEBHOOKS_FILE, webhooks)
+
+    def replace_webhooks(self, webhooks):
+        with self._lock:
+            self._save(WEBHOOKS_FILE, webhooks)
+
+    def webhooks_version(self):
+        try:
+            return os.stat(self._path(WEBHOOKS_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def list_training_data(self):
+        return self._load(TRAINING_DATA_FILE)
+
+    def data_version(self):
+        versions = []
+        for name in (AGENTS_FILE, WEBHOOKS_FILE, TRAINING_DATA_FILE):
+            try:
+                versions.append(os.stat(self._path(name)).st_mtime_ns)
+            except OSError:
+                versions.append(None)
+        return tuple(versions)
+
+
+class SQLiteDataStore(DataStore):
+    """ที่เก็บข้อมูลบน SQLite (WAL) ค้นหาด้วย primary key และแก้ไขทีละแถว
+
+    แต่ละแถวเก็บเอกสาร JSON ของ agent/webhook ทั้งก้อน (รวม training_data ของ agent)
+    เพื่อให้รูปแบบข้อมูลที่ route และ template ใช้เหมือนเดิม
+    id ของ agent ใช้ AUTOINCREMENT จึงไม่ซ้ำกับ agent ที่ถูกลบไปแล้ว
+    trigger บันทึกทุกการแก้ไขลงตาราง changes (change feed) ให้ทุก process อัพเดท snapshot ได้ทีละแถว
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _write(self, statements):
+        """รันคำสั่งเขียนหลายคำสั่งใน transaction เดียว (BEGIN IMMEDIATE กัน writer ชนกัน)"""
+        conn = self._connect()
+        with metrics.stage('data_store_write'):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(conn)
+                conn.execute('COMMIT')
+                return result
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _init_schema(self):
+        def create(conn):
+            conn.execute('CREATE TABLE IF NOT EXISTS agents (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS webhooks (id TEXT PRIMARY KEY, url_path TEXT, data TEXT NOT NULL)')
+            conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_webhooks_url_path ON webhooks (url_path)')
+            conn.execute('CREATE TABLE IF NOT EXISTS training_data (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, row_id)')
+            for table in TABLES:
+                for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+                    conn.execute(
+                        f'CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_changes AFTER {event} ON {table} '
+                        f"BEGIN INSERT INTO changes (tbl, row_id) VALUES ('{table}', {row}.id); END"
+                    )
+        self._write(create)
+
+    @staticmethod
+    def _encode(doc: Dict[str, Any]) -> str:
+        return json.dumps({k: v for k, v in doc.items() if k != 'id'}, ensure_ascii=False)
+
+    @staticmethod
+    def _decode(row) -> Dict[str, Any]:
+        return {'id': row[0], **json.loads(row[1])}
+
+    def _bump_webhooks_version(self, conn):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('webhooks_version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    # agents
+    def list_agents(self):
+        rows = self._connect().execute('SELECT id, data FROM agents ORDER BY id')
+        return [self._decode(row) for row in rows]
+
+    def get_agent(self, agent_id):
+        row = self._connect().execute('SELECT id, data FROM agents WHERE id = ?', (agent_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def insert_agent(self, agent):
+        def insert(conn):
+            if agent.get('id') is not None:
+                conn.execute('INSERT INTO agents (id, data) VALUES (?, ?)', (agent['id'], self._encode(agent)))
+                return agent['id']
+            return conn.execute('INSERT INTO agents (data) VALUES (?)', (self._encode(agent),)).lastrowid
+        return {**agent, 'id': self._write(insert)}
+
+    def update_agent(self, agent):
+        self._write(lambda conn: conn.execute(
+            'UPDATE agents SET data = ? WHERE id = ?', (self._encode(agent), agent['id'])
+        ))
+
+    def delete_agent(self, agent_id):
+        self._write(lambda conn: conn.execute('DELETE FROM agents WHERE id = ?', (agent_id,)))
+
+    def replace_agents(self, agents):
+        def replace(conn):
+            conn.execute('DELETE FROM agents')
+            conn.executemany(
+                'INSERT INTO agents (id, data) VALUES (?, ?)',
+                [(a['id'], self._encode(a)) for a in agents]
+            )
+        self._write(replace)
+
+    # webhooks
+    def list_webhooks(self):
+        rows = self._connect().execute('SELECT id, data FROM webhooks ORDER BY rowid')
+        return [self._decode(row) for row in rows]
+
+    def upsert_webhook(self, webhook):
+        def upsert(conn):
+            conn.execute(
+                'INSERT INTO webhooks (id, url_path, data) VALUES (?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET url_path = excluded.url_path, data = excluded.data',
+                (str(webhook['id']), webhook.get('url_path'), self._encode(webhook))
+            )
+            self._bump_webhooks_version(conn)
+        self._write(upsert)
+
+    def replace_webhooks(self, webhooks):
+        def replace(conn):
+            conn.execute('DELETE FROM webhooks')
+            conn.executemany(
+                'INSERT INTO webhooks (id, url_path, data) VALUES (?, ?, ?)',
+                [(str(w['id']), w.get('url_path'), self._encode(w)) for w in webhooks]
+            )
+            self._bump_webhooks_version(conn)
+        self._write(replace)
+
+    def webhooks_version(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'webhooks_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    # training data
+    def list_training_data(self):
+        rows = self._connect().execute('SELECT id, data FROM training_data ORDER BY id')
+        return [self._decode(row) for row in rows]
+
+    # change feed
+    def data_version(self):
+        # PRAGMA data_version เปลี่ยนเมื่อ connection อื่น (รวมถึง process อื่น) commit
+        # จึงใช้ connection แยกที่ไม่เคยเขียน ไม่ใช่ connection ของ thread
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                                     check_same_thread=False)
+            return self._version_conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def latest_change(self):
+        row = self._connect().execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row[0] if row else 0
+
+    def changes_since(self, seq):
+        rows = self._connect().execute(
+            'SELECT seq, tbl, row_id FROM changes WHERE seq > ? ORDER BY seq', (seq,)
+        ).fetchall()
+        if not rows:
+            return (seq, {}) if self.latest_change() <= seq else None
+        if rows[0][0] != seq + 1:
+            # รายการที่ยังไม่ได้อ่านถูกลบไปแล้ว (prune_changes)
+            return None
+        changed: Dict[str, set] = {}
+        for _, table, row_id in rows:
+            changed.setdefault(table, set()).add(row_id)
+        return rows[-1][0], changed
+
+    def prune_changes(self, keep: int):
+        """ลบ change feed ที่เก่ากว่า keep รายการล่าสุด"""
+        latest = self.latest_change()
+        if latest > keep:
+            self._write(lambda conn: conn.execute('DELETE FROM changes WHERE seq <= ?', (latest - keep,)))
+
+    def get_rows(self, table, ids):
+        if table not in TABLES:
+            raise ValueError(f'ไม่รู้จักตาราง: {table}')
+        ids = list(ids)
+        rows = {}
+        conn = self._connect()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for row in conn.execute(f'SELECT id, data FROM {table} WHERE id IN ({placeholders})', chunk):
+                rows[row[0]] = self._decode(row)
+        return rows
+
+    def migrate_from_json(self, data_dir: str) -> bool:
+        """ย้ายข้อมูลจาก data/*.json เข้า SQLite ครั้งเดียว (ไฟล์เดิมยังเก็บไว้) คืนค่า True ถ้าย้ายครั้งนี้
+
+        id ที่ซ้ำหรือไม่ใช่จำนวนเต็มจะได้ id ใหม่แทนการเขียนทับแถวเดิม และอ้างอิงถึง id นั้นถูกแก้ตาม
+        """
+        source = JSONDataStore(data_dir)
+
+        def migrate(conn):
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                return False
+            agents, agent_ids = _assign_ids(source.list_agents(), 'agent')
+            for agent in agents:
+                if agent.get('training_data'):
+                    training_data, _ = _assign_ids(agent['training_data'], f"training_data ของ agent {agent['id']}")
+                    agent = {**agent, 'training_data': training_data}
+                conn.execute('INSERT INTO agents (id, data) VALUES (?, ?)', (agent['id'], self._encode(agent)))
+
+            webhook_ids, url_paths = set(), set()
+            for webhook in source.list_webhooks():
+                webhook = _remap_agent_id(webhook, agent_ids)
+                if webhook.get('url_path') in url_paths:
+                    print(f"ข้าม webhook {webhook.get('id')} ระหว่างย้ายข้อมูล: url_path {webhook['url_path']} ซ้ำ")
+                    continue
+                if webhook.get('id') in (None, '') or str(webhook['id']) in webhook_ids:
+                    new_id = str(uuid.uuid4())
+                    print(f"ย้ายข้อมูล webhook: id {webhook.get('id')!r} ซ้ำหรือว่าง เปลี่ยนเป็น {new_id}")
+                    webhook = {**webhook, 'id': new_id}
+                webhook_ids.add(str(webhook['id']))
+                if webhook.get('url_path') is not None:
+                    url_paths.add(webhook['url_path'])
+                conn.execute('INSERT INTO webhooks (id, url_path, data) VALUES (?, ?, ?)',
+                             (str(webhook['id']), webhook.get('url_path'), self._encode(webhook)))
+
+            training_data, _ = _assign_ids(source.list_training_data(), 'training_data')
+            for item in training_data:
+                item = _remap_agent_id(item, agent_ids)
+                conn.execute('INSERT INTO training_data (id, data) VALUES (?, ?)', (item['id'], self._encode(item)))
+            self._bump_webhooks_version(conn)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', datetime('now'))")
+            return True
+        return self._write(migrate)
+
+
+def _valid_id(value) -> Optional[int]:
+    """id ที่ใช้เป็น INTEGER PRIMARY KEY ได้ (รับตัวเลขที่เป็นข้อความด้วย) หรือ None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value) if int(value) > 0 else None
+    return None
+
+
+def _assign_ids(docs: List[Dict[str, Any]], label: str) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """กำหนด id ให้ไม่ซ้ำกัน: แถวแรกที่ใช้ id ใดได้ id นั้น แถวที่ซ้ำหรือ id ไม่ถูกต้องได้ id ใหม่
+
+    คืนค่า (เอกสารที่มี id แล้ว, {id เดิมแบบข้อความ: id ใหม่}) สำหรับ id ที่ถูกเปลี่ยนและอ้างอิงได้ไม่กำกวม
+    (id ที่ซ้ำไม่อยู่ใน mapping เพราะอ้างอิงเดิมชี้ไปที่แถวแรกอยู่แล้ว)
+    """
+    used = set()
+    kept = []
+    for doc in docs:
+        doc_id = _valid_id(doc.get('id'))
+        if doc_id is None or doc_id in used:
+            kept.append(None)
+        else:
+            used.add(doc_id)
+            kept.append(doc_id)
+    next_id = max(used, default=0) + 1
+    result, remapped = [], {}
+    for doc, doc_id in zip(docs, kept):
+        if doc_id is None:
+            doc_id, next_id = next_id, next_id + 1
+            old = doc.get('id')
+            print(f"ย้ายข้อมูล {label}: id {old!r} ซ้ำหรือไม่ถูกต้อง เปลี่ยนเป็น {doc_id}")
+            if old is not None and _valid_id(old) not in used:
+                remapped[str(old)] = doc_id
+        elif str(doc_id) != str(doc.get('id')):
+            remapped[str(doc.get('id'))] = doc_id
+        result.append({**doc, 'id': doc_id})
+    return result, remapped
+
+
+def _remap_agent_id(doc: Dict[str, Any], agent_ids: Dict[str, int]) -> Dict[str, Any]:
+    """แก้ agent_id ที่อ้างถึง agent ที่ถูกเปลี่ยน id ระหว่างย้ายข้อมูล (คงชนิดข้อมูลเดิมไว้)"""
+    old = doc.get('agent_id')
+    if old is None or str(old) not in agent_ids:
+        return doc
+    new_id = agent_ids[str(old)]
+    print(f"ย้ายข้อมูล: agent_id {old!r} ของ {doc.get('id')!r} เปลี่ยนเป็น {new_id}")
+    return {**doc, 'agent_id': str(new_id) if isinstance(old, str) else new_id}
+
+def create_data_store(backend: str, data_dir: str, db_path: str) -> DataStore:
+    """สร้างที่เก็บข้อมูลตาม backend ที่กำหนด (sqlite หรือ json)"""
+    if backend == 'json':
+        return JSONDataStore(data_dir)
+    if backend == 'sqlite':
+        store = SQLiteDataStore(db_path)
+        try:
+            store.migrate_from_json(data_dir)
+        except Exception as e:
+            # ข้อมูลเดิมเสียหายต้องไม่ทำให้แอปเริ่มไม่ได้ (ไฟล์ JSON ยังอยู่ ย้ายใหม่ได้หลังแก้ไฟล์)
+            print(f"เกิดข้อผิดพลาดในการย้ายข้อมูลจาก JSON: {str(e)}")
+        return store
+    raise ValueError(f'ไม่รู้จัก data backend: {backend}')
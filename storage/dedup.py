@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+STATE_PENDING = 'pending'
+STATE_DONE = 'done'
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+HASH_PREFIX = 'sha256:'
+
+
+def event_key(payload: Any, headers=None, hash_payload: bool = True) -> Optional[str]:
+    """key ของ event สำหรับตรวจการส่งซ้ำ
+
+    ใช้ header Idempotency-Key ถ้ามี, webhookEventId ของ LINE (ทุก event ใน payload)
+    ไม่เช่นนั้นใช้ hash ของ payload (JSON ที่เรียง key แล้ว) หรือคืนค่า None ถ้า hash_payload เป็น False
+    """
+    if headers is not None and headers.get(IDEMPOTENCY_HEADER):
+        return 'key:' + headers.get(IDEMPOTENCY_HEADER)[:200]
+    if isinstance(payload, dict):
+        events = payload.get('events')
+        if isinstance(events, list) and events:
+            ids = [event.get('webhookEventId') for event in events if isinstance(event, dict)]
+            if all(ids) and len(ids) == len(events):
+                return 'line:' + ','.join(sorted(ids))
+        if payload.get('webhookEventId'):
+            return 'line:' + str(payload['webhookEventId'])
+    if not hash_payload:
+        return None
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return HASH_PREFIX + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class Deduplicator:
+    """ตรวจ event ที่ถูกส่งซ้ำ (เช่น LINE ส่งใหม่เมื่อ timeout) และเก็บผลครั้งแรกไว้ตอบซ้ำ
+
+    ตาราง recent_events บน SQLite เป็นข้อมูลหลักที่ทุก process ใช้ร่วมกัน เก็บ key ไว้ window วินาที
+    ยกเว้น key ที่มาจาก hash ของ payload เก็บไว้แค่ hash_window วินาที (ข้อความเดิมที่ผู้ใช้ส่งใหม่ภายหลังต้องไม่ถูกตัดทิ้ง)
+    ผลที่เสร็จแล้วล่าสุด cache_size รายการเก็บในหน่วยความจำด้วย การส่งซ้ำจึงไม่ต้องแตะฐานข้อมูล
+    claim(key) คืนค่า None ถ้าเป็น event ใหม่ (ผู้เรียกต้อง complete หรือ release ภายหลัง)
+    ไม่เช่นนั้นคืนค่า record ของครั้งก่อน ({'state', 'response', 'status_code'})
+    """
+
+    def __init__(self, path: str, window: float = 86400.0, pending_timeout: float = 300.0,
+                 cache_size: int = 10000, cleanup_every: int = 1000, hash_window: float = 60.0):
+        self.path = path
+        self.window = window
+        self.hash_window = hash_window
+        self.pending_timeout = pending_timeout
+        self.cache_size = cache_size
+        self.cleanup_every = cleanup_every
+        self.new = 0
+        self.duplicates = 0
+        self._claims = 0
+        self._cache: OrderedDict = OrderedDict()
+        self._waiters: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS recent_events (
+                key TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                response TEXT,
+                status_code INTEGER,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._connect().execute('CREATE INDEX IF NOT EXISTS ix_recent_events_created_at ON recent_events (created_at)')
+
+    def _connect(self) -> sqlite3.Connection:
+        """connection แยกต่อ thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _window(self, key: str) -> float:
+        """ระยะเวลาที่จำ key นี้ (key จาก hash ของ payload ใช้ window ที่สั้นกว่า)"""
+        return self.hash_window if key.startswith(HASH_PREFIX) else self.window
+
+    def _cached(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return item[1]
+
+    def _remember(self, key: str, record: Dict[str, Any], created_at: float):
+        with self._lock:
+            self._cache[key] = (created_at + self._window(key), record)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def claim(self, key: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """จอง key ของ event คืนค่า None ถ้าเป็น event ใหม่ หรือ record ของครั้งก่อนถ้าเป็นการส่งซ้ำ
+
+        ถ้าครั้งก่อนยังประมวลผลอยู่จะรอผลไม่เกิน wait วินาที (record ที่คืนอาจยังเป็น pending)
+        """
+        record = self._claim(key)
+        if record is not None and record['state'] == STATE_PENDING and wait > 0:
+            record = self.wait(key, wait)
+            if record is None:
+                # ครั้งก่อนล้มเหลวและยกเลิกการจองไปแล้ว จองใหม่เพื่อประมวลผลเอง
+                record = self._claim(key)
+        return record
+
+    def _claim(self, key: str) -> Optional[Dict[str, Any]]:
+        record = self._cached(key)
+        if record is not None:
+            self.duplicates += 1
+            return record
+
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT state, response, status_code, created_at FROM recent_events WHERE key = ?', (key,)
+            ).fetchone()
+            stale = row is not None and (
+                row[3] < now - self._window(key) or (row[0] == STATE_PENDING and row[3] < now - self.pending_timeout)
+            )
+            if row is None or stale:
+                # event ใหม่ (หรือครั้งก่อนหมดอายุ/ค้างจาก process ที่ตายไป)
+                conn.execute(
+                    'INSERT OR REPLACE INTO recent_events (key, state, response, status_code, created_at) '
+                    'VALUES (?, ?, NULL, NULL, ?)',
+                    (key, STATE_PENDING, now)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        if row is None or stale:
+            with self._lock:
+                self._waiters[key] = threading.Event()
+                self.new += 1
+                self._claims += 1
+                cleanup = self.cleanup_every and self._claims % self.cleanup_every == 0
+            if cleanup:
+                self.cleanup()
+            return None
+
+        self.duplicates += 1
+        record = self._record(row)
+        if row[0] == STATE_DONE:
+            self._remember(key, record, row[3])
+        return record
+
+    @staticmethod
+    def _record(row) -> Dict[str, Any]:
+        return {
+            'state': row[0],
+            'response': json.loads(row[1]) if row[1] is not None else None,
+            'status_code': row[2]
+        }
+
+    def complete(self, key: str, response: Any, status_code: int = 200):
+        """บันทึกผลของ event ที่ claim ไว้ (ใช้ตอบการส่งซ้ำครั้งถัดไป)"""
+        now = time.time()
+        self._connect().execute(
+            'UPDATE recent_events SET state = ?, response = ?, status_code = ? WHERE key = ?',
+            (STATE_DONE, json.dumps(response, ensure_ascii=False, default=str), status_code, key)
+        )
+        self._remember(key, {'state': STATE_DONE, 'response': response, 'status_code': status_code}, now)
+        self._wake(key)
+
+    def release(self, key: str):
+        """ยกเลิกการจอง (ประมวลผลไม่สำเร็จ) ให้การส่งซ้ำครั้งถัดไปประมวลผลใหม่ได้"""
+        self._connect().execute(
+            'DELETE FROM recent_events WHERE key = ? AND state = ?', (key, STATE_PENDING)
+        )
+        self._wake(key)
+
+    def _wake(self, key: str):
+        with self._lock:
+            waiter = self._waiters.pop(key, None)
+        if waiter is not None:
+            waiter.set()
+
+    def wait(self, key: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """รอผลของ event ที่กำลังประมวลผลอยู่ไม่เกิน timeout วินาที คืนค่า record ล่าสุด (None ถ้าถูกยกเลิก)"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            waiter = self._waiters.get(key)
+        if waiter is not None:
+            # กำลังประมวลผลใน process นี้ รอสัญญาณแทนการ poll ฐานข้อมูล
+            waiter.wait(timeout)
+        while True:
+            record = self._cached(key)
+            if record is not None:
+                return record
+            row = self._connect().execute(
+                'SELECT state, response, status_code, created_at FROM recent_events WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] == STATE_DONE or time.monotonic() >= deadline:
+                return self._record(row)
+            time.sleep(min(0.1, max(0.0, deadline - time.monotonic())))
+
+    def cleanup(self):
+        """ลบ key ที่เก่ากว่า window (key จาก hash ใช้ hash_window)"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('DELETE FROM recent_events WHERE created_at < ?', (now - self.window,))
+        conn.execute(
+            'DELETE FROM recent_events WHERE key LIKE ? AND created_at < ?',
+            (HASH_PREFIX + '%', now - self.hash_window)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'new': self.new,
+                'duplicates': self.duplicates,
+                'cached': len(self._cache),
+                'in_flight': len(self._waiters)
+            }
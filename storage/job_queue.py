@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DEAD = 'dead'
+
+
+class QueueFull(Exception):
+    """คิวเต็ม (เกิน max_depth) ผู้เรียกควรตอบกลับให้ส่งใหม่ภายหลัง"""
+
+
+class LostClaim(Exception):
+    """งานไม่ได้ถูก claim ด้วย token นี้แล้ว (เกิน visibility_timeout และถูกคืนเข้าคิวหรือ worker อื่นรับไป)"""
+
+
+class RetryLater(Exception):
+    """handler ขอเลื่อนงานออกไป delay วินาที (เช่น เกินขีดจำกัด) โดยไม่นับเป็นความล้มเหลว"""
+
+    def __init__(self, message: str = '', delay: float = 1.0):
+        super().__init__(message)
+        self.delay = delay
+
+
+class JobQueue:
+    """คิวงานแบบ durable บน SQLite ใช้ร่วมกันได้หลาย process/thread
+
+    งานที่ถูก claim แล้วแต่ worker ตายไปจะกลับมาอยู่ในคิวหลัง visibility_timeout (หรือเป็น dead ถ้าลองครบแล้ว)
+    งานที่ล้มเหลวจะถูกลองใหม่แบบ exponential backoff จนครบ max_attempts แล้วจึงเป็น dead
+    ทุกครั้งที่ claim จะได้ token ใหม่ complete/fail/release ต้องส่ง token นั้นมา worker ที่ช้าจนเกิน
+    visibility_timeout จึงแก้งานที่ worker อื่นรับไปแล้วไม่ได้ (raise LostClaim)
+    """
+
+    def __init__(self, path: str, max_depth: int = 10000, max_attempts: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 visibility_timeout: float = 300.0):
+        self.path = path
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        """connection แยกต่อ thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                locked_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                claim_token TEXT
+            )
+        """)
+        # คิวที่สร้างก่อนมี claim_token
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'claim_token' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN claim_token TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status_available ON jobs (status, available_at)')
+
+    def depth(self) -> int:
+        """จำนวนงานที่ยังไม่เสร็จ (รอและกำลังทำ)"""
+        row = self._connect().execute(
+            'SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)',
+            (STATUS_PENDING, STATUS_RUNNING)
+        ).fetchone()
+        return row[0]
+
+    def put(self, payload: Dict[str, Any], delay: float = 0.0) -> int:
+        """เพิ่มงานเข้าคิว ถ้าคิวเต็มจะ raise QueueFull"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self.max_depth and self.depth() >= self.max_depth:
+                raise QueueFull(f'คิวเต็ม ({self.max_depth} งาน)')
+            cursor = conn.execute(
+                'INSERT INTO jobs (payload, status, available_at, created_at) VALUES (?, ?, ?, ?)',
+                (json.dumps(payload, ensure_ascii=False), STATUS_PENDING, now + delay, now)
+            )
+            conn.execute('COMMIT')
+            return cursor.lastrowid
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def claim(self) -> Optional[Tuple[int, Dict[str, Any], int, str]]:
+        """ดึงงานถัดไปที่พร้อมทำ คืนค่า (job_id, payload, attempts, token) หรือ None"""
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # งานของ worker ที่หายไป: ลองครบแล้วเป็น dead ที่เหลือคืนกลับเข้าคิว
+            conn.execute(
+                'UPDATE jobs SET status = ?, last_error = ?, locked_until = NULL, claim_token = NULL '
+                'WHERE status = ? AND locked_until < ? AND attempts >= ?',
+                (STATUS_DEAD, 'visibility timeout: worker ไม่ตอบกลับ', STATUS_RUNNING, now, self.max_attempts)
+            )
+            conn.execute(
+                'UPDATE jobs SET status = ?, locked_until = NULL, claim_token = NULL '
+                'WHERE status = ? AND locked_until < ?',
+                (STATUS_PENDING, STATUS_RUNNING, now)
+            )
+            row = conn.execute(
+                'SELECT id, payload, attempts FROM jobs WHERE status = ? AND available_at <= ? '
+                'ORDER BY available_at, id LIMIT 1',
+                (STATUS_PENDING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            token = uuid.uuid4().hex
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?, claim_token = ? WHERE id = ?',
+                (STATUS_RUNNING, now + self.visibility_timeout, token, row[0])
+            )
+            conn.execute('COMMIT')
+            return row[0], json.loads(row[1]), row[2] + 1, token
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _owned(cursor, job_id: int):
+        """ตรวจว่าคำสั่งที่ใช้ token แก้งานได้จริง ไม่เช่นนั้น raise LostClaim"""
+        if cursor.rowcount == 0:
+            raise LostClaim(f'งาน {job_id} ไม่ได้ถูก claim ด้วย token นี้แล้ว')
+
+    def complete(self, job_id: int, token: str):
+        """ลบงานที่ทำเสร็จแล้วออกจากคิว"""
+        cursor = self._connect().execute(
+            'DELETE FROM jobs WHERE id = ? AND status = ? AND claim_token = ?', (job_id, STATUS_RUNNING, token)
+        )
+        self._owned(cursor, job_id)
+
+    def release(self, job_id: int, token: str, delay: float = 0.0):
+        """คืนงานที่ claim ไว้กลับเข้าคิวหลัง delay วินาที (ไม่นับเป็นการลองครั้งหนึ่ง)"""
+        cursor = self._connect().execute(
+            'UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), available_at = ?, locked_until = NULL, '
+            'claim_token = NULL WHERE id = ? AND status = ? AND claim_token = ?',
+            (STATUS_PENDING, time.time() + delay, job_id, STATUS_RUNNING, token)
+        )
+        self._owned(cursor, job_id)
+
+    def fail(self, job_id: int, token: str, error: str) -> bool:
+        """บันทึกความล้มเหลว คืนค่า True ถ้าจะลองใหม่ False ถ้างานกลายเป็น dead"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT attempts FROM jobs WHERE id = ? AND status = ? AND claim_token = ?',
+            (job_id, STATUS_RUNNING, token)
+        ).fetchone()
+        if row is None:
+            raise LostClaim(f'งาน {job_id} ไม่ได้ถูก claim ด้วย token นี้แล้ว')
+        attempts = row[0]
+        if attempts >= self.max_attempts:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, last_error = ?, locked_until = NULL, claim_token = NULL '
+                'WHERE id = ? AND claim_token = ?',
+                (STATUS_DEAD, error, job_id, token)
+            )
+            self._owned(cursor, job_id)
+            return False
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        delay *= 0.5 + random.random() / 2
+        cursor = conn.execute(
+            'UPDATE jobs SET status = ?, last_error = ?, available_at = ?, locked_until = NULL, claim_token = NULL '
+            'WHERE id = ? AND claim_token = ?',
+            (STATUS_PENDING, error, time.time() + delay, job_id, token)
+        )
+        self._owned(cursor, job_id)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """จำนวนงานแยกตามสถานะ"""
+        counts = {STATUS_PENDING: 0, STATUS_RUNNING: 0, STATUS_DEAD: 0}
+        for status, count in self._connect().execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status'):
+            counts[status] = count
+        counts['depth'] = counts[STATUS_PENDING] + counts[STATUS_RUNNING]
+        return counts
@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import bisect
+import threading
+from typing import Dict, Any, List, Optional, Iterator
+
+from .file_lock import FileLock
+import metrics
+
+SEGMENT_SUFFIX = '.jsonl'
+INDEX_FILE = 'index.jsonl'
+LOCK_FILE = '.lock'
+
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+
+
+class _LogState:
+    """สถานะของ segment ที่กำลังเขียนอยู่ (cache ภายใน process)"""
+
+    def __init__(self, base: int, size: int, count: int):
+        self.base = base
+        self.size = size
+        self.count = count
+        self.last_fsync = 0.0
+
+
+class _IndexCache:
+    """cache ของไฟล์ index ที่อ่านเพิ่มทีละส่วน"""
+
+    def __init__(self):
+        self.read_bytes = 0
+        self.seqs: List[int] = []
+        self.timestamps: List[str] = []
+        self.entries: List[Dict[str, Any]] = []
+
+
+class LogStore:
+    """ที่เก็บ log แบบ append-only แบ่งเป็น segment (JSON Lines) พร้อม index ตาม seq/เวลา
+
+    แต่ละ log (เช่น webhook หนึ่งตัว) มีโฟลเดอร์ของตัวเอง ภายในมีไฟล์ segment
+    ชื่อตาม seq แรกของ segment และไฟล์ index.jsonl ที่บันทึกตำแหน่ง byte
+    ทุก ๆ index_interval รายการ การเขียนหนึ่งครั้งจึงใช้เวลาคงที่
+    และการอ่านหนึ่งหน้าไม่ต้อง parse ประวัติทั้งหมด
+    """
+
+    def __init__(self, base_dir: str, segment_max_bytes: int = 8 * 1024 * 1024,
+                 fsync: str = FSYNC_INTERVAL, fsync_interval: float = 1.0,
+                 index_interval: int = 100):
+        if fsync not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f'fsync policy ไม่ถูกต้อง: {fsync}')
+        self.base_dir = base_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.index_interval = max(1, index_interval)
+        self._states: Dict[str, _LogState] = {}
+        self._indexes: Dict[str, _IndexCache] = {}
+        self._locks: Dict[str, FileLock] = {}
+        self._migrated = set()
+        self._guard = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # path helpers
+    # ------------------------------------------------------------------
+    def _log_dir(self, log_id: str) -> str:
+        return os.path.join(self.base_dir, str(log_id))
+
+    def _segment_path(self, log_id: str, base: int) -> str:
+        return os.path.join(self._log_dir(log_id), f'{base:020d}{SEGMENT_SUFFIX}')
+
+    def _lock(self, log_id: str) -> FileLock:
+        with self._guard:
+            lock = self._locks.get(log_id)
+            if lock is None:
+                lock = FileLock(os.path.join(self._log_dir(log_id), LOCK_FILE))
+                self._locks[log_id] = lock
+            return lock
+
+    def _segments(self, log_id: str) -> List[int]:
+        """รายการ seq เริ่มต้นของทุก segment เรียงจากเก่าไปใหม่"""
+        log_dir = self._log_dir(log_id)
+        if not os.path.isdir(log_dir):
+            return []
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(log_dir)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    @staticmethod
+    def _count_lines(path: str, start: int = 0, end: Optional[int] = None) -> int:
+        """นับจำนวนบรรทัดในช่วง byte ที่กำหนด"""
+        count = 0
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(65536 if remaining is None else min(65536, remaining))
+                if not chunk:
+                    break
+                count += chunk.count(b'\n')
+                if remaining is not None:
+                    remaining -= len(chunk)
+        return count
+
+    # ------------------------------------------------------------------
+    # write path
+    # ------------------------------------------------------------------
+    def _sync_state(self, log_id: str) -> _LogState:
+        """ปรับ state ของ segment ปัจจุบันให้ตรงกับไฟล์ (ต้องถือ lock อยู่)"""
+        state = self._states.get(log_id)
+        if state is None:
+            segments = self._segments(log_id)
+            base = segments[-1] if segments else 0
+            path = self._segment_path(log_id, base)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            count = self._count_lines(path) if size else 0
+            state = _LogState(base, size, count)
+            self._states[log_id] = state
+        else:
+            # process อื่นอาจเขียนต่อท้ายไปแล้ว นับเพิ่มเฉพาะส่วนที่เพิ่มมา
+            path = self._segment_path(log_id, state.base)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size > state.size:
+                state.count += self._count_lines(path, state.size, size)
+                state.size = size
+
+        # หมุน segment เมื่อขนาดเกินกำหนด
+        while state.size >= self.segment_max_bytes and state.count > 0:
+            base = state.base + state.count
+            path = self._segment_path(log_id, base)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            count = self._count_lines(path) if size else 0
+            state.base, state.size, state.count = base, size, count
+        return state
+
+    def append(self, log_id: str, record: Dict[str, Any]) -> int:
+        """เพิ่ม record ต่อท้าย log และคืนค่า seq ของ record นั้น"""
+        log_id = str(log_id)
+        with self._lock(log_id), metrics.stage('log_append'):
+            state = self._sync_state(log_id)
+            seq = state.base + state.count
+            line = json.dumps({**record, 'seq': seq}, ensure_ascii=False) + '\n'
+            data = line.encode('utf-8')
+            offset = state.size
+
+            path = self._segment_path(log_id, state.base)
+            with open(path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                if self._should_fsync(state):
+                    os.fsync(f.fileno())
+
+            state.size += len(data)
+            state.count += 1
+
+            if offset == 0 or seq % self.index_interval == 0:
+                entry = {
+                    'seq': seq,
+                    'segment': state.base,
+                    'offset': offset,
+                    'ts': record.get('created_at')
+                }
+                index_path = os.path.join(self._log_dir(log_id), INDEX_FILE)
+                with open(index_path, 'ab') as f:
+                    f.write((json.dumps(entry) + '\n').encode('utf-8'))
+                    f.flush()
+                    if self.fsync == FSYNC_ALWAYS:
+                        os.fsync(f.fileno())
+            return seq
+
+    def _should_fsync(self, state: _LogState) -> bool:
+        if self.fsync == FSYNC_ALWAYS:
+            return True
+        if self.fsync == FSYNC_INTERVAL:
+            now = time.monotonic()
+            if now - state.last_fsync >= self.fsync_interval:
+                state.last_fsync = now
+                return True
+        return False
+
+    # ------------------------------------------------------------------
+    # read path
+    # ------------------------------------------------------------------
+    def _load_index(self, log_id: str) -> _IndexCache:
+        """อ่าน index เฉพาะส่วนที่เพิ่มขึ้นตั้งแต่ครั้งก่อน"""
+        index_path = os.path.join(self._log_dir(log_id), INDEX_FILE)
+        with self._guard:
+            cache = self._indexes.setdefault(log_id, _IndexCache())
+            if not os.path.exists(index_path):
+                return cache
+            size = os.path.getsize(index_path)
+            if size <= cache.read_bytes:
+                return cache
+            with open(index_path, 'rb') as f:
+                f.seek(cache.read_bytes)
+                chunk = f.read(size - cache.read_bytes)
+            # อ่านเฉพาะบรรทัดที่เขียนเสร็จแล้ว
+            complete = chunk[:chunk.rfind(b'\n') + 1]
+            for raw in complete.splitlines():
+                if not raw.strip():
+                    continue
+                entry = json.loads(raw)
+                cache.entries.append(entry)
+                cache.seqs.append(entry['seq'])
+                cache.timestamps.append(entry.get('ts') or '')
+            cache.read_bytes += len(complete)
+            return cache
+
+    def count(self, log_id: str) -> int:
+        """จำนวน record ทั้งหมดใน log"""
+        log_id = str(log_id)
+        if not os.path.isdir(self._log_dir(log_id)):
+            return 0
+        with self._lock(log_id):
+            state = self._sync_state(log_id)
+            return state.base + state.count
+
+    def iter_records(self, log_id: str, start_seq: int = 0) -> Iterator[Dict[str, Any]]:
+        """วนอ่าน record ตั้งแต่ seq ที่กำหนดเป็นต้นไป โดยกระโดดไปยังตำแหน่งจาก index"""
+        log_id = str(log_id)
+        segments = self._segments(log_id)
+        if not segments:
+            return
+        start_seq = max(0, start_seq)
+        seg_pos = max(0, bisect.bisect_right(segments, start_seq) - 1)
+
+        # หาตำแหน่ง byte ที่ใกล้ที่สุดจาก index
+        offset, skip = 0, start_seq - segments[seg_pos]
+        index = self._load_index(log_id)
+        pos = bisect.bisect_right(index.seqs, start_seq) - 1
+        if pos >= 0:
+            entry = index.entries[pos]
+            if entry['segment'] == segments[seg_pos]:
+                offset, skip = entry['offset'], start_seq - entry['seq']
+
+        for base in segments[seg_pos:]:
+            path = self._segment_path(log_id, base)
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with f:
+                f.seek(offset)
+                for raw in f:
+                    if not raw.endswith(b'\n'):
+                        break  # บรรทัดที่ยังเขียนไม่เสร็จ
+                    if skip > 0:
+                        skip -= 1
+                        continue
+                    yield json.loads(raw)
+            offset, skip = 0, 0
+
+    def iter_records_reverse(self, log_id: str, before_seq: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """วนอ่าน record จากใหม่ไปเก่า เริ่มจาก seq ก่อน before_seq (None = ล่าสุด)
+
+        อ่านทีละช่วงระหว่างจุดใน index (ไม่เกิน index_interval รายการ) แล้วส่งออกกลับลำดับ
+        """
+        log_id = str(log_id)
+        end = self.count(log_id)
+        if before_seq is not None:
+            end = min(end, before_seq)
+        index = self._load_index(log_id)
+        while end > 0:
+            pos = bisect.bisect_right(index.seqs, end - 1) - 1
+            start = index.seqs[pos] if pos >= 0 else 0
+            # ช่วงต้องไม่ยาวเกิน index_interval แม้ index ของส่วนท้ายจะยังเขียนไม่ทัน
+            start = max(start, end - self.index_interval)
+            chunk = []
+            for record in self.iter_records(log_id, start):
+                if record['seq'] >= end:
+                    break
+                chunk.append(record)
+            for record in reversed(chunk):
+                yield record
+            end = start
+
+    def read(self, log_id: str, offset: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """อ่าน record หนึ่งหน้าเริ่มจาก seq ที่ offset"""
+        records = []
+        if limit is not None and limit <= 0:
+            return records
+        for record in self.iter_records(log_id, offset):
+            records.append(record)
+            if limit is not None and len(records) >= limit:
+                break
+        return records
+
+    def scan(self, log_id: str, after: Optional[int] = None, since: Optional[str] = None,
+             until: Optional[str] = None, predicate=None) -> Iterator[Dict[str, Any]]:
+        """วนอ่าน record ที่ seq มากกว่า after และ created_at อยู่ในช่วง [since, until] (เก่าไปใหม่)
+
+        ใช้ index กระโดดไปยัง since และหยุดอ่านเมื่อเลย until (record เรียงตามเวลาที่เขียน)
+        predicate(record) ใช้กรองเพิ่มเติม เช่น status_code
+        """
+        start = 0 if after is None else after + 1
+        if since:
+            start = max(start, self.seq_at_time(log_id, since))
+        for record in self.iter_records(log_id, start):
+            created_at = record.get('created_at') or ''
+            if since and created_at < since:
+                continue
+            if until and created_at > until:
+                break
+            if predicate is not None and not predicate(record):
+                continue
+            yield record
+
+    def scan_reverse(self, log_id: str, before: Optional[int] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, predicate=None) -> Iterator[Dict[str, Any]]:
+        """เหมือน scan แต่เรียงจากใหม่ไปเก่า: record ที่ seq น้อยกว่า before และ created_at อยู่ในช่วง [since, until]
+
+        ใช้ index กระโดดไปยัง until และหยุดอ่านเมื่อเลย since
+        """
+        if until:
+            index = self._load_index(str(log_id))
+            pos = bisect.bisect_right(index.timestamps, until)
+            if pos < len(index.seqs):
+                before = index.seqs[pos] if before is None else min(before, index.seqs[pos])
+        for record in self.iter_records_reverse(log_id, before):
+            created_at = record.get('created_at') or ''
+            if until and created_at > until:
+                continue
+            if since and created_at < since:
+                break
+            if predicate is not None and not predicate(record):
+                continue
+            yield record
+
+    def seq_at_time(self, log_id: str, timestamp: str) -> int:
+        """seq ที่ควรเริ่มอ่านเพื่อหา record ที่สร้างตั้งแต่เวลาที่กำหนด (ค่าประมาณจาก index)"""
+        index = self._load_index(str(log_id))
+        pos = bisect.bisect_left(index.timestamps, timestamp) - 1
+        return index.seqs[pos] if pos >= 0 else 0
+
+    # ------------------------------------------------------------------
+    # migration
+    # ------------------------------------------------------------------
+    def migrate_legacy(self, log_id: str, legacy_path: str) -> int:
+        """ย้าย log จากไฟล์ JSON แบบเดิม (ทั้งไฟล์เป็น list) เข้ามาเก็บใน store ครั้งเดียว"""
+        log_id = str(log_id)
+        if log_id in self._migrated:
+            return 0
+        migrated = 0
+        if os.path.exists(legacy_path):
+            with self._lock(log_id):
+                if os.path.exists(legacy_path):
+                    with open(legacy_path, 'r', encoding='utf-8') as f:
+                        records = json.load(f)
+                    for record in records:
+                        self.append(log_id, record)
+                        migrated += 1
+                    os.replace(legacy_path, legacy_path + '.migrated')
+        self._migrated.add(log_id)
+        return migrated
@@ -0,0 +1,156 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+
+class RateLimited(Exception):
+    """เกินขีดจำกัด (retry_after = จำนวนวินาทีที่ควรรอก่อนส่งใหม่)"""
+
+    def __init__(self, message: str, retry_after: float = 1.0, scope: str = ''):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+def default_burst(rate_per_minute: float) -> int:
+    """burst เริ่มต้น = จำนวน request ที่ใช้ได้ใน 10 วินาที (อย่างน้อย 1)"""
+    return max(1, int(rate_per_minute / 6))
+
+
+class RateLimiter:
+    """token bucket ต่อ key และจำกัดจำนวนงานที่ทำพร้อมกันทั้งระบบ
+
+    สถานะเก็บใน SQLite (WAL) ไฟล์เดียวกัน ทุก worker process จึงใช้ขีดจำกัดเดียวกัน
+    bucket เติม rate_per_minute token ต่อนาที เก็บได้ไม่เกิน burst
+    งานที่ทำพร้อมกันนับจาก lease ที่ยังไม่หมดอายุ (lease ของ process ที่ตายไปหมดอายุเองใน lease_timeout วินาที)
+    """
+
+    def __init__(self, path: str, max_in_flight: int = 0, lease_timeout: float = 120.0):
+        self.path = path
+        self.max_in_flight = max_in_flight
+        self.lease_timeout = lease_timeout
+        self.allowed = 0
+        self.limited = 0
+        self.deferred = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS leases (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        """connection แยกต่อ thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def acquire(self, key: str, rate_per_minute: float, burst: Optional[int] = None,
+                max_delay: float = 0.0) -> Tuple[bool, float]:
+        """ขอ 1 token จาก bucket ของ key คืนค่า (ได้รับหรือไม่, วินาทีที่ต้องรอ)
+
+        ได้ทันที: (True, 0) / ยืม token ล่วงหน้าได้ถ้ารอไม่เกิน max_delay: (True, เวลาที่ต้องเลื่อนไป)
+        ไม่ได้: (False, เวลาที่ควรรอก่อนส่งใหม่) rate_per_minute <= 0 คือไม่จำกัด
+        """
+        if not rate_per_minute or rate_per_minute <= 0:
+            return True, 0.0
+        burst = burst or default_burst(rate_per_minute)
+        per_second = rate_per_minute / 60.0
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = float(burst) if row is None else min(float(burst), row[0] + (now - row[1]) * per_second)
+            # tokens ติดลบได้เมื่อยืมล่วงหน้า (งานที่ถูกเลื่อน) เวลารอ = token ที่ขาด / อัตราเติม
+            wait = max(0.0, (1.0 - tokens) / per_second)
+            allowed = wait <= max_delay
+            if allowed:
+                tokens -= 1.0
+            conn.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)', (key, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if not allowed:
+            self._count('limited')
+        elif wait > 0:
+            self._count('deferred')
+        else:
+            self._count('allowed')
+        return allowed, wait
+
+    def check(self, key: str, rate_per_minute: float, burst: Optional[int] = None):
+        """ขอ 1 token ถ้าไม่ได้จะ raise RateLimited"""
+        allowed, wait = self.acquire(key, rate_per_minute, burst)
+        if not allowed:
+            raise RateLimited(f'เกินขีดจำกัด {rate_per_minute:g} ครั้งต่อนาที ({key})', retry_after=wait, scope=key)
+
+    def enter(self) -> Optional[str]:
+        """จอง 1 ช่องของงานที่ทำพร้อมกัน คืนค่า lease id หรือ None ถ้าเต็ม"""
+        if not self.max_in_flight:
+            return ''
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM leases WHERE expires_at <= ?', (now,))
+            count = conn.execute('SELECT COUNT(*) FROM leases').fetchone()[0]
+            lease = None
+            if count < self.max_in_flight:
+                lease = uuid.uuid4().hex
+                conn.execute('INSERT INTO leases (id, expires_at) VALUES (?, ?)', (lease, now + self.lease_timeout))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return lease
+
+    def leave(self, lease: Optional[str]):
+        """คืนช่องที่จองไว้"""
+        if lease:
+            self._connect().execute('DELETE FROM leases WHERE id = ?', (lease,))
+
+    @contextmanager
+    def in_flight(self):
+        """จองช่องตลอดการทำงานใน block ถ้าเต็มจะ raise RateLimited"""
+        lease = self.enter()
+        if lease is None:
+            self._count('limited')
+            raise RateLimited(f'มีงานที่กำลังประมวลผลครบ {self.max_in_flight} งานแล้ว', retry_after=1.0, scope='in_flight')
+        try:
+            yield
+        finally:
+            self.leave(lease)
+
+    def in_flight_count(self) -> int:
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM leases WHERE expires_at > ?', (time.time(),)
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'limited': self.limited,
+                'deferred': self.deferred,
+                'max_in_flight': self.max_in_flight
+            }
@@ -0,0 +1,143 @@
+import time
+import threading
+from typing import Dict, Any, List, Optional
+
+from .data_store import DataStore, TABLES
+import metrics
+
+
+class SharedState:
+    """snapshot ของ agents / webhooks / training data ในหน่วยความจำของแต่ละ process
+
+    ทุก worker อ่านจาก snapshot ของตัวเอง และตรวจ data_version ของที่เก็บข้อมูลอย่างมาก
+    หนึ่งครั้งต่อ poll_interval วินาที เมื่อ process ใดเขียนข้อมูล (รวมถึง process อื่น)
+    จะอ่านเฉพาะแถวที่เปลี่ยนจาก change feed แล้วแก้ snapshot ทีละแถว
+    ถ้าที่เก็บข้อมูลไม่มี change feed (JSON) หรือ feed ถูกลบไปแล้ว จะโหลดใหม่ทั้งหมด
+    ข้อมูลที่คืนค่าเป็น object ที่ใช้ร่วมกัน ห้ามแก้ไขโดยตรง (แก้ผ่าน DataStore แล้วเรียก refresh)
+    """
+
+    def __init__(self, store: DataStore, poll_interval: float = 0.1, keep_changes: int = 10000):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.keep_changes = keep_changes
+        self.full_reloads = 0
+        self.rows_applied = 0
+        self._rows: Dict[str, Dict[Any, Dict[str, Any]]] = {table: {} for table in TABLES}
+        self._lists: Dict[str, Optional[List[Dict[str, Any]]]] = {}
+        self._by_path: Dict[str, Dict[str, Any]] = {}
+        self._version = None
+        self._seq = 0
+        self._pruned_seq = 0
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+
+    def reload(self):
+        """โหลด snapshot ใหม่ทั้งหมด"""
+        with self._lock:
+            # อ่านลำดับของ feed ก่อนข้อมูล การแก้ไขที่เกิดระหว่างนี้จะถูกอ่านซ้ำในรอบถัดไป (ไม่หายไป)
+            version = self.store.data_version()
+            seq = self.store.latest_change()
+            rows = {
+                'agents': self.store.list_agents(),
+                'webhooks': self.store.list_webhooks(),
+                'training_data': self.store.list_training_data()
+            }
+            self._rows = {table: {row['id']: row for row in items} for table, items in rows.items()}
+            self._by_path = {w['url_path']: w for w in rows['webhooks'] if w.get('url_path')}
+            self._lists = {}
+            self._version = version
+            self._seq = seq
+            self._next_check = time.monotonic() + self.poll_interval
+            self.full_reloads += 1
+
+    def refresh(self, force: bool = False) -> bool:
+        """อัพเดท snapshot ถ้าข้อมูลเปลี่ยน (force = ตรวจทันทีไม่รอ poll_interval) คืนค่า True ถ้ามีการเปลี่ยน"""
+        if not force and time.monotonic() < self._next_check:
+            return False
+        with self._lock:
+            if not force and time.monotonic() < self._next_check:
+                return False
+            try:
+                version = self.store.data_version()
+                if version == self._version and not force:
+                    return False
+                with metrics.stage('shared_state_refresh'):
+                    changes = self.store.changes_since(self._seq)
+                    if changes is None:
+                        self.reload()
+                        return True
+                    seq, changed = changes
+                    for table, ids in changed.items():
+                        self._apply(table, ids)
+                    self._version = version
+                    self._seq = seq
+                    if seq - self._pruned_seq >= self.keep_changes and hasattr(self.store, 'prune_changes'):
+                        self.store.prune_changes(self.keep_changes)
+                        self._pruned_seq = seq
+                    return bool(changed)
+            except Exception as e:
+                # ใช้ snapshot เดิมต่อไปถ้าอ่านการเปลี่ยนแปลงไม่สำเร็จ
+                print(f"เกิดข้อผิดพลาดในการอัพเดท shared state: {str(e)}")
+                return False
+            finally:
+                self._next_check = time.monotonic() + self.poll_interval
+
+    def _apply(self, table: str, ids):
+        """แทนที่/ลบแถวที่เปลี่ยนใน snapshot (ต้องถือ lock อยู่)"""
+        if table not in self._rows:
+            return
+        fresh = self.store.get_rows(table, ids)
+        rows = self._rows[table]
+        for row_id in ids:
+            old = rows.pop(row_id, None)
+            if table == 'webhooks' and old is not None and old.get('url_path'):
+                self._by_path.pop(old['url_path'], None)
+            row = fresh.get(row_id)
+            if row is None:
+                continue
+            rows[row_id] = row
+            if table == 'webhooks' and row.get('url_path'):
+                self._by_path[row['url_path']] = row
+        self._lists.pop(table, None)
+        self.rows_applied += len(ids)
+
+    def _list(self, table: str) -> List[Dict[str, Any]]:
+        self.refresh()
+        items = self._lists.get(table)
+        if items is None:
+            with self._lock:
+                items = self._lists[table] = list(self._rows[table].values())
+                if table != 'webhooks':
+                    items.sort(key=lambda row: row['id'])
+        return items
+
+    def list_agents(self) -> List[Dict[str, Any]]:
+        return self._list('agents')
+
+    def get_agent(self, agent_id) -> Optional[Dict[str, Any]]:
+        self.refresh()
+        return self._rows['agents'].get(agent_id)
+
+    def list_webhooks(self) -> List[Dict[str, Any]]:
+        return self._list('webhooks')
+
+    def get_webhook_by_path(self, url_path: str) -> Optional[Dict[str, Any]]:
+        self.refresh()
+        return self._by_path.get(url_path)
+
+    def get_webhook_by_id(self, webhook_id) -> Optional[Dict[str, Any]]:
+        self.refresh()
+        return self._rows['webhooks'].get(str(webhook_id))
+
+    def list_training_data(self) -> List[Dict[str, Any]]:
+        return self._list('training_data')
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'seq': self._seq,
+            'agents': len(self._rows['agents']),
+            'webhooks': len(self._rows['webhooks']),
+            'training_data': len(self._rows['training_data']),
+            'full_reloads': self.full_reloads,
+            'rows_applied': self.rows_applied
+        }
@@ -0,0 +1,111 @@
+import time
+import threading
+from typing import Dict, Any, List, Optional, Callable
+
+_UNSET = object()
+
+
+class WebhookRegistry:
+    """ดัชนี webhook ในหน่วยความจำ ค้นหาด้วย url_path และ id ได้ใน O(1)
+
+    loader คืนค่ารายการ webhook (list ของ dict) จากแหล่งข้อมูลจริง
+    version คืนค่าที่เปลี่ยนเมื่อแหล่งข้อมูลเปลี่ยน (เช่น mtime ของไฟล์)
+    ถ้าไม่ระบุ version จะโหลดใหม่ทุก check_interval วินาที (ใช้กับฐานข้อมูล)
+    การตรวจ version ทำอย่างมากหนึ่งครั้งต่อ check_interval การค้นหาปกติจึงไม่แตะไฟล์หรือฐานข้อมูล
+    """
+
+    def __init__(self, loader: Callable[[], List[Dict[str, Any]]],
+                 version: Optional[Callable[[], Any]] = None,
+                 check_interval: float = 1.0):
+        self._loader = loader
+        self._version_fn = version
+        self.check_interval = check_interval
+        self._by_path: Dict[str, Dict[str, Any]] = {}
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._version = _UNSET
+        self._next_check = 0.0
+        self._lock = threading.RLock()
+
+    def load(self, webhooks: List[Dict[str, Any]], version: Any = _UNSET):
+        """แทนที่ดัชนีทั้งหมดด้วยรายการ webhook ที่ให้มา"""
+        by_path = {}
+        by_id = {}
+        for webhook in webhooks:
+            by_id[str(webhook['id'])] = webhook
+            if webhook.get('url_path'):
+                by_path[webhook['url_path']] = webhook
+        with self._lock:
+            self._by_path = by_path
+            self._by_id = by_id
+            if version is not _UNSET:
+                self._version = version
+            self._next_check = time.monotonic() + self.check_interval
+
+    def mark_current(self, version: Any):
+        """บันทึกว่าดัชนีตรงกับแหล่งข้อมูลที่ version นี้แล้ว (หลังจากเขียนเอง)"""
+        with self._lock:
+            self._version = version
+
+    def upsert(self, webhook: Dict[str, Any]):
+        """เพิ่มหรืออัพเดท webhook หนึ่งตัวโดยไม่ต้องโหลดใหม่ทั้งหมด"""
+        key = str(webhook['id'])
+        with self._lock:
+            old = self._by_id.get(key)
+            if old is not None and old.get('url_path') != webhook.get('url_path'):
+                self._by_path.pop(old.get('url_path'), None)
+            self._by_id[key] = webhook
+            if webhook.get('url_path'):
+                self._by_path[webhook['url_path']] = webhook
+
+    def remove(self, webhook_id):
+        """ลบ webhook ออกจากดัชนี"""
+        with self._lock:
+            old = self._by_id.pop(str(webhook_id), None)
+            if old is not None:
+                self._by_path.pop(old.get('url_path'), None)
+
+    def invalidate(self):
+        """ให้การค้นหาครั้งถัดไปตรวจ version ทันที (หลังแก้แหล่งข้อมูลใน process นี้)"""
+        with self._lock:
+            self._next_check = 0.0
+
+    def reload(self):
+        """โหลดดัชนีใหม่ทั้งหมดจากแหล่งข้อมูล"""
+        with self._lock:
+            version = self._version_fn() if self._version_fn else _UNSET
+            self.load(self._loader(), version)
+
+    def _maybe_reload(self):
+        if time.monotonic() < self._next_check:
+            return
+        with self._lock:
+            if time.monotonic() < self._next_check:
+                return
+            try:
+                if self._version_fn is None:
+                    self.reload()
+                    return
+                version = self._version_fn()
+                if version != self._version:
+                    self.load(self._loader(), version)
+                else:
+                    self._next_check = time.monotonic() + self.check_interval
+            except Exception as e:
+                # ใช้ดัชนีเดิมต่อไปถ้าโหลดใหม่ไม่สำเร็จ
+                print(f"เกิดข้อผิดพลาดในการโหลด webhook registry: {str(e)}")
+                self._next_check = time.monotonic() + self.check_interval
+
+    def get_by_path(self, url_path: str) -> Optional[Dict[str, Any]]:
+        """ค้นหา webhook จาก url_path"""
+        self._maybe_reload()
+        return self._by_path.get(url_path)
+
+    def get_by_id(self, webhook_id) -> Optional[Dict[str, Any]]:
+        """ค้นหา webhook จาก id"""
+        self._maybe_reload()
+        return self._by_id.get(str(webhook_id))
+
+    def all(self) -> List[Dict[str, Any]]:
+        """รายการ webhook ทั้งหมด"""
+        self._maybe_reload()
+        return list(self._by_id.values())
@@ -0,0 +1,115 @@
+import threading
+import traceback
+from typing import Dict, Any, Callable, Optional
+
+from .job_queue import JobQueue, RetryLater, LostClaim
+
+
+class WorkerPool:
+    """กลุ่ม worker thread ที่ดึงงานจาก JobQueue มาประมวลผล
+
+    handler รับ payload ของงาน ถ้า raise exception งานจะถูกลองใหม่ตามนโยบายของคิว
+    raise RetryLater เพื่อเลื่อนงานเดิมออกไปโดยไม่นับเป็นความล้มเหลว
+    on_dead ถูกเรียกเมื่องานล้มเหลวครบจำนวนครั้งแล้ว (เช่น บันทึก log ว่าล้มเหลว)
+    งานที่ทำนานเกิน visibility_timeout ของคิวจนถูกคืนเข้าคิวไปแล้ว ผลของ worker นี้จะถูกทิ้ง (นับเป็น lost)
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[Dict[str, Any]], Any],
+                 size: int = 4, poll_interval: float = 0.5,
+                 on_dead: Optional[Callable[[Dict[str, Any], str], Any]] = None,
+                 name: str = 'worker'):
+        self.queue = queue
+        self.handler = handler
+        self.size = size
+        self.poll_interval = poll_interval
+        self.on_dead = on_dead
+        self.name = name
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.deferred = 0
+        self.lost = 0
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._counter_lock = threading.Lock()
+
+    def start(self):
+        """เริ่ม worker threads"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.size):
+            thread = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        """หยุด worker threads (งานที่กำลังทำจะทำต่อจนเสร็จ)"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """ปลุก worker ทันทีเมื่อมีงานใหม่"""
+        self._wakeup.set()
+
+    def _count(self, attr: str):
+        with self._counter_lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                print(f"เกิดข้อผิดพลาดในการดึงงานจากคิว: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, payload, attempts, token = job
+            try:
+                self._process(job_id, payload, attempts, token)
+            except LostClaim as e:
+                self._count('lost')
+                print(f"งาน {job_id} เกิน visibility timeout ผลของ worker นี้ถูกทิ้ง: {str(e)}")
+
+    def _process(self, job_id: int, payload: Dict[str, Any], attempts: int, token: str):
+        try:
+            self.handler(payload)
+            self.queue.complete(job_id, token)
+            self._count('processed')
+        except LostClaim:
+            raise
+        except RetryLater as e:
+            self.queue.release(job_id, token, e.delay)
+            self._count('deferred')
+        except Exception as e:
+            error = f'{type(e).__name__}: {str(e)}'
+            if self.queue.fail(job_id, token, error):
+                self._count('retried')
+                return
+            self._count('failed')
+            print(f"งาน {job_id} ล้มเหลวครบ {attempts} ครั้ง: {error}")
+            if self.on_dead:
+                try:
+                    self.on_dead(payload, error)
+                except Exception:
+                    traceback.print_exc()
+
+    def stats(self) -> Dict[str, Any]:
+        """สถิติของคิวและ worker"""
+        return {
+            'workers': len(self._threads),
+            'processed': self.processed,
+            'retried': self.retried,
+            'deferred': self.deferred,
+            'lost': self.lost,
+            'failed': self.failed,
+            'queue': self.queue.stats()
+        }
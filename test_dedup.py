@@ -0,0 +1,114 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from storage import Deduplicator, event_key
+from storage.dedup import STATE_PENDING, STATE_DONE
+
+
+class TestEventKey(unittest.TestCase):
+    def test_idempotency_key_wins(self):
+        payload = {'events': [{'webhookEventId': 'E1'}], 'message': 'สวัสดี'}
+        self.assertEqual(event_key(payload, {'Idempotency-Key': 'abc'}), 'key:abc')
+
+    def test_line_event_ids(self):
+        payload = {'events': [{'webhookEventId': 'E2'}, {'webhookEventId': 'E1'}]}
+        self.assertEqual(event_key(payload), 'line:E1,E2')
+        self.assertEqual(event_key({'webhookEventId': 'E3'}), 'line:E3')
+
+    def test_partial_event_ids_fall_back_to_hash(self):
+        payload = {'events': [{'webhookEventId': 'E1'}, {'type': 'message'}]}
+        self.assertTrue(event_key(payload).startswith('sha256:'))
+
+    def test_payload_hash(self):
+        # ลำดับ key ไม่มีผล แต่เนื้อหาต่างกันได้ key ต่างกัน
+        self.assertEqual(event_key({'a': 1, 'b': 2}), event_key({'b': 2, 'a': 1}))
+        self.assertNotEqual(event_key({'a': 1}), event_key({'a': 2}))
+        self.assertIsNone(event_key({'a': 1}, hash_payload=False))
+        self.assertEqual(event_key({'webhookEventId': 'E1'}, hash_payload=False), 'line:E1')
+
+
+class TestDeduplicator(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='dedup-test-')
+        self.path = os.path.join(self.dir, 'dedup.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_replays_first_result(self):
+        dedup = Deduplicator(self.path)
+        self.assertIsNone(dedup.claim('key:a'))
+        dedup.complete('key:a', {'reply': 'ครั้งแรก'}, 201)
+
+        record = dedup.claim('key:a')
+        self.assertEqual(record, {'state': STATE_DONE, 'response': {'reply': 'ครั้งแรก'}, 'status_code': 201})
+        # process อื่น (instance ใหม่ ไม่มี cache) ได้ผลเดียวกันจาก SQLite
+        other = Deduplicator(self.path)
+        self.assertEqual(other.claim('key:a')['response'], {'reply': 'ครั้งแรก'})
+        self.assertEqual(dedup.stats()['new'], 1)
+        self.assertEqual(dedup.stats()['duplicates'], 1)
+
+    def test_duplicate_while_pending(self):
+        dedup = Deduplicator(self.path)
+        self.assertIsNone(dedup.claim('key:a'))
+        self.assertEqual(dedup.claim('key:a')['state'], STATE_PENDING)
+
+        # request ซ้ำรอผลของครั้งแรกได้
+        threading.Timer(0.1, lambda: dedup.complete('key:a', {'reply': 'เสร็จ'})).start()
+        record = dedup.claim('key:a', wait=2)
+        self.assertEqual(record['state'], STATE_DONE)
+        self.assertEqual(record['response'], {'reply': 'เสร็จ'})
+
+    def test_release_on_error_allows_retry(self):
+        dedup = Deduplicator(self.path)
+        self.assertIsNone(dedup.claim('key:a'))
+        dedup.release('key:a')
+        self.assertIsNone(dedup.claim('key:a'))
+
+    def test_waiter_takes_over_after_release(self):
+        dedup = Deduplicator(self.path)
+        self.assertIsNone(dedup.claim('key:a'))
+        threading.Timer(0.1, lambda: dedup.release('key:a')).start()
+        # ครั้งแรกล้มเหลว request ที่รออยู่ได้จองและประมวลผลเอง
+        self.assertIsNone(dedup.claim('key:a', wait=2))
+
+    def test_window_expiry(self):
+        dedup = Deduplicator(self.path, window=0.2, hash_window=0.1)
+        hash_key = event_key({'message': 'สวัสดี'})
+        for key in ('key:a', hash_key):
+            self.assertIsNone(dedup.claim(key))
+            dedup.complete(key, {'reply': key})
+
+        time.sleep(0.12)
+        # key จาก hash หมดอายุก่อน ข้อความเดิมที่ส่งมาใหม่จึงถูกประมวลผลอีกครั้ง
+        self.assertIsNone(dedup.claim(hash_key))
+        self.assertEqual(dedup.claim('key:a')['state'], STATE_DONE)
+
+        time.sleep(0.1)
+        self.assertIsNone(dedup.claim('key:a'))
+
+    def test_stale_pending_is_reclaimed(self):
+        dedup = Deduplicator(self.path, pending_timeout=0.1)
+        self.assertIsNone(dedup.claim('key:a'))
+        time.sleep(0.12)
+        # ครั้งแรกค้างจาก process ที่ตายไป
+        self.assertIsNone(Deduplicator(self.path, pending_timeout=0.1).claim('key:a'))
+
+    def test_cleanup_removes_expired_keys(self):
+        dedup = Deduplicator(self.path, window=0.2, hash_window=0.05)
+        hash_key = event_key({'message': 'สวัสดี'})
+        for key in ('key:a', hash_key):
+            dedup.claim(key)
+            dedup.complete(key, {})
+        time.sleep(0.06)
+        dedup.cleanup()
+        keys = [row[0] for row in dedup._connect().execute('SELECT key FROM recent_events')]
+        self.assertEqual(keys, ['key:a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
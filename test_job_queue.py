@@ -0,0 +1,197 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from storage import JobQueue, QueueFull, RetryLater, LostClaim, WorkerPool
+from storage.job_queue import STATUS_PENDING, STATUS_DEAD
+
+
+class QueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='job-queue-test-')
+        self.path = os.path.join(self.dir, 'queue.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def make_queue(self, **kwargs) -> JobQueue:
+        options = {'backoff_base': 0.01, 'backoff_max': 0.05}
+        options.update(kwargs)
+        return JobQueue(self.path, **options)
+
+    def job_row(self, queue: JobQueue, job_id: int):
+        return queue._connect().execute(
+            'SELECT status, attempts, available_at, last_error FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+
+
+class TestJobQueue(QueueTestCase):
+    def test_put_claim_complete(self):
+        queue = self.make_queue()
+        first = queue.put({'n': 1})
+        queue.put({'n': 2})
+        self.assertEqual(queue.depth(), 2)
+
+        job_id, payload, attempts, token = queue.claim()
+        self.assertEqual((job_id, payload, attempts), (first, {'n': 1}, 1))
+        queue.complete(job_id, token)
+        self.assertEqual(queue.stats()['depth'], 1)
+
+        job_id, payload, _, token = queue.claim()
+        self.assertEqual(payload, {'n': 2})
+        queue.complete(job_id, token)
+        self.assertIsNone(queue.claim())
+        self.assertEqual(queue.depth(), 0)
+
+    def test_delayed_job_is_not_claimed_early(self):
+        queue = self.make_queue()
+        queue.put({'n': 1}, delay=0.2)
+        self.assertIsNone(queue.claim())
+        time.sleep(0.25)
+        self.assertIsNotNone(queue.claim())
+
+    def test_fail_retries_with_backoff(self):
+        queue = self.make_queue(max_attempts=3, backoff_base=0.2, backoff_max=1.0)
+        job_id = queue.put({'n': 1})
+        _, _, _, token = queue.claim()
+
+        before = time.time()
+        self.assertTrue(queue.fail(job_id, token, 'ล้มเหลว'))
+        status, attempts, available_at, last_error = self.job_row(queue, job_id)
+        self.assertEqual((status, attempts, last_error), (STATUS_PENDING, 1, 'ล้มเหลว'))
+        # ครั้งแรกรอ backoff_base * (0.5 ถึง 1.0)
+        self.assertGreaterEqual(available_at - before, 0.1)
+        self.assertLessEqual(available_at - before, 0.25)
+        self.assertIsNone(queue.claim())
+
+    def test_dead_after_max_attempts(self):
+        queue = self.make_queue(max_attempts=2)
+        job_id = queue.put({'n': 1})
+        for attempt in range(2):
+            time.sleep(0.06)
+            claimed_id, _, attempts, token = queue.claim()
+            self.assertEqual((claimed_id, attempts), (job_id, attempt + 1))
+            retried = queue.fail(job_id, token, 'ล้มเหลว')
+        self.assertFalse(retried)
+        self.assertEqual(self.job_row(queue, job_id)[0], STATUS_DEAD)
+        time.sleep(0.06)
+        self.assertIsNone(queue.claim())
+        self.assertEqual(queue.stats()[STATUS_DEAD], 1)
+
+    def test_release_does_not_count_attempt(self):
+        queue = self.make_queue()
+        job_id = queue.put({'n': 1})
+        _, _, _, token = queue.claim()
+        queue.release(job_id, token)
+        _, _, attempts, _ = queue.claim()
+        self.assertEqual(attempts, 1)
+
+    def test_reclaim_after_visibility_timeout(self):
+        queue = self.make_queue(visibility_timeout=0.1)
+        job_id = queue.put({'n': 1})
+        _, _, _, stale_token = queue.claim()
+        self.assertIsNone(queue.claim())
+
+        # worker แรกหายไป งานกลับมาให้ worker อื่นหลัง visibility_timeout
+        time.sleep(0.15)
+        claimed_id, _, attempts, token = queue.claim()
+        self.assertEqual((claimed_id, attempts), (job_id, 2))
+        self.assertNotEqual(token, stale_token)
+
+        # worker แรกที่กลับมาทีหลังแก้งานที่ถูกรับไปแล้วไม่ได้
+        with self.assertRaises(LostClaim):
+            queue.complete(job_id, stale_token)
+        with self.assertRaises(LostClaim):
+            queue.fail(job_id, stale_token, 'ล้มเหลว')
+        with self.assertRaises(LostClaim):
+            queue.release(job_id, stale_token)
+        queue.complete(job_id, token)
+        self.assertEqual(queue.depth(), 0)
+
+    def test_reclaim_marks_exhausted_job_dead(self):
+        queue = self.make_queue(max_attempts=1, visibility_timeout=0.1)
+        job_id = queue.put({'n': 1})
+        queue.claim()
+        time.sleep(0.15)
+        self.assertIsNone(queue.claim())
+        self.assertEqual(self.job_row(queue, job_id)[0], STATUS_DEAD)
+
+    def test_queue_full(self):
+        queue = self.make_queue(max_depth=2)
+        queue.put({'n': 1})
+        queue.put({'n': 2})
+        with self.assertRaises(QueueFull):
+            queue.put({'n': 3})
+        # งานที่เสร็จแล้วไม่นับ เพิ่มงานได้อีก
+        job_id, _, _, token = queue.claim()
+        queue.complete(job_id, token)
+        queue.put({'n': 3})
+        self.assertEqual(queue.depth(), 2)
+
+
+class TestWorkerPool(QueueTestCase):
+    def run_pool(self, pool: WorkerPool, done, timeout: float = 5.0):
+        pool.start()
+        try:
+            deadline = time.monotonic() + timeout
+            while not done() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            pool.stop()
+
+    def test_processes_all_jobs(self):
+        queue = self.make_queue()
+        seen = []
+        lock = threading.Lock()
+
+        def handler(payload):
+            with lock:
+                seen.append(payload['n'])
+
+        for n in range(20):
+            queue.put({'n': n})
+        pool = WorkerPool(queue, handler, size=4, poll_interval=0.01)
+        self.run_pool(pool, lambda: pool.processed == 20)
+
+        self.assertEqual(sorted(seen), list(range(20)))
+        self.assertEqual(queue.depth(), 0)
+
+    def test_retries_then_calls_on_dead(self):
+        queue = self.make_queue(max_attempts=3)
+        dead = []
+
+        def handler(payload):
+            raise ValueError('ใช้ไม่ได้')
+
+        queue.put({'n': 1})
+        pool = WorkerPool(queue, handler, size=1, poll_interval=0.01,
+                          on_dead=lambda payload, error: dead.append((payload, error)))
+        self.run_pool(pool, lambda: dead)
+
+        self.assertEqual(dead, [({'n': 1}, 'ValueError: ใช้ไม่ได้')])
+        self.assertEqual((pool.retried, pool.failed), (2, 1))
+        self.assertEqual(queue.stats()[STATUS_DEAD], 1)
+
+    def test_retry_later_defers_without_failing(self):
+        queue = self.make_queue(max_attempts=1)
+        calls = []
+
+        def handler(payload):
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryLater('เกินขีดจำกัด', delay=0.1)
+
+        queue.put({'n': 1})
+        pool = WorkerPool(queue, handler, size=1, poll_interval=0.01)
+        self.run_pool(pool, lambda: pool.processed == 1)
+
+        # max_attempts=1 แต่ยังทำสำเร็จในครั้งที่สอง เพราะการเลื่อนไม่นับเป็นการลอง
+        self.assertEqual((pool.deferred, pool.processed, pool.failed), (1, 1, 0))
+        self.assertGreaterEqual(calls[1] - calls[0], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
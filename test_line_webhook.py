@@ -0,0 +1,111 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+
+# ตั้งค่าก่อน import แอป (Config อ่านค่าจาก environment ตอน import) ให้ข้อมูลทั้งหมดอยู่ในโฟลเดอร์ชั่วคราว
+TEMP_DIR = tempfile.mkdtemp(prefix='line-webhook-test-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(TEMP_DIR, 'api.db')}",
+    'AGENT_REGISTRY_ENABLED': 'false',
+    'STARTUP_TIMING_REPORT': 'false',
+    'LINE_CHANNEL_SECRET': 'test-secret',
+    'LINE_CHANNEL_ACCESS_TOKEN': 'test-token',
+    'WEBHOOK_DEDUP_PATH': os.path.join(TEMP_DIR, 'dedup.db'),
+    'RATE_LIMIT_PATH': os.path.join(TEMP_DIR, 'rate_limit.db'),
+    'WEBHOOK_QUEUE_PATH': os.path.join(TEMP_DIR, 'queue.db'),
+    'CONVERSATION_STORE_PATH': os.path.join(TEMP_DIR, 'conversations.db'),
+    'WEBHOOK_LOG_DIR': os.path.join(TEMP_DIR, 'webhook_logs')
+})
+
+from benchmarks.common import install_fake_llm
+
+# การเรียก LLM แต่ละครั้งใช้ 0.2 วินาที (ต่อ event มีการเลือก agent และการตอบ)
+LLM_LATENCY = 0.2
+install_fake_llm(latency=LLM_LATENCY, agent_ids=['support'])
+
+from ai import SubAgent
+from ai.fake_line import FakeLineServer, make_delivery
+from ai.line_client import sign, verify_signature
+from api import webhook_routes
+from app import create_app
+
+
+class TestLineWebhook(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.line = FakeLineServer().start()
+        os.environ['LINE_API_BASE'] = cls.line.url
+        cls.app = create_app()
+        cls.app.config['TESTING'] = True
+        webhook_routes.get_ai_manager().register_sub_agent('support', SubAgent('support', 'Support'))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.line.stop()
+
+    def setUp(self):
+        self.client = self.app.test_client()
+        self.line.replies.clear()
+
+    def post(self, body, signature):
+        return self.client.post(
+            '/api/line/webhook',
+            data=body,
+            headers={'X-Line-Signature': signature, 'Content-Type': 'application/json'}
+        )
+
+    def test_verify_signature(self):
+        body = b'{"events": []}'
+        self.assertTrue(verify_signature(body, sign(body, 'test-secret'), 'test-secret'))
+        self.assertFalse(verify_signature(body, sign(body, 'other-secret'), 'test-secret'))
+        self.assertFalse(verify_signature(body + b' ', sign(body, 'test-secret'), 'test-secret'))
+        self.assertFalse(verify_signature(body, None, 'test-secret'))
+
+    def test_rejects_invalid_signature(self):
+        body, _ = make_delivery(['สวัสดี'], 'test-secret')
+        response = self.post(body, sign(body, 'wrong-secret'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.line.replies, [])
+
+    def test_accepts_valid_signature_and_replies(self):
+        body, signature = make_delivery(['สวัสดี'], 'test-secret', user_id='Uvalid')
+        response = self.post(body, signature)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['replied'], 1)
+        self.assertEqual(len(self.line.replies), 1)
+        token = json.loads(body)['events'][0]['replyToken']
+        self.assertEqual(self.line.replies[0]['replyToken'], token)
+
+    def test_dispatches_events_concurrently(self):
+        # event ของผู้ใช้คนละคนทำพร้อมกัน เวลารวมจึงใกล้กับการตอบ event เดียว
+        body, _ = make_delivery([f'คำถามที่ {i}' for i in range(8)], 'test-secret')
+        payload = json.loads(body)
+        for i, event in enumerate(payload['events']):
+            event['source']['userId'] = f'Uconcurrent{i}'
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+        start = time.monotonic()
+        response = self.post(body, sign(body, 'test-secret'))
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['replied'], 8)
+        self.assertEqual(len(self.line.replies), 8)
+        # ถ้าทำทีละ event จะใช้อย่างน้อย 8 * 2 * LLM_LATENCY
+        self.assertLess(elapsed, 8 * 2 * LLM_LATENCY / 2)
+
+    def test_redelivery_is_not_processed_twice(self):
+        body, signature = make_delivery(['ส่งซ้ำ'], 'test-secret', user_id='Uredelivery')
+        first = self.post(body, signature)
+        self.assertEqual(first.json['replied'], 1)
+
+        redelivered = self.post(body, signature)
+        self.assertEqual(redelivered.status_code, 200)
+        self.assertEqual(redelivered.json['events'], 0)
+        self.assertEqual(len(self.line.replies), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from storage import LogStore
+from storage.log_store import SEGMENT_SUFFIX
+
+
+def record(i: int, created_at: str = None) -> dict:
+    return {'webhook_id': 'hook', 'status_code': 200 if i % 2 else 500,
+            'created_at': created_at or f'2024-01-01T00:{i // 60:02d}:{i % 60:02d}'}
+
+
+class TestLogStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='log-store-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def segments(self, log_id: str):
+        return sorted(name for name in os.listdir(os.path.join(self.dir, log_id)) if name.endswith(SEGMENT_SUFFIX))
+
+    def test_append_and_read(self):
+        store = LogStore(self.dir, fsync='never')
+        seqs = [store.append('hook', record(i)) for i in range(5)]
+        self.assertEqual(seqs, list(range(5)))
+        self.assertEqual(store.count('hook'), 5)
+        self.assertEqual([r['seq'] for r in store.read('hook', offset=2, limit=2)], [2, 3])
+        self.assertEqual(store.read('missing'), [])
+
+    def test_segment_rotation(self):
+        store = LogStore(self.dir, segment_max_bytes=500, fsync='never', index_interval=7)
+        for i in range(60):
+            store.append('hook', record(i))
+        # record ละประมาณ 100 byte จึงต้องมีหลาย segment
+        self.assertGreater(len(self.segments('hook')), 5)
+        self.assertEqual(store.count('hook'), 60)
+        self.assertEqual([r['seq'] for r in store.iter_records('hook')], list(range(60)))
+        # อ่านจากกลาง segment ผ่าน index
+        self.assertEqual([r['seq'] for r in store.read('hook', offset=33, limit=4)], [33, 34, 35, 36])
+        # process ใหม่ (instance ใหม่) อ่านต่อและเขียนต่อได้
+        reopened = LogStore(self.dir, segment_max_bytes=500, fsync='never', index_interval=7)
+        self.assertEqual(reopened.append('hook', record(60)), 60)
+        self.assertEqual(reopened.count('hook'), 61)
+
+    def test_scan_reverse_pages_newest_first(self):
+        store = LogStore(self.dir, segment_max_bytes=800, fsync='never', index_interval=5)
+        for i in range(50):
+            store.append('hook', record(i))
+
+        # แบ่งหน้าด้วย cursor (seq ของ record สุดท้ายในหน้าก่อน)
+        pages, cursor = [], None
+        while True:
+            page = []
+            for item in store.scan_reverse('hook', before=cursor):
+                page.append(item['seq'])
+                if len(page) == 12:
+                    break
+            if not page:
+                break
+            pages.append(page)
+            cursor = page[-1]
+        self.assertEqual([seq for page in pages for seq in page], list(range(49, -1, -1)))
+        self.assertEqual(pages[0][:3], [49, 48, 47])
+
+    def test_scan_reverse_time_range_and_predicate(self):
+        store = LogStore(self.dir, fsync='never', index_interval=4)
+        for i in range(40):
+            store.append('hook', record(i))
+
+        since, until = record(10)['created_at'], record(25)['created_at']
+        seqs = [r['seq'] for r in store.scan_reverse('hook', since=since, until=until)]
+        self.assertEqual(seqs, list(range(25, 9, -1)))
+
+        # cursor ร่วมกับช่วงเวลาและตัวกรอง
+        errors = [r['seq'] for r in store.scan_reverse(
+            'hook', before=20, since=since, until=until, predicate=lambda r: r['status_code'] == 500
+        )]
+        self.assertEqual(errors, [18, 16, 14, 12, 10])
+
+        # scan (เก่าไปใหม่) ได้ชุดเดียวกันกลับลำดับ
+        forward = [r['seq'] for r in store.scan('hook', since=since, until=until)]
+        self.assertEqual(forward, list(range(10, 26)))
+
+    def test_migrate_legacy(self):
+        legacy_path = os.path.join(self.dir, 'legacy.json')
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump([record(i) for i in range(3)], f)
+
+        store = LogStore(os.path.join(self.dir, 'logs'), fsync='never')
+        self.assertEqual(store.migrate_legacy('hook', legacy_path), 3)
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertTrue(os.path.exists(legacy_path + '.migrated'))
+        self.assertEqual([r['seq'] for r in store.read('hook')], [0, 1, 2])
+
+        # ย้ายครั้งเดียว เรียกซ้ำ (รวมถึงจาก instance ใหม่) ไม่เพิ่ม record
+        self.assertEqual(store.migrate_legacy('hook', legacy_path), 0)
+        other = LogStore(os.path.join(self.dir, 'logs'), fsync='never')
+        self.assertEqual(other.migrate_legacy('hook', legacy_path), 0)
+        self.assertEqual(other.count('hook'), 3)
+
+    def test_concurrent_appends_do_not_lose_records(self):
+        # สอง instance จำลองสอง process ที่เขียน log เดียวกันพร้อมกันหลาย thread
+        stores = [LogStore(self.dir, segment_max_bytes=4000, fsync='never', index_interval=10) for _ in range(2)]
+        per_thread = 50
+
+        def writer(store, name):
+            for i in range(per_thread):
+                store.append('hook', {'writer': name, 'i': i, 'created_at': '2024-01-01T00:00:00'})
+
+        threads = [threading.Thread(target=writer, args=(stores[n % 2], n)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        records = list(LogStore(self.dir).iter_records('hook'))
+        self.assertEqual(len(records), 6 * per_thread)
+        self.assertEqual([r['seq'] for r in records], list(range(6 * per_thread)))
+        self.assertEqual(len({(r['writer'], r['i']) for r in records}), 6 * per_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+# ตั้งค่าก่อน import แอป (Config อ่านค่าจาก environment ตอน import) ให้ข้อมูลทั้งหมดอยู่ในโฟลเดอร์ชั่วคราว
+# ใช้ setdefault เพราะ test ของแอปหลายไฟล์ที่รันใน process เดียวกันใช้ Config ชุดเดียวกัน
+TEMP_DIR = tempfile.mkdtemp(prefix='rate-limit-test-')
+for name, value in {
+    'DATABASE_URL': f"sqlite:///{os.path.join(TEMP_DIR, 'api.db')}",
+    'AGENT_REGISTRY_ENABLED': 'false',
+    'STARTUP_TIMING_REPORT': 'false',
+    'WEBHOOK_DEDUP_PATH': os.path.join(TEMP_DIR, 'dedup.db'),
+    'RATE_LIMIT_PATH': os.path.join(TEMP_DIR, 'rate_limit.db'),
+    'WEBHOOK_QUEUE_PATH': os.path.join(TEMP_DIR, 'queue.db'),
+    'CONVERSATION_STORE_PATH': os.path.join(TEMP_DIR, 'conversations.db'),
+    'WEBHOOK_LOG_DIR': os.path.join(TEMP_DIR, 'webhook_logs')
+}.items():
+    os.environ.setdefault(name, value)
+
+from storage import RateLimiter, RateLimited
+from storage.rate_limit import default_burst
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='rate-limiter-test-')
+        self.path = os.path.join(self.dir, 'rate_limit.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_burst_then_limited(self):
+        limiter = RateLimiter(self.path)
+        for _ in range(3):
+            self.assertEqual(limiter.acquire('hook', 60, burst=3), (True, 0.0))
+        allowed, wait = limiter.acquire('hook', 60, burst=3)
+        self.assertFalse(allowed)
+        # 60 ครั้งต่อนาที = เติม 1 token ต่อวินาที
+        self.assertAlmostEqual(wait, 1.0, delta=0.05)
+        # key อื่นมี bucket ของตัวเอง
+        self.assertTrue(limiter.acquire('other', 60, burst=3)[0])
+        self.assertEqual(limiter.stats()['limited'], 1)
+
+    def test_refill(self):
+        limiter = RateLimiter(self.path)
+        # 600 ครั้งต่อนาที = เติม 1 token ทุก 0.1 วินาที
+        self.assertTrue(limiter.acquire('hook', 600, burst=1)[0])
+        self.assertFalse(limiter.acquire('hook', 600, burst=1)[0])
+        time.sleep(0.12)
+        self.assertTrue(limiter.acquire('hook', 600, burst=1)[0])
+
+    def test_shared_between_instances(self):
+        # สอง instance จำลองสอง worker process ที่ใช้ไฟล์เดียวกัน
+        first, second = RateLimiter(self.path), RateLimiter(self.path)
+        self.assertTrue(first.acquire('hook', 60, burst=1)[0])
+        self.assertFalse(second.acquire('hook', 60, burst=1)[0])
+
+    def test_unlimited(self):
+        limiter = RateLimiter(self.path)
+        for _ in range(100):
+            self.assertEqual(limiter.acquire('hook', 0), (True, 0.0))
+        self.assertEqual(default_burst(60), 10)
+        self.assertEqual(default_burst(1), 1)
+
+    def test_acquire_with_max_delay_defers(self):
+        limiter = RateLimiter(self.path)
+        self.assertEqual(limiter.acquire('hook', 60, burst=1, max_delay=5), (True, 0.0))
+        # ยืม token ล่วงหน้า: งานถัดไปต้องเลื่อนไปประมาณ 1 และ 2 วินาที
+        allowed, wait = limiter.acquire('hook', 60, burst=1, max_delay=5)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(wait, 1.0, delta=0.05)
+        allowed, wait = limiter.acquire('hook', 60, burst=1, max_delay=5)
+        self.assertTrue(allowed)
+        self.assertAlmostEqual(wait, 2.0, delta=0.05)
+        # เกิน max_delay ไม่ได้ และไม่ยืม token เพิ่ม
+        allowed, wait = limiter.acquire('hook', 60, burst=1, max_delay=2.5)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 3.0, delta=0.05)
+        self.assertEqual(limiter.stats()['deferred'], 2)
+
+    def test_check_raises(self):
+        limiter = RateLimiter(self.path)
+        limiter.check('hook', 60, burst=1)
+        with self.assertRaises(RateLimited) as raised:
+            limiter.check('hook', 60, burst=1)
+        self.assertEqual(raised.exception.scope, 'hook')
+        self.assertGreater(raised.exception.retry_after, 0)
+
+    def test_in_flight_cap(self):
+        limiter = RateLimiter(self.path, max_in_flight=2)
+        first, second = limiter.enter(), limiter.enter()
+        self.assertTrue(first and second)
+        self.assertIsNone(limiter.enter())
+        self.assertEqual(limiter.in_flight_count(), 2)
+        with self.assertRaises(RateLimited):
+            with limiter.in_flight():
+                pass
+
+        limiter.leave(first)
+        with limiter.in_flight():
+            self.assertEqual(limiter.in_flight_count(), 2)
+        self.assertEqual(limiter.in_flight_count(), 1)
+
+    def test_in_flight_lease_expires(self):
+        # lease ของ process ที่ตายไปโดยไม่คืนช่อง หมดอายุเองหลัง lease_timeout
+        limiter = RateLimiter(self.path, max_in_flight=1, lease_timeout=0.1)
+        self.assertTrue(limiter.enter())
+        self.assertIsNone(limiter.enter())
+        time.sleep(0.12)
+        self.assertTrue(limiter.enter())
+
+    def test_no_in_flight_cap(self):
+        limiter = RateLimiter(self.path)
+        self.assertEqual(limiter.enter(), '')
+        limiter.leave('')
+
+
+class TestWebhookRateLimit(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from benchmarks.common import install_fake_llm
+        install_fake_llm(latency=0.0, agent_ids=['support'])
+        from app import create_app
+        from extensions import db
+        from models import Webhook
+        from api import webhook_routes
+
+        cls.app = create_app()
+        cls.app.config['TESTING'] = True
+        with cls.app.app_context():
+            db.create_all()
+            webhook = Webhook(url_path='rate-limited', secret_key='secret', is_active=True,
+                              rate_limit_per_minute=1, rate_limit_burst=1)
+            db.session.add(webhook)
+            db.session.commit()
+            cls.webhook_id = webhook.id
+        webhook_routes.webhook_registry.invalidate()
+        cls.limiter = webhook_routes.rate_limiter
+
+    def test_returns_429_with_retry_after(self):
+        self.assertIsNotNone(self.limiter)
+        # ใช้ token เดียวของ bucket ไปก่อน request จึงเกินขีดจำกัดทันทีโดยไม่ต้องเรียก LLM
+        self.assertTrue(self.limiter.acquire(f'webhook:{self.webhook_id}', 1, 1)[0])
+
+        response = self.app.test_client().post(
+            '/api/webhook/rate-limited',
+            json={'message': 'สวัสดี'},
+            headers={'X-Webhook-Secret': 'secret'}
+        )
+        self.assertEqual(response.status_code, 429)
+        # 1 ครั้งต่อนาที: ต้องรอประมาณ 60 วินาที
+        retry_after = int(response.headers['Retry-After'])
+        self.assertGreaterEqual(retry_after, 55)
+        self.assertLessEqual(retry_after, 60)
+        self.assertEqual(response.json['retry_after'], retry_after)
+
+        # request ที่ถูกปฏิเสธไม่ถูกจำว่าเคยได้รับแล้ว ส่งซ้ำภายหลังต้องถูกตรวจขีดจำกัดอีกครั้ง
+        again = self.app.test_client().post(
+            '/api/webhook/rate-limited',
+            json={'message': 'สวัสดี'},
+            headers={'X-Webhook-Secret': 'secret'}
+        )
+        self.assertEqual(again.status_code, 429)
+        self.assertNotIn('Idempotent-Replayed', again.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import time
+import unittest
+
+from ai import resilience
+from ai.fake_llm import FakeLLM
+from ai.resilience import (
+    ResiliencePolicy, CircuitBreaker, LLMUnavailable, CircuitOpen, DeadlineExceeded,
+    STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+)
+
+
+def failing(error):
+    def fn():
+        raise error
+    return fn
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_threshold_and_probes_once(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, STATE_OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        # half-open ให้ผ่านทีละ 1 request
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, STATE_CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, STATE_OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_release_returns_probe(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertTrue(breaker.allow())
+
+
+class TestResiliencePolicy(unittest.TestCase):
+    def test_retries_retryable_errors(self):
+        llm = FakeLLM(latency=0.0, error_rate=0.5)
+        policy = ResiliencePolicy(max_retries=10, backoff_base=0.001, failure_threshold=0)
+        for i in range(20):
+            self.assertTrue(policy.call(lambda: llm(f'คำถาม {i}')))
+        # error_rate 0.5 ต้องมีการลองใหม่บ้าง
+        self.assertGreater(llm.calls, 20)
+
+    def test_gives_up_after_max_retries(self):
+        llm = FakeLLM(latency=0.0, down=True)
+        policy = ResiliencePolicy(max_retries=2, backoff_base=0.001, failure_threshold=0)
+        with self.assertRaises(LLMUnavailable):
+            policy.call(lambda: llm('คำถาม'))
+        self.assertEqual(llm.calls, 3)
+
+    def test_does_not_retry_non_retryable_errors(self):
+        calls = []
+
+        def invalid_request():
+            calls.append(1)
+            raise ValueError('prompt ยาวเกิน')
+
+        policy = ResiliencePolicy(max_retries=3, backoff_base=0.001)
+        with self.assertRaises(ValueError):
+            policy.call(invalid_request)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.breaker('default').failures, 0)
+
+    def test_breaker_trips_and_short_circuits(self):
+        llm = FakeLLM(latency=0.0, down=True)
+        policy = ResiliencePolicy(max_retries=0, failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailable):
+                policy.call(lambda: llm('คำถาม'), key='fake')
+        with self.assertRaises(CircuitOpen):
+            policy.call(lambda: llm('คำถาม'), key='fake')
+        self.assertEqual(llm.calls, 2)
+
+    def test_non_retryable_error_on_half_open_probe_closes_breaker(self):
+        policy = ResiliencePolicy(max_retries=0, failure_threshold=1, reset_timeout=0.05)
+        with self.assertRaises(LLMUnavailable):
+            policy.call(failing(ConnectionError('down')))
+        time.sleep(0.06)
+        with self.assertRaises(ValueError):
+            policy.call(failing(ValueError('bad request')))
+        # probe ต้องไม่ค้าง: upstream ตอบได้ (error ฝั่งผู้เรียก) จึงปิด breaker
+        self.assertEqual(policy.call(lambda: 'ok'), 'ok')
+        self.assertEqual(policy.breaker('default').state, STATE_CLOSED)
+
+    def test_deadline_on_half_open_probe_releases_breaker(self):
+        policy = ResiliencePolicy(max_retries=0, failure_threshold=1, reset_timeout=0.05)
+        with self.assertRaises(LLMUnavailable):
+            policy.call(failing(ConnectionError('down')))
+        time.sleep(0.06)
+        with resilience.deadline(0.001):
+            time.sleep(0.01)
+            with self.assertRaises(DeadlineExceeded):
+                policy.call(lambda: 'ok')
+        self.assertEqual(policy.call(lambda: 'ok'), 'ok')
+
+    def test_call_timeout(self):
+        llm = FakeLLM(latency=0.0, slow_rate=1.0, slow_latency=1.0)
+        policy = ResiliencePolicy(call_timeout=0.1, max_retries=0, failure_threshold=0)
+        start = time.monotonic()
+        with self.assertRaises(LLMUnavailable) as raised:
+            policy.call(lambda: llm('คำถาม'))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIsInstance(raised.exception.__cause__, TimeoutError)
+
+    def test_deadline_caps_timeout_and_retries(self):
+        llm = FakeLLM(latency=0.0, slow_rate=1.0, slow_latency=1.0)
+        policy = ResiliencePolicy(call_timeout=5, max_retries=5, failure_threshold=0)
+        start = time.monotonic()
+        with resilience.deadline(0.2):
+            with self.assertRaises(LLMUnavailable):
+                policy.call(lambda: llm('คำถาม'))
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_hedged_request_wins_over_slow_attempt(self):
+        slow_first = []
+
+        def fn():
+            # ครั้งแรกช้ามาก ครั้งที่ส่งซ้ำตอบทันที
+            if not slow_first:
+                slow_first.append(1)
+                time.sleep(1.0)
+                return 'slow'
+            return 'hedged'
+
+        policy = ResiliencePolicy(call_timeout=2, hedge=True, hedge_delay=0.05, failure_threshold=0)
+        start = time.monotonic()
+        self.assertEqual(policy.call(fn), 'hedged')
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_hedge_delay_follows_p95(self):
+        policy = ResiliencePolicy(hedge=True, hedge_min_delay=0.0)
+        self.assertIsNone(policy._hedge_after('fake'))
+        for i in range(100):
+            policy._record_latency('fake', i / 100.0)
+        self.assertAlmostEqual(policy._hedge_after('fake'), 0.94)
+
+
+if __name__ == '__main__':
+    unittest.main()